@@ -9,6 +9,7 @@ from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 import google.generativeai as genai
 from concurrent.futures import TimeoutError
+from log_writer import default_writer
 
 # Load environment variables
 load_dotenv()
@@ -77,9 +78,8 @@ def log_interaction(session_id, user_query, tool_name, tool_input, tool_output,
     }
     log_history.append(log_entry)
     
-    # Save log to file
-    with open(f"logs/{session_id}.json", "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    # Save log to file (written in the background, see log_writer.py)
+    default_writer().write(f"logs/{session_id}.json", log_entry)
     
     return log_entry
 
@@ -15,6 +15,9 @@ from memory import MemoryManager, MemoryItem
 from decision import generate_plan
 from action import execute_tool, format_final_answer
 from models import UserQuery, AgentResponse
+from prompt_budget import PREVIOUS_RESULT_TOKENS, truncate_tokens
+import llm_cache
+import structured
 import google.generativeai as genai
 
 def log(stage: str, msg: str):
@@ -162,7 +165,7 @@ class ResearchAssistantAgent:
                             
                             # Update query for next iteration
                             if has_useful_results:
-                                user_query = f"Original query: {original_query}\nPrevious tool result: {str(result.output)[:500]}\nWhat should I do next?"
+                                user_query = f"Original query: {original_query}\nPrevious tool result: {truncate_tokens(str(result.output), PREVIOUS_RESULT_TOKENS)}\nWhat should I do next?"
                             else:
                                 user_query = f"Original query: {original_query}\nPrevious tool {result.tool_name} returned empty results. Try a different approach or provide a final answer."
                             
@@ -324,6 +327,9 @@ The response should be useful and informative despite limited search results.
                 tool_used=None,
                 data={"error": str(e)}
             )
+        finally:
+            log("cache", llm_cache.summary())
+            log("parse", structured.summary())
 
 async def main():
     agent = ResearchAssistantAgent()
@@ -0,0 +1,78 @@
+"""MemoryManager.add throughput: one open/append/close per add vs the buffered JSONLWriter.
+
+Adds tool outputs for many sessions from several threads, as concurrent
+Gradio requests would, into a temporary logs directory. "add" is the time
+the callers spent in add(); "total" also waits for the buffered writer to
+reach the disk.
+
+    python bench_log_writer.py
+    python bench_log_writer.py --adds 50000 --sessions 500 --threads 16 --fsync
+"""
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log_writer import JSONLWriter
+from memory import MemoryItem, MemoryManager
+
+
+class AppendPerAddMemoryManager(MemoryManager):
+    """MemoryManager logging the way it used to: open, append one line, close"""
+
+    def _save_to_log(self, item: MemoryItem) -> None:
+        log_file = os.path.join(self.logs_directory, f"{item.session_id or 'unknown'}.json")
+        with open(log_file, "a") as f:
+            f.write(json.dumps(item.model_dump()) + "\n")
+
+
+def run(manager: MemoryManager, adds: int, sessions: int, threads: int) -> float:
+    items = [MemoryItem(text=f"Tool output {i}: " + "x" * 200, type="tool_output", tool_name="search",
+                        session_id=f"session-{i % sessions}") for i in range(adds)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(manager.add, items, chunksize=256))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--adds", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--fsync", action="store_true", help="fsync after every buffered flush")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # MemoryManager writes to ./logs
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                before = AppendPerAddMemoryManager()
+                results["append per add"] = (run(before, args.adds, args.sessions, args.threads),) * 2
+
+                writer = JSONLWriter(fsync=args.fsync)
+                after = MemoryManager(log_writer=writer)
+                after.logs_directory = "logs_buffered"
+                os.makedirs(after.logs_directory)
+                add_seconds = run(after, args.adds, args.sessions, args.threads)
+                started = time.perf_counter()
+                writer.close()
+                results["buffered writer"] = (add_seconds, add_seconds + time.perf_counter() - started)
+            lines = sum(1 for name in os.listdir("logs_buffered") for _ in open(os.path.join("logs_buffered", name)))
+        finally:
+            os.chdir(cwd)
+
+    print(f"\n{args.adds} adds, {args.sessions} sessions, {args.threads} threads{', fsync' if args.fsync else ''}")
+    print(f"{'':<18}{'add s':>8}{'total s':>9}{'adds/s':>10}")
+    for name, (add_seconds, total_seconds) in results.items():
+        print(f"{name:<18}{add_seconds:>8.2f}{total_seconds:>9.2f}{args.adds / total_seconds:>10.0f}")
+    print(f"Buffered writer: {lines} lines in {writer.flushes} flushes")
+
+
+if __name__ == "__main__":
+    main()
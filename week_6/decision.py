@@ -3,8 +3,13 @@ from typing import List, Dict, Optional, Any
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json
+import re
 from perception import PerceptionResult
 from memory import MemoryItem
+from models import PlanAction
+from llm_cache import cached_generate
+from structured import STRUCTURED_OUTPUT, generate_structured, record_parse
+from prompt_budget import PROMPT_TOKEN_BUDGET, estimate_tokens, fit_items
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -22,16 +27,26 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
 
+def has_action_line(response_text: str) -> bool:
+    """True if the reply has a TOOL_CALL or FINAL_ANSWER line generate_plan can return"""
+    return any(line.strip().startswith(("TOOL_CALL:", "FINAL_ANSWER:")) for line in response_text.split("\n"))
+
 def generate_plan(
     perception: PerceptionResult,
     memory_items: List[MemoryItem],
-    tool_descriptions: Optional[str] = None
+    tool_descriptions: Optional[str] = None,
+    use_cache: bool = True,
+    structured: bool = STRUCTURED_OUTPUT
 ) -> str:
-    """Generates a plan (tool call or final answer) using LLM based on the perception and memory"""
+    """Generates a plan (tool call or final answer) using LLM based on the perception and memory
+
+    structured=True asks for a PlanAction JSON object, validated against the
+    tool list with one repair call, instead of scanning the reply for a line.
+    """
     model = genai.GenerativeModel('gemini-2.0-flash')
     
     # Format memory items for context
-    memory_text = ""
+    memory_lines = []
     tool_results_found = False
     empty_results_found = False
     tools_used = set()
@@ -47,19 +62,17 @@ def generate_plan(
                 if item.tool_name == "citation_network_analyzer" and ("nodes': []" in item.text or "papers': []" in item.text):
                     empty_results_found = True
                     failed_tools.add(item.tool_name)
-                    memory_text += f"- Previous {item.tool_name} returned EMPTY RESULTS. Use a different tool.\n"
+                    memory_lines.append(f"- Previous {item.tool_name} returned EMPTY RESULTS. Use a different tool.")
                     continue
                     
                 # Check for paper IDs in results for potential follow-up tools
                 if item.tool_name == "paper_retrieval_tool" and "id" in item.text:
                     has_paper_ids = True
                 
-                memory_text += f"- Previous {item.tool_name} result: {item.text}\n"
+                memory_lines.append(f"- Previous {item.tool_name} result: {item.text}")
                 tool_results_found = True
             else:
-                memory_text += f"- {item.text}\n"
-    else:
-        memory_text = "None available"
+                memory_lines.append(f"- {item.text}")
         
     # Include tool descriptions if available
     tools_context = f"\nAvailable tools:\n{tool_descriptions}" if tool_descriptions else ""
@@ -86,7 +99,34 @@ def generate_plan(
         elif "domain" in perception.user_input.lower() or "connection" in perception.user_input.lower() or "relation" in perception.user_input.lower():
             extra_instructions += "\nThis query is about connecting domains. Consider using cross_domain_connector."
     
-    prompt = f"""
+    if structured:
+        response_format = """Respond with a JSON object:
+- type: "tool_call" if you need to use a tool, "final_answer" if you have the final answer
+- tool_name and arguments (an object with the tool's parameters) for a tool call
+- answer: your detailed answer, for a final answer
+
+Examples:
+- {"type": "tool_call", "tool_name": "paper_retrieval_tool", "arguments": {"keywords": ["quantum computing"], "authors": ["Feynman"]}}
+- {"type": "tool_call", "tool_name": "concept_extractor", "arguments": {"text": "quantum superposition refers to..."}}
+- {"type": "final_answer", "answer": "Based on the analysis, the relationship between domain X and domain Y is..."}"""
+    else:
+        response_format = """Respond in ONE of these formats:
+1. If you need to use a tool, reply with:
+   TOOL_CALL: tool_name|param1=value1|param2=value2|param3=value3
+
+2. If you have the final answer, reply with:
+   FINAL_ANSWER: your detailed answer here
+
+Your response should be exactly ONE of the above formats. No additional text or explanation.
+
+Examples:
+- TOOL_CALL: paper_retrieval_tool|keywords=["quantum computing"]|authors=["Feynman"]
+- TOOL_CALL: concept_extractor|text="quantum superposition refers to..."
+- FINAL_ANSWER: Based on the analysis, the relationship between domain X and domain Y is..."""
+
+    def render(memory_lines: List[str]) -> str:
+        memory_text = "".join(f"{line}\n" for line in memory_lines) or "None available"
+        return f"""
 You are a research assistant agent that uses specialized tools to answer questions. 
 Your job is to determine which tool to use next or provide a final answer.
 
@@ -102,33 +142,42 @@ Relevant context from memory:
 {memory_text}
 {extra_instructions}
 
-Respond in ONE of these formats:
-1. If you need to use a tool, reply with:
-   TOOL_CALL: tool_name|param1=value1|param2=value2|param3=value3
-
-2. If you have the final answer, reply with:
-   FINAL_ANSWER: your detailed answer here
-
-Your response should be exactly ONE of the above formats. No additional text or explanation.
-
-Examples:
-- TOOL_CALL: paper_retrieval_tool|keywords=["quantum computing"]|authors=["Feynman"]
-- TOOL_CALL: concept_extractor|text="quantum superposition refers to..."
-- FINAL_ANSWER: Based on the analysis, the relationship between domain X and domain Y is...
+{response_format}
 """
+
+    # Over the token budget, memories are cut down, the most recent kept longest
+    prompt = render(memory_lines)
+    if PROMPT_TOKEN_BUDGET and estimate_tokens(prompt) > PROMPT_TOKEN_BUDGET and memory_lines:
+        kept, cut = fit_items(memory_lines, PROMPT_TOKEN_BUDGET - estimate_tokens(render([])))
+        prompt = render(kept)
+        log("decision", f"Prompt ~{estimate_tokens(prompt)} tokens (budget {PROMPT_TOKEN_BUDGET}, "
+                        f"trimmed {cut} of {len(memory_lines)} memories)")
+    else:
+        log("decision", f"Prompt ~{estimate_tokens(prompt)} tokens")
     
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
+        if structured:
+            tool_names = re.findall(r"^- (\w+):", tool_descriptions or "", re.MULTILINE)
+            action = generate_structured("gemini-2.0-flash", prompt, "plan", PlanAction,
+                                         check=lambda a: a.check(tool_names), use_cache=use_cache)
+            log("decision", f"Generated plan: {action.model_dump_json(exclude_none=True)}")
+            return action.to_plan_line()
+
+        # Replies without a TOOL_CALL or FINAL_ANSWER line are not cached
+        response_text = cached_generate("gemini-2.0-flash", prompt, "plan",
+                                        lambda: model.generate_content(prompt).text.strip(),
+                                        use_cache=use_cache, accept=has_action_line)
         log("decision", f"Generated plan: {response_text}")
         
         # Return the first valid line that follows the expected format
         for line in response_text.split("\n"):
             line = line.strip()
             if line.startswith("TOOL_CALL:") or line.startswith("FINAL_ANSWER:"):
+                record_parse("plan", "valid")
                 return line
                 
         # If no valid format was found, assume the LLM is trying to give a final answer
+        record_parse("plan", "failed")
         return f"FINAL_ANSWER: {response_text}"
         
     except Exception as e:
@@ -147,6 +196,11 @@ def parse_tool_call(tool_call: str) -> tuple[str, Dict[str, Any]]:
         
     tool_name = tool_parts[0]
     params = {}
+
+    # Structured-output plans pass the arguments as one JSON object
+    payload = tool_call.replace("TOOL_CALL:", "").strip().partition("|")[2]
+    if payload.startswith("{"):
+        return tool_name.strip(), json.loads(payload)
     
     for part in tool_parts[1:]:
         if "=" in part:
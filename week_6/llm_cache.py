@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", Path(__file__).parent / "llm_cache.sqlite"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))  # seconds
+CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+
+def _jsonable(value):
+    # Response schemas are pydantic classes; key on their JSON schema
+    if hasattr(value, "model_json_schema"):
+        return value.model_json_schema()
+    return repr(value)
+
+
+def cache_key(model: str, prompt: str, config: Optional[dict] = None) -> str:
+    """sha256 of (model, prompt hash, generation config)"""
+    prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+    raw = json.dumps([model, prompt_hash, config], sort_keys=True, default=_jsonable)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LLMCache:
+    """LLM responses in SQLite, keyed by (model, prompt hash, generation config).
+
+    Entries expire after ttl seconds. When the stored responses exceed
+    max_bytes, the least recently used ones are deleted.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = CACHE_TTL, max_bytes: int = int(CACHE_MAX_MB * 2**20)):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = Counter()  # by call site
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode()), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        # Keep the most recently used responses that fit the budget
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept FROM responses) "
+            "WHERE kept > ?)",
+            (self.max_bytes,),
+        )
+
+    def get_or_generate(self, model: str, prompt: str, site: str, generate: Callable[[], str],
+                        config: Optional[dict] = None, accept: Optional[Callable[[str], bool]] = None) -> str:
+        """Cached response for this prompt, or generate() it and store the result.
+
+        A response accept() rejects is returned but never stored, and a stored
+        one it rejects is dropped, so one bad reply doesn't stick for the TTL.
+        """
+        key = cache_key(model, prompt, config)
+        cached = self.get(key)
+        if cached is not None and accept is not None and not accept(cached):
+            self.delete(key)
+            cached = None
+        if cached is not None:
+            self.hits[site] += 1
+            return cached
+        self.misses[site] += 1
+        response = generate()
+        if accept is None or accept(response):
+            self.put(key, model, response)
+        return response
+
+    def summary(self) -> str:
+        sites = sorted(set(self.hits) | set(self.misses))
+        if not sites:
+            return "LLM cache: no lookups"
+        parts = [f"{site} {self.hits[site]} hit / {self.misses[site]} miss" for site in sites]
+        total = sum(self.hits.values()) + sum(self.misses.values())
+        return f"LLM cache: {', '.join(parts)} ({sum(self.hits.values()) / total:.0%} hit rate)"
+
+
+CACHE = LLMCache() if CACHE_ENABLED else None
+
+
+def cached_generate(model: str, prompt: str, site: str, generate: Callable[[], str],
+                    config: Optional[dict] = None, use_cache: bool = True,
+                    accept: Optional[Callable[[str], bool]] = None) -> str:
+    """generate() through the shared cache unless caching is off globally or for this call.
+
+    Only responses accept() approves (all if it's None) are cached.
+    """
+    if not use_cache or CACHE is None:
+        return generate()
+    return CACHE.get_or_generate(model, prompt, site, generate, config, accept)
+
+
+def parses(parse: Callable[[str], Any]) -> Callable[[str], bool]:
+    """An accept callback: True if parse(response) doesn't raise"""
+    def accept(response: str) -> bool:
+        try:
+            parse(response)
+            return True
+        except Exception:
+            return False
+    return accept
+
+
+def summary() -> str:
+    return CACHE.summary() if CACHE is not None else "LLM cache: disabled"
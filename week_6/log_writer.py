@@ -0,0 +1,173 @@
+# Each week's folder runs on its own, so this module is copied into the ones that
+# use it; keep the copies identical.
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Flush policy: whichever comes first
+LOG_FLUSH_BYTES = int(os.getenv("LOG_FLUSH_BYTES", str(64 * 1024)))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))  # seconds
+LOG_FSYNC = os.getenv("LOG_FSYNC", "0") == "1"  # fsync after every flush, for logs that must survive a power cut
+# A log file over this size is renamed to .1 (and .1 to .2, ...); 0 never rotates
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "3"))  # rotated files kept; with 0 the file starts over
+MAX_OPEN_FILES = 64
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class JSONLWriter:
+    """Appends JSON lines to log files from one background thread.
+
+    write() only queues the record, so the caller never waits for JSON
+    encoding or the disk; the record must not be changed afterwards. The
+    writer thread batches lines per file, keeps the most recently used
+    files open, and flushes when flush_bytes are buffered or flush_interval
+    has passed since the oldest unwritten line.
+    """
+
+    def __init__(self, flush_bytes: int = LOG_FLUSH_BYTES, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 fsync: bool = LOG_FSYNC, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS,
+                 max_open: int = MAX_OPEN_FILES):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_open = max_open
+        self.lines_written = 0
+        self.flushes = 0
+        self._queue = queue.Queue()
+        self._files: "OrderedDict[str, Any]" = OrderedDict()  # path -> open file, least recently used first
+        self._sizes: Dict[str, int] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._pending_bytes = 0
+        self._closed = False
+        self._state_lock = threading.Lock()  # nothing is queued after the close marker
+        self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path: str, record: Dict[str, Any]) -> None:
+        """Queue one record to be appended to path as a JSON line; raises ValueError once closed"""
+        with self._state_lock:
+            if self._closed:
+                raise ValueError("JSONLWriter is closed")
+            self._queue.put((str(path), record))
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every record written so far has been handed to the OS (and fsynced if enabled).
+
+        Returns at once after close(), which already wrote everything out.
+        """
+        done = threading.Event()
+        with self._state_lock:
+            if self._closed:
+                return
+            self._queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Write out everything queued and close the files; safe to call twice"""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put((_CLOSE, None))
+        self._thread.join()
+
+    def _run(self) -> None:
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                path, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._drain()
+                deadline = None
+                continue
+            if path is _FLUSH:
+                self._drain()
+                deadline = None
+                item.set()
+            elif path is _CLOSE:
+                self._drain()
+                for f in self._files.values():
+                    f.close()
+                self._files.clear()
+                return
+            else:
+                try:
+                    line = json.dumps(item, default=str) + "\n"
+                except (TypeError, ValueError) as e:
+                    print(f"[log_writer] Dropped a record for {path}: {e}")
+                    continue
+                self._pending.setdefault(path, []).append(line)
+                self._pending_bytes += len(line)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if self._pending_bytes >= self.flush_bytes:
+                    self._drain()
+                    deadline = None
+
+    def _drain(self) -> None:
+        pending, self._pending, self._pending_bytes = self._pending, {}, 0
+        for path, lines in pending.items():
+            data = "".join(lines)
+            try:
+                f = self._open(path)
+                if self.max_bytes and self._sizes[path] and self._sizes[path] + len(data) > self.max_bytes:
+                    f = self._rotate(path)
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self._sizes[path] += len(data)
+                self.lines_written += len(lines)
+            except OSError as e:
+                print(f"[log_writer] Could not write {len(lines)} lines to {path}: {e}")
+        if pending:
+            self.flushes += 1
+
+    def _open(self, path: str):
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        if len(self._files) >= self.max_open:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        f = open(path, "a", encoding="utf-8")
+        self._files[path] = f
+        self._sizes[path] = f.tell()
+        return f
+
+    def _rotate(self, path: str):
+        self._files.pop(path).close()
+        if self.backups:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{path}.{i}"):
+                    os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+        return self._open(path)
+
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+
+def default_writer() -> JSONLWriter:
+    """The process-wide writer, flushed and closed at interpreter exit"""
+    global _default_writer
+    with _default_lock:
+        if _default_writer is None:
+            _default_writer = JSONLWriter()
+            atexit.register(_default_writer.close)
+        return _default_writer
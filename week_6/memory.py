@@ -1,9 +1,12 @@
 import os
-import json
-from typing import List, Dict, Optional, Any, Literal
+from collections import deque
+from itertools import islice
+from typing import Deque, List, Dict, Optional, Any, Literal, Tuple
 from datetime import datetime
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from log_writer import JSONLWriter, default_writer
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -14,67 +17,86 @@ except ImportError:
         now = datetime.now().strftime("%H:%M:%S")
         print(f"[{now}] [{stage}] {msg}")
 
+# Items kept in memory across all sessions; the oldest are forgotten first (their log files stay)
+MEMORY_RETENTION = int(os.getenv("MEMORY_RETENTION", "10000"))
+
 class MemoryItem(BaseModel):
     text: str
     type: Literal["user_query", "tool_output", "system_message", "agent_response"] = "user_query"
-    timestamp: str = datetime.now().isoformat()
+    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
     tool_name: Optional[str] = None
     user_query: Optional[str] = None
     tags: List[str] = []
     session_id: Optional[str] = None
 
 class MemoryManager:
-    def __init__(self):
-        self.memory: List[MemoryItem] = []
+    def __init__(self, retention: int = MEMORY_RETENTION, log_writer: Optional[JSONLWriter] = None):
+        # Append order is recency order, so every index below is newest-last
+        self.memory: Deque[MemoryItem] = deque()
+        self.by_session: Dict[Optional[str], Deque[MemoryItem]] = {}
+        self.by_type: Dict[str, Deque[MemoryItem]] = {}
+        self.by_session_type: Dict[Tuple[Optional[str], str], Deque[MemoryItem]] = {}
+        self.retention = retention
+        self.log_writer = log_writer or default_writer()
         self.logs_directory = "logs"
         os.makedirs(self.logs_directory, exist_ok=True)
         
     def add(self, item: MemoryItem) -> None:
         """Add an item to memory and save it to the log"""
         self.memory.append(item)
+        for index, key in self._indexes(item):
+            index.setdefault(key, deque()).append(item)
+        while len(self.memory) > self.retention:
+            self._forget_oldest()
         self._save_to_log(item)
         log("memory", f"Added {item.type}: {item.text[:50]}...")
+
+    def _indexes(self, item: MemoryItem) -> List[Tuple[dict, Any]]:
+        return [(self.by_session, item.session_id), (self.by_type, item.type),
+                (self.by_session_type, (item.session_id, item.type))]
+
+    def _forget_oldest(self) -> None:
+        # The oldest item overall is also the oldest in each of its indexes
+        item = self.memory.popleft()
+        for index, key in self._indexes(item):
+            items = index[key]
+            items.popleft()
+            if not items:
+                del index[key]
         
     def retrieve(self, 
                 query: str, 
                 top_k: int = 3, 
                 type_filter: Optional[str] = None,
                 session_filter: Optional[str] = None) -> List[MemoryItem]:
-        """Retrieve relevant memory items"""
-        
-        # Filter by type and session if needed
-        filtered_items = self.memory
-        
-        if type_filter:
-            filtered_items = [item for item in filtered_items if item.type == type_filter]
-            
-        if session_filter:
-            filtered_items = [item for item in filtered_items if item.session_id == session_filter]
+        """Retrieve the top_k most recent items matching the filters, newest first, in O(top_k)"""
         
         # Simple recency-based retrieval for now
         # In a real system, we would use embeddings for semantic similarity
-        sorted_items = sorted(filtered_items, 
-                             key=lambda x: x.timestamp, 
-                             reverse=True)
+        if type_filter and session_filter:
+            items = self.by_session_type.get((session_filter, type_filter), ())
+        elif session_filter:
+            items = self.by_session.get(session_filter, ())
+        elif type_filter:
+            items = self.by_type.get(type_filter, ())
+        else:
+            items = self.memory
         
-        return sorted_items[:top_k]
+        return list(islice(reversed(items), top_k))
     
     def _save_to_log(self, item: MemoryItem) -> None:
-        """Save memory item to log file"""
+        """Queue the memory item for its session's log file (written in the background, see log_writer.py)"""
         log_file = os.path.join(self.logs_directory, f"{item.session_id or 'unknown'}.json")
-        
-        with open(log_file, "a") as f:
-            f.write(json.dumps(item.model_dump()) + "\n")
+        self.log_writer.write(log_file, item.model_dump())
             
     def get_conversation_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Get the conversation history for a session"""
         history = []
         
-        for item in self.memory:
-            if item.session_id == session_id:
-                if item.type == "user_query":
-                    history.append({"role": "user", "content": item.text})
-                elif item.type == "agent_response":
-                    history.append({"role": "assistant", "content": item.text})
-                    
+        for item in self.by_session.get(session_id, ()):
+            if item.type == "user_query":
+                history.append({"role": "user", "content": item.text})
+            elif item.type == "agent_response":
+                history.append({"role": "assistant", "content": item.text})
+                
         return history 
\ No newline at end of file
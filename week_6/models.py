@@ -1,4 +1,5 @@
-from typing import List, Dict, Optional, Any
+import json
+from typing import List, Dict, Literal, Optional, Any
 from pydantic import BaseModel, Field, field_validator
 
 # Pydantic models for input validation
@@ -90,4 +91,33 @@ class UserQuery(BaseModel):
 class AgentResponse(BaseModel):
     response_text: str
     tool_used: Optional[str] = None
-    data: Optional[Dict[str, Any]] = None 
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = None 
+
+# Structured LLM replies (see structured.py)
+class PerceptionFields(BaseModel):
+    intent: Optional[str] = None
+    entities: List[str] = []
+    tool_hint: Optional[str] = None
+    reasoning_type: Optional[Literal["retrieval", "analysis", "comparison", "synthesis"]] = None
+
+class PlanAction(BaseModel):
+    type: Literal["tool_call", "final_answer"]
+    tool_name: Optional[str] = None
+    arguments: Dict[str, Any] = {}
+    answer: Optional[str] = None
+
+    def check(self, tool_names: Optional[List[str]] = None) -> None:
+        """Raise ValueError if the step can't be executed as given"""
+        if self.type == "final_answer":
+            if not self.answer:
+                raise ValueError("a final_answer needs a non-empty answer")
+        elif not self.tool_name:
+            raise ValueError("a tool_call needs tool_name")
+        elif tool_names and self.tool_name not in tool_names:
+            raise ValueError(f"unknown tool '{self.tool_name}', use one of: {', '.join(tool_names)}")
+
+    def to_plan_line(self) -> str:
+        """The TOOL_CALL / FINAL_ANSWER line the agent loop expects"""
+        if self.type == "final_answer":
+            return f"FINAL_ANSWER: {self.answer.strip()}"
+        return f"TOOL_CALL: {self.tool_name}|{json.dumps(self.arguments)}"
@@ -4,7 +4,9 @@ from dotenv import load_dotenv
 import google.generativeai as genai
 import re
 import json
-from models import UserQuery
+from models import UserQuery, PerceptionFields
+from llm_cache import cached_generate, parses
+from structured import STRUCTURED_OUTPUT, generate_structured, record_parse
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -35,8 +37,23 @@ class PerceptionResult:
         self.tool_hint = tool_hint
         self.reasoning_type = reasoning_type
 
-def extract_perception(user_input: str) -> PerceptionResult:
-    """Extracts intent, entities, tool hints, and reasoning type using LLM"""
+def parse_fields(response_text: str) -> dict:
+    """The JSON object of a perception reply, with a ```json fence stripped"""
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]
+    parsed = json.loads(response_text.strip())
+    if not isinstance(parsed, dict):
+        raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
+    return parsed
+
+def extract_perception(user_input: str, use_cache: bool = True, structured: bool = STRUCTURED_OUTPUT) -> PerceptionResult:
+    """Extracts intent, entities, tool hints, and reasoning type using LLM
+
+    structured=True validates the reply against PerceptionFields (one repair
+    call) instead of stripping fences and json.loads-ing it.
+    """
     model = genai.GenerativeModel('gemini-2.0-flash')
     
     prompt = f"""
@@ -54,18 +71,24 @@ Only output valid JSON without any additional text or explanation.
 """
 
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
+        if structured:
+            fields = generate_structured("gemini-2.0-flash", prompt, "perception", PerceptionFields,
+                                         use_cache=use_cache)
+            log("perception", f"LLM output: {fields.model_dump_json()}")
+            return PerceptionResult(user_input=user_input, **fields.model_dump())
+
+        # A reply that doesn't parse is not cached, so a retry asks the model again
+        response_text = cached_generate("gemini-2.0-flash", prompt, "perception",
+                                        lambda: model.generate_content(prompt).text.strip(),
+                                        use_cache=use_cache, accept=parses(parse_fields))
         log("perception", f"LLM output: {response_text}")
         
-        # Clean response to ensure valid JSON
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        parsed = json.loads(response_text)
+        try:
+            parsed = parse_fields(response_text)
+        except ValueError:
+            record_parse("perception", "failed")
+            raise
+        record_parse("perception", "valid")
         
         # Ensure entities is always a list
         if isinstance(parsed.get("entities"), dict):
@@ -0,0 +1,44 @@
+import math
+import os
+from typing import List, Tuple
+
+# Upper bound for a planning prompt, in estimated tokens; 0 disables trimming
+PROMPT_TOKEN_BUDGET = int(os.getenv("AGENT_PROMPT_TOKENS", "2000"))
+# Previous tool result carried into the next step's query (the old 500 characters)
+PREVIOUS_RESULT_TOKENS = int(os.getenv("AGENT_PREVIOUS_RESULT_TOKENS", "125"))
+CHARS_PER_TOKEN = 4  # Gemini's rule of thumb for English text
+MIN_ITEM_TOKENS = 16  # a memory cut shorter than this is dropped instead
+TRUNCATED = " …"
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count estimate, without a tokenizer round trip"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """text cut to about max_tokens, marked with an ellipsis if anything was removed"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - len(TRUNCATED))].rstrip() + TRUNCATED
+
+
+def fit_items(texts: List[str], max_tokens: int, min_tokens: int = MIN_ITEM_TOKENS) -> Tuple[List[str], int]:
+    """Fit texts, most relevant first, into max_tokens.
+
+    The least relevant are dropped until each remaining one can get
+    min_tokens. Short texts are then kept whole and the long ones share
+    what is left equally. Returns (kept texts, number truncated or dropped).
+    """
+    count = len(texts)
+    while count and max_tokens < count * min_tokens:
+        count -= 1
+    sizes = [estimate_tokens(text) for text in texts[:count]]
+    caps = [0] * count
+    remaining = max_tokens
+    for n, i in enumerate(sorted(range(count), key=sizes.__getitem__)):
+        caps[i] = min(sizes[i], remaining // (count - n))
+        remaining -= caps[i]
+    kept = [truncate_tokens(text, cap) for text, cap in zip(texts, caps)]
+    return kept, len(texts) - count + sum(cap < size for cap, size in zip(caps, sizes))
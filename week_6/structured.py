@@ -0,0 +1,100 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Callable, Optional, Type, TypeVar
+
+import google.generativeai as genai
+from pydantic import BaseModel, ValidationError
+
+from llm_cache import cached_generate, parses
+
+# Optional: import log from agent if shared, else define locally
+try:
+    from agent import log
+except ImportError:
+    import datetime
+    def log(stage: str, msg: str):
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] [{stage}] {msg}")
+
+# LLM replies validated against a pydantic schema instead of parsed from text
+STRUCTURED_OUTPUT = os.getenv("AGENT_STRUCTURED_OUTPUT", "0") == "1"
+
+# (call site, outcome) -> count; outcome is "valid", "repaired" or "failed"
+PARSE_STATS = Counter()
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class StructuredOutputError(ValueError):
+    """The response did not match its schema, even after the repair call"""
+
+
+def record_parse(site: str, outcome: str) -> None:
+    PARSE_STATS[(site, outcome)] += 1
+
+
+def validate_json(raw: str, schema: Type[T], check: Optional[Callable[[T], None]] = None) -> T:
+    """Parse and validate in one pydantic-core pass, then run check (which raises ValueError).
+
+    A ```json fence or text around the object is tolerated.
+    """
+    try:
+        result = schema.model_validate_json(raw)
+    except ValidationError:
+        match = JSON_OBJECT.search(raw)
+        if not match or match.group(0) == raw.strip():
+            raise
+        result = schema.model_validate_json(match.group(0))
+    if check is not None:
+        check(result)
+    return result
+
+
+def generate_structured(model_name: str, prompt: str, site: str, schema: Type[T],
+                        check: Optional[Callable[[T], None]] = None, use_cache: bool = True) -> T:
+    """Gemini reply in JSON mode, validated against schema, with one repair call if it doesn't validate.
+
+    The schema is given in the prompt; JSON mode guarantees the reply parses.
+    Raises StructuredOutputError if the repaired reply is still invalid.
+    Only replies that validate are cached, the repair reply included.
+    """
+    model = genai.GenerativeModel(model_name)
+    config = {"response_mime_type": "application/json"}
+    prompt = f"{prompt}\nReply with ONE JSON object matching this schema:\n{json.dumps(schema.model_json_schema())}\n"
+
+    def generate(text: str) -> str:
+        return model.generate_content(text, generation_config=config).text.strip()
+
+    accept = parses(lambda raw: validate_json(raw, schema, check))
+    raw = cached_generate(model_name, prompt, site, lambda: generate(prompt), config=config, use_cache=use_cache,
+                          accept=accept)
+    try:
+        result = validate_json(raw, schema, check)
+        record_parse(site, "valid")
+        return result
+    except ValueError as e:
+        error = e
+    log("structured", f"{site} response failed validation, repairing: {error}")
+
+    repair_prompt = f"{prompt}\nYour previous reply was:\n{raw}\nIt was rejected: {error}\nReply again, fixing the problem.\n"
+    raw = cached_generate(model_name, repair_prompt, f"{site}_repair", lambda: generate(repair_prompt),
+                          config=config, use_cache=use_cache, accept=accept)
+    try:
+        result = validate_json(raw, schema, check)
+    except ValueError as e:
+        record_parse(site, "failed")
+        raise StructuredOutputError(f"{site} response invalid after repair: {e}") from e
+    record_parse(site, "repaired")
+    return result
+
+
+def summary() -> str:
+    sites = sorted({site for site, _ in PARSE_STATS})
+    if not sites:
+        return "Parsing: no LLM responses"
+    parts = [f"{site} {PARSE_STATS[(site, 'valid')]} valid / {PARSE_STATS[(site, 'repaired')]} repaired / "
+             f"{PARSE_STATS[(site, 'failed')]} failed" for site in sites]
+    return f"Parsing: {', '.join(parts)}"
@@ -1,11 +1,19 @@
-from typing import Dict, Any, Union
+from typing import Dict, Any, Optional, Union
 from pydantic import BaseModel
 from mcp import ClientSession
 import ast
+import asyncio
+import json
+import os
+import re
+import time
 from models import WebPageInput, WebPageOutput, SearchInput, SearchOutput, HighlightInput, HighlightOutput, IndexedPagesOutput
 from perception import Perception
-from memory import MemoryManager
+from memory import PAGE_INDEX_TYPE, MemoryManager
 from decision import Decision
+from collection_cache import DEFAULT_COLLECTION, LRUBudgetCache
+from tool_cache import ToolResultCache
+import tracing
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -17,11 +25,18 @@ except ImportError:
         print(f"[{now}] [{stage}] {msg}")
 
 
+TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "30"))  # seconds per tool call
+
+
 class ToolCallResult(BaseModel):
     tool_name: str
     arguments: Dict[str, Any]
     result: Union[str, list, dict]
     raw_response: Any
+    prefetched: bool = False
+    cached: bool = False
+    saved_seconds: float = 0.0  # latency hidden by a prefetch that started before the plan
+    error: Optional[str] = None  # set when this call of a multi-call plan failed or timed out
 
 
 def parse_function_call(response: str) -> tuple[str, Dict[str, Any]]:
@@ -31,6 +46,12 @@ def parse_function_call(response: str) -> tuple[str, Dict[str, Any]]:
             raise ValueError("Not a valid FUNCTION_CALL")
 
         _, function_info = response.split(":", 1)
+        name, _, payload = function_info.partition("|")
+        if payload.strip().startswith("{"):
+            # Structured-output plans pass the arguments as one JSON object
+            result = json.loads(payload)
+            log("parser", f"Parsed: {name.strip()} → {result}")
+            return name.strip(), result
         parts = [p.strip() for p in function_info.split("|")]
         func_name, param_parts = parts[0], parts[1:]
 
@@ -60,45 +81,182 @@ def parse_function_call(response: str) -> tuple[str, Dict[str, Any]]:
         raise
 
 
-async def execute_tool(session: ClientSession, tools: list[Any], response: str) -> ToolCallResult:
-    """Executes a FUNCTION_CALL via MCP tool session."""
-    try:
-        tool_name, arguments = parse_function_call(response)
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(re.sub(r"[^\w\s]", " ", value.lower()).split())
+    return value
+
+
+class Prefetch:
+    """A tool call started speculatively, before the planner has asked for it"""
+
+    def __init__(self, session: ClientSession, tool_name: str, arguments: Dict[str, Any]):
+        self.tool_name = tool_name
+        self.arguments = arguments
+        self.started = time.perf_counter()
+        self.finished = None
+        self.task = asyncio.create_task(session.call_tool(tool_name, arguments=arguments))
+        self.task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self.finished = time.perf_counter()
+        if not task.cancelled():
+            task.exception()  # a discarded prefetch's error is not worth a warning
 
-        tool = next((t for t in tools if t.name == tool_name), None)
-        if not tool:
-            raise ValueError(f"Tool '{tool_name}' not found in registered tools")
+    def matches(self, tool_name: str, arguments: Dict[str, Any]) -> bool:
+        """Same tool and the same arguments, ignoring case, punctuation and spacing"""
+        if tool_name != self.tool_name or arguments.keys() != self.arguments.keys():
+            return False
+        return all(_normalize(arguments[k]) == _normalize(v) for k, v in self.arguments.items())
 
-        log("tool", f"⚙️ Calling '{tool_name}' with: {arguments}")
-        result = await session.call_tool(tool_name, arguments=arguments)
+    def cancel(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
 
-        if hasattr(result, 'content'):
-            if isinstance(result.content, list):
-                out = [getattr(item, 'text', str(item)) for item in result.content]
-            else:
-                out = getattr(result.content, 'text', str(result.content))
+
+async def call_tool(session: ClientSession, tools: list[Any], tool_name: str, arguments: Dict[str, Any],
+                    prefetch: Optional[Prefetch] = None, cache: Optional[ToolResultCache] = None) -> ToolCallResult:
+    """Calls one parsed tool call, through the cache and a matching prefetch"""
+    tool = next((t for t in tools if t.name == tool_name), None)
+    if not tool:
+        raise ValueError(f"Tool '{tool_name}' not found in registered tools")
+
+    with tracing.span("tool", tool=tool_name) as span:
+        cached = cache.get(tool_name, arguments) if cache is not None else None
+        if cache is not None and cache.cacheable(tool_name):
+            span.set(cache_hit=cached is not None)
+        if cached is not None:
+            log("tool", f"♻️ {tool_name} result (cached): {cached}")
+            return ToolCallResult(tool_name=tool_name, arguments=arguments, result=cached,
+                                  raw_response=None, cached=True)
+
+        used = prefetch is not None and prefetch.matches(tool_name, arguments)
+        saved = 0.0
+        span.set(prefetched=used)
+        if used:
+            log("tool", f"⚡ Using prefetched '{tool_name}' started {time.perf_counter() - prefetch.started:.2f}s ago")
+            plan_ready = time.perf_counter()
+            result = await prefetch.task
+            # finished is still None if the done callback hasn't run yet: the prefetch ran past plan_ready
+            finished = prefetch.finished if prefetch.finished is not None else plan_ready
+            saved = min(plan_ready, finished) - prefetch.started
         else:
-            out = str(result)
+            if prefetch is not None:
+                prefetch.cancel()
+            log("tool", f"⚙️ Calling '{tool_name}' with: {arguments}")
+            result = await session.call_tool(tool_name, arguments=arguments)
+        span.set(is_error=bool(getattr(result, "isError", False)))
+
+    if hasattr(result, 'content'):
+        if isinstance(result.content, list):
+            out = [getattr(item, 'text', str(item)) for item in result.content]
+        else:
+            out = getattr(result.content, 'text', str(result.content))
+    else:
+        out = str(result)
+
+    log("tool", f"✅ {tool_name} result: {out}")
+    if cache is not None and not getattr(result, "isError", False):
+        cache.put(tool_name, arguments, out)
+    return ToolCallResult(
+        tool_name=tool_name,
+        arguments=arguments,
+        result=out,
+        raw_response=result,
+        prefetched=used,
+        saved_seconds=saved
+    )
+
 
-        log("tool", f"✅ {tool_name} result: {out}")
-        return ToolCallResult(
-            tool_name=tool_name,
-            arguments=arguments,
-            result=out,
-            raw_response=result
-        )
+async def execute_tool(session: ClientSession, tools: list[Any], response: str,
+                       prefetch: Optional[Prefetch] = None, cache: Optional[ToolResultCache] = None) -> ToolCallResult:
+    """Executes a FUNCTION_CALL via MCP tool session.
+
+    Pure and idempotent tools are answered from cache when the same call was
+    made before. A matching prefetch is awaited instead of calling the tool
+    again; one that doesn't match the plan is cancelled.
+    """
+    try:
+        tool_name, arguments = parse_function_call(response)
+        return await call_tool(session, tools, tool_name, arguments, prefetch=prefetch, cache=cache)
 
     except Exception as e:
         log("tool", f"⚠️ Execution failed for '{response}': {e}")
         raise
 
 
+async def execute_tools(session: ClientSession, tools: list[Any], plan: str, prefetch: Optional[Prefetch] = None,
+                        cache: Optional[ToolResultCache] = None, timeout: float = TOOL_TIMEOUT) -> list[ToolCallResult]:
+    """Executes every FUNCTION_CALL line of a plan concurrently over the one MCP session.
+
+    Each call has its own timeout. A call that fails or times out becomes a
+    result with error set, so the other calls' results are kept; only when
+    every call fails is the first error raised. The prefetch goes to the call
+    it matches and is cancelled if none does.
+    """
+    lines = [line.strip() for line in plan.splitlines() if line.strip()]
+    parsed = []
+    for line in lines:
+        try:
+            parsed.append(parse_function_call(line))
+        except Exception as e:
+            parsed.append(e)
+    owner = next((i for i, call in enumerate(parsed)
+                  if prefetch is not None and not isinstance(call, Exception) and prefetch.matches(*call)), None)
+    if prefetch is not None and owner is None:
+        prefetch.cancel()
+
+    async def run(i: int) -> ToolCallResult:
+        if isinstance(parsed[i], Exception):
+            raise parsed[i]
+        tool_name, arguments = parsed[i]
+        try:
+            return await asyncio.wait_for(
+                call_tool(session, tools, tool_name, arguments, prefetch=prefetch if i == owner else None, cache=cache),
+                timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"'{tool_name}' timed out after {timeout:g}s") from None
+
+    with tracing.span("tools", calls=len(lines)):
+        outcomes = await asyncio.gather(*(run(i) for i in range(len(lines))), return_exceptions=True)
+
+    results = []
+    for line, call, outcome in zip(lines, parsed, outcomes):
+        if not isinstance(outcome, Exception):
+            results.append(outcome)
+            continue
+        log("tool", f"⚠️ Execution failed for '{line}': {outcome}")
+        tool_name, arguments = call if not isinstance(call, Exception) else ("unknown", {})
+        results.append(ToolCallResult(tool_name=tool_name, arguments=arguments, result=f"ERROR: {outcome}",
+                                      raw_response=None, error=str(outcome)))
+    if all(result.error for result in results):
+        raise next(o for o in outcomes if isinstance(o, Exception))
+    return results
+
+
+# Page indexes of cold collections are dropped past this budget and reloaded on demand
+COLLECTION_MEMORY_BUDGET_MB = float(os.getenv("COLLECTION_MEMORY_BUDGET_MB", "1024"))
+
+
 class Action:
-    def __init__(self):
+    def __init__(self, index_type: str = PAGE_INDEX_TYPE):
         self.perception = Perception()
-        self.memory = MemoryManager()
+        self.index_type = index_type  # vector storage of every collection's page index
+        self.memories = LRUBudgetCache(int(COLLECTION_MEMORY_BUDGET_MB * 2**20),
+                                       sizer=lambda memory: memory.memory_bytes(),
+                                       on_evict=lambda name, _: log("memory", f"Unloaded collection '{name}'"),
+                                       can_evict=lambda memory: memory.collection != DEFAULT_COLLECTION)
+        self.memory = self.memory_for(DEFAULT_COLLECTION)
         self.decision = Decision(self.memory)
 
+    def memory_for(self, collection: str) -> MemoryManager:
+        """The collection's page index, loaded on first use"""
+        memory = self.memories.get(collection)
+        if memory is None:
+            memory = MemoryManager(index_type=self.index_type, collection=collection)
+            self.memories.put(collection, memory)
+        return memory
+
     def index_page(self, input_data: WebPageInput) -> WebPageOutput:
         """Index a web page"""
         try:
@@ -108,7 +266,9 @@ class Action:
                 return perception_result
 
             # Add to memory
-            success = self.memory.add(input_data.url, input_data.content)
+            memory = self.memory_for(input_data.collection)
+            success = memory.add(input_data.url, input_data.content)
+            self.memories.enforce(keep=input_data.collection)
             if not success:
                 return WebPageOutput(success=False, error="Failed to add page to index")
             return WebPageOutput(success=True)
@@ -119,7 +279,7 @@ class Action:
         """Search indexed pages"""
         try:
             # Generate search plan and execute
-            results = self.decision.generate_plan(input_data.query)
+            results = Decision(self.memory_for(input_data.collection)).generate_plan(input_data.query)
             return results
         except Exception as e:
             return SearchOutput(results=[])
@@ -133,10 +293,10 @@ class Action:
         except Exception as e:
             return HighlightOutput(highlighted_text=input_data.text)
 
-    def list_indexed_pages(self) -> IndexedPagesOutput:
+    def list_indexed_pages(self, collection: str = DEFAULT_COLLECTION) -> IndexedPagesOutput:
         """List all indexed pages"""
         try:
-            pages = self.memory.list_pages()
+            pages = self.memory_for(collection).list_pages()
             return IndexedPagesOutput(pages=pages)
         except Exception as e:
             return IndexedPagesOutput(pages=[], error=str(e))
@@ -2,12 +2,24 @@ import asyncio
 import time
 import os
 import datetime
-from perception import extract_perception
-from memory import MemoryManager, MemoryItem
-from decision import generate_plan
-from action import execute_tool
+import statistics
+import uuid
+from collections import Counter
+from contextlib import AsyncExitStack
+import anyio
+from perception import extract_perception, predicts_retrieval
+from memory import MemoryItem
+from session_memory import SessionMemory
+from decision import generate_plan, perceive_and_plan
+from action import Prefetch, execute_tools
+from tool_cache import ToolResultCache
+from plan_templates import PLAN_TEMPLATES, PlanTemplateCache, TemplateMismatch, TemplateRun
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+import llm
+import llm_cache
+import structured as structured_output
+import tracing
  # use this to connect to running server
 
 import shutil
@@ -18,102 +30,405 @@ def log(stage: str, msg: str):
     print(f"[{now}] [{stage}] {msg}")
 
 max_steps = 3
+HEALTH_CHECK_TIMEOUT = 5.0  # seconds a ping may take before the server is treated as dead
+# "two_call": perception then planning; "fused": one structured call returns both
+PLANNING_MODES = ("two_call", "fused")
+PLANNING_MODE = os.getenv("AGENT_PLANNING_MODE", "two_call")
+# Start search_documents(query) while the first plan is generated when retrieval looks likely
+SPECULATIVE_SEARCH = os.getenv("AGENT_SPECULATIVE_SEARCH", "0") == "1"
+# LLM replies constrained to a JSON schema and validated (see structured.py) instead of parsed from text
+STRUCTURED_OUTPUT = os.getenv("AGENT_STRUCTURED_OUTPUT", "0") == "1"
+
+SERVER_PARAMS = StdioServerParameters(
+    command="python",
+    args=["example3.py"],
+    cwd="I:/TSAI/2025/EAG/Session 7/S7"
+)
+
+
+class AgentRuntime:
+    """MCP session, tool list and memory kept warm across queries.
+
+    The server is spawned once. Every query pings it first and respawns it
+    if it has died, so only the first query (or the one after a crash) pays
+    for process start-up and index loading.
+    """
+
+    def __init__(self, server_params: StdioServerParameters = SERVER_PARAMS, mode: str = PLANNING_MODE,
+                 speculative: bool = SPECULATIVE_SEARCH, tool_cache: ToolResultCache | None = None,
+                 structured: bool = STRUCTURED_OUTPUT, templates: bool = PLAN_TEMPLATES,
+                 template_cache: PlanTemplateCache | None = None):
+        self.server_params = server_params
+        self.structured = structured
+        self.templates = templates
+        self.template_cache = template_cache if template_cache is not None else PlanTemplateCache()
+        self.tool_cache = tool_cache if tool_cache is not None else ToolResultCache()
+        self.mode = mode
+        self.speculative = speculative
+        self.speculation = Counter()  # launched / used / discarded prefetches
+        self.saved_seconds = 0.0
+        self.session = None
+        self.tools = []
+        self.tool_descriptions = ""
+        self.memory = SessionMemory()  # tool outputs of the queries' sessions, not the web page index
+        self.spawns = 0
+        self.spawned_at = None
+        self.cold_start_pending = False  # set per spawn, until a query claims the start-up cost
+        self.first_tool_logged = False
+        self.latencies = {"cold start": [], "warm session": []}
+        self._stack = None
+        self._spawn_lock = asyncio.Lock()  # concurrent queries must not spawn twice
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Spawn the server, initialize the session and load the tool list once"""
+        self.spawned_at = time.perf_counter()
+        stack = AsyncExitStack()
+        try:
+            read, write = await self.connect(stack)
+            session = await stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            print("[agent] MCP session initialized")
+            log("timing", f"Server ready {time.perf_counter() - self.spawned_at:.2f}s after spawn")
+            tools = (await session.list_tools()).tools
+        except BaseException:
+            await stack.aclose()
+            raise
+        self._stack, self.session, self.tools = stack, session, tools
+        self.tool_descriptions = "\n".join(
+            f"- {tool.name}: {getattr(tool, 'description', 'No description')}"
+            for tool in tools
+        )
+        self.spawns += 1
+        self.cold_start_pending = True
+        self.first_tool_logged = False
+        log("agent", f"{len(tools)} tools loaded")
+
+    async def connect(self, stack: AsyncExitStack):
+        """(read, write) streams to the server, closed with stack; spawns server_params over stdio"""
+        return await stack.enter_async_context(stdio_client(self.server_params))
+
+    async def close(self):
+        stack, self._stack, self.session = self._stack, None, None
+        if stack is None:
+            return
+        try:
+            await stack.aclose()
+        except Exception as e:
+            log("agent", f"Error while shutting down the server: {e}")
+
+    async def is_healthy(self) -> bool:
+        if self.session is None:
+            return False
+        try:
+            with anyio.fail_after(HEALTH_CHECK_TIMEOUT):
+                await self.session.send_ping()
+            return True
+        except Exception as e:
+            log("health", f"Server did not answer ping: {e!r}")
+            return False
+
+    def prefetch_search(self, query: str) -> Prefetch | None:
+        if not any(tool.name == "search_documents" for tool in self.tools):
+            return None
+        self.speculation["launched"] += 1
+        log("speculate", f"Prefetching search_documents for: {query}")
+        return Prefetch(self.session, "search_documents", {"query": query})
+
+    def settle_prefetch(self, prefetch: Prefetch | None, used: bool = False, saved: float = 0.0) -> None:
+        """Record whether the plan used the prefetch; an unused one is cancelled"""
+        if prefetch is None:
+            return
+        if used:
+            self.speculation["used"] += 1
+            self.saved_seconds += saved
+            log("speculate", f"Prefetch used, saved {saved:.2f}s")
+        else:
+            prefetch.cancel()
+            self.speculation["discarded"] += 1
+            log("speculate", "Prefetch discarded: the plan did not match")
+
+    def speculation_summary(self) -> str:
+        launched = self.speculation["launched"]
+        if not launched:
+            return "Speculative search: no prefetches"
+        return (f"Speculative search: {launched} prefetched, {self.speculation['used'] / launched:.0%} hit rate, "
+                f"{self.saved_seconds:.2f}s saved")
+
+    async def ensure_session(self) -> bool:
+        """Make sure a live session exists; returns True if the server had to be (re)spawned"""
+        async with self._spawn_lock:
+            if await self.is_healthy():
+                return False
+            if self.session is not None:
+                log("health", "Respawning MCP server")
+            await self.close()
+            await self.start()
+            return True
+
+    def claim_cold_start(self) -> bool:
+        """True for the one query that pays for the current server's spawn; later and concurrent ones are warm"""
+        cold, self.cold_start_pending = self.cold_start_pending, False
+        return cold
+
+
+def replayed_plan(runtime: AgentRuntime, run: TemplateRun, step: int) -> str | None:
+    """The template's plan for this step, or None if the LLM has to plan it"""
+    try:
+        plan = run.next_plan(step)
+    except TemplateMismatch as e:
+        run.mismatch = str(e)
+        runtime.template_cache.stats["mismatches"] += 1
+        log("template", f"Template no longer fits, planning with the LLM: {e}")
+        return None
+    if plan is not None:
+        runtime.template_cache.stats["llm_calls_avoided"] += 1
+        log("template", f"Replayed step {step + 1} without the LLM")
+    return plan
+
+async def run_query(runtime: AgentRuntime, user_input: str, mode: str | None = None,
+                    speculative: bool | None = None, structured: bool | None = None,
+                    templates: bool | None = None) -> str | None:
+    """Run the perception → plan → act loop for one query on a warm runtime"""
+    mode = mode or runtime.mode
+    speculative = runtime.speculative if speculative is None else speculative
+    structured = runtime.structured if structured is None else structured
+    templates = runtime.templates if templates is None else templates
+    if mode not in PLANNING_MODES:
+        raise ValueError(f"Unknown planning mode '{mode}', expected one of {PLANNING_MODES}")
+    query_started = time.perf_counter()
+    llm_calls = llm.track_calls()
+    await runtime.ensure_session()
+    # Decided from the runtime's state now, not from how many queries have finished
+    cold = runtime.claim_cold_start()
+    memory = runtime.memory
+    # Unique per query: concurrent queries must not see each other's tool outputs
+    session_id = f"session-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    query = user_input  # Store original intent
+    final_answer = None
+    respawned = False
+    perception = None
+    prefetch = None
+    template_run = matched_run = None  # plan template being replayed, until it stops fitting
+    query_perception = None  # perception of the original query, for the template recorded from it
+    executed = []  # tool results of each step, recorded as a template if the query is answered
+    step = 0
+
+    with tracing.span("query", mode=mode, speculative=speculative, structured=structured) as query_span:
+        while step < max_steps:
+            log("loop", f"Step {step + 1} started")
+            with tracing.span("step", step=step + 1) as step_span:
+
+                # The first step of a factual question is nearly always search_documents(query)
+                speculate = speculative and step == 0
+                if speculate and predicts_retrieval(query):
+                    prefetch = runtime.prefetch_search(query)
+
+                retrieval = memory.aretrieve(query=user_input, top_k=3, session_filter=session_id)
+                if mode == "two_call" and perception is None:
+                    # The original task doesn't change between steps, so it is only perceived once,
+                    # while the memory lookup runs
+                    perception, retrieved = await asyncio.gather(
+                        tracing.traced("perception", extract_perception(query, structured=structured)), retrieval)
+                    log("perception", f"Intent: {perception.intent}, Tool hint: {perception.tool_hint}")
+                    # A query shaped like an earlier answered one replays its tool calls
+                    template_run = runtime.template_cache.match(perception) if templates else None
+                    if template_run is not None:
+                        matched_run = template_run
+                        log("template", f"Matched template '{template_run.template.intent}' "
+                                        f"(score {template_run.score:.2f})")
+                else:
+                    retrieved = await retrieval
+                log("memory", f"Retrieved {len(retrieved)} relevant memories")
+
+                with tracing.span("plan", mode=mode) as plan_span:
+                    plan = replayed_plan(runtime, template_run, step) if template_run is not None else None
+                    if plan is None:
+                        template_run = None  # no answer step in the template, or it stopped fitting
+                    if plan is not None:
+                        plan_span.set(template=True)
+                    elif mode == "fused":
+                        perception, plan = await perceive_and_plan(user_input, retrieved,
+                                                                   tool_descriptions=runtime.tool_descriptions,
+                                                                   structured=structured)
+                        log("perception", f"Intent: {perception.intent}, Tool hint: {perception.tool_hint}")
+                    else:
+                        if speculate and prefetch is None and predicts_retrieval(query, perception.tool_hint):
+                            prefetch = runtime.prefetch_search(query)
+                        step_input = perception.model_copy(update={"user_input": user_input})
+                        plan = await generate_plan(step_input, retrieved, tool_descriptions=runtime.tool_descriptions,
+                                                   structured=structured)
+                log("plan", f"Plan generated: {plan}")
+                query_perception = query_perception or perception
+
+                if plan.startswith("FINAL_ANSWER:"):
+                    if template_run is not None:
+                        runtime.template_cache.stats["completed"] += 1
+                    runtime.settle_prefetch(prefetch)
+                    log("agent", f"✅ FINAL RESULT: {plan}")
+                    final_answer = plan
+                    break
+
+                try:
+                    # Several FUNCTION_CALL lines in one plan run concurrently
+                    results = await execute_tools(runtime.session, runtime.tools, plan, prefetch=prefetch,
+                                                  cache=runtime.tool_cache)
+                    executed.append(results)
+                    if template_run is not None:
+                        template_run.observe(step, results)
+                    used = next((r for r in results if r.prefetched), None)
+                    runtime.settle_prefetch(prefetch, used is not None, used.saved_seconds if used else 0.0)
+                    prefetch = None
+                    for result in results:
+                        log("tool", f"{result.tool_name} returned: {result.result}")
+                    if not runtime.first_tool_logged:
+                        runtime.first_tool_logged = True
+                        log("timing", f"First tool response {time.perf_counter() - runtime.spawned_at:.2f}s after spawn")
+
+                    for result in results:
+                        if result.error:
+                            continue
+                        memory.add(MemoryItem(
+                            text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
+                            type="tool_output",
+                            tool_name=result.tool_name,
+                            user_query=user_input,
+                            tags=[result.tool_name],
+                            session_id=session_id
+                        ))
+
+                    if len(results) == 1:
+                        previous = f"Previous output: {results[0].result}"
+                    else:
+                        previous = "Previous outputs:\n" + "\n".join(
+                            f"- {r.tool_name} with {r.arguments}: {r.result}" for r in results)
+                    user_input = f"Original task: {query}\n{previous}\nWhat should I do next?"
+
+                except Exception as e:
+                    log("error", f"Tool execution failed: {e}")
+                    step_span.set(error=str(e))
+                    runtime.settle_prefetch(prefetch)
+                    prefetch = None
+                    if template_run is not None:
+                        # The replayed calls didn't work for this query: the LLM plans the step instead
+                        template_run.mismatch = str(e)
+                        runtime.template_cache.stats["mismatches"] += 1
+                        template_run = None
+                        executed = executed[:step]
+                        continue
+                    # A crashed server is respawned once and the step retried
+                    if not respawned and not await runtime.is_healthy():
+                        respawned = True
+                        await runtime.ensure_session()
+                        cold = runtime.claim_cold_start() or cold
+                        continue
+                    break
+
+            step += 1
+
+        query_span.set(cold=cold, steps=step, answered=final_answer is not None,
+                       llm_calls=sum(llm_calls.values()),
+                       template=matched_run is not None and matched_run.mismatch is None)
+        # A query the matched template answered needs no new template
+        if templates and final_answer and query_perception and (matched_run is None or matched_run.mismatch):
+            if runtime.template_cache.record(query_perception, executed, final_answer):
+                log("template", "Recorded this query's tool calls as a plan template")
+
+    elapsed = time.perf_counter() - query_started
+    label = "cold start" if cold else "warm session"
+    runtime.latencies[label].append(elapsed)
+    log("timing", f"Query answered in {elapsed:.2f}s ({label}, {mode}, {sum(llm_calls.values())} LLM calls)")
+    return final_answer
+
+async def run_queries(runtime: AgentRuntime, queries: list[str], mode: str | None = None) -> list[str | None]:
+    """Run several queries concurrently on one event loop and one server session"""
+    return await asyncio.gather(*(run_query(runtime, query, mode=mode) for query in queries))
 
 async def main(user_input: str):
+    """Answer a single query with a freshly spawned server"""
+    runtime = AgentRuntime()
     try:
         print("[agent] Starting agent...")
         print(f"[agent] Current working directory: {os.getcwd()}")
-        
-        server_params = StdioServerParameters(
-            command="python",
-            args=["example3.py"],
-            cwd="I:/TSAI/2025/EAG/Session 7/S7"
-        )
+        async with runtime:
+            await run_query(runtime, user_input)
+    except Exception as e:
+        print(f"[agent] Overall error: {str(e)}")
 
-        try:
-            async with stdio_client(server_params) as (read, write):
-                print("Connection established, creating session...")
+    log("speculate", runtime.speculation_summary())
+    log("cache", llm_cache.summary())
+    log("cache", runtime.tool_cache.summary())
+    log("memory", runtime.memory.summary())
+    log("template", runtime.template_cache.summary())
+    log("parse", structured_output.summary())
+    log("agent", "Agent session complete.")
+
+async def interactive():
+    """Answer queries until an empty line, reusing one server session and memory"""
+    runtime = AgentRuntime()
+    try:
+        print("[agent] Starting agent...")
+        print(f"[agent] Current working directory: {os.getcwd()}")
+        async with runtime:
+            while True:
+                user_input = await asyncio.to_thread(input, "🧑 What do you want to solve today? (empty to quit) → ")
+                if not user_input.strip():
+                    break
+                if user_input.startswith("/mode"):
+                    # Switch planning mode without restarting: "/mode fused" or "/mode two_call"
+                    mode = user_input.split(maxsplit=1)[-1].strip()
+                    if mode in PLANNING_MODES:
+                        runtime.mode = mode
+                    log("agent", f"Planning mode: {runtime.mode} (available: {', '.join(PLANNING_MODES)})")
+                    continue
+                if user_input.startswith("/speculate"):
+                    # "/speculate on" or "/speculate off"
+                    runtime.speculative = user_input.split()[-1].lower() in ("on", "1", "true")
+                    log("agent", f"Speculative search: {'on' if runtime.speculative else 'off'}")
+                    continue
+                if user_input.startswith("/structured"):
+                    # "/structured on" or "/structured off"
+                    runtime.structured = user_input.split()[-1].lower() in ("on", "1", "true")
+                    log("agent", f"Structured output: {'on' if runtime.structured else 'off'}")
+                    continue
+                if user_input.startswith("/templates"):
+                    # "/templates on" or "/templates off"
+                    runtime.templates = user_input.split()[-1].lower() in ("on", "1", "true")
+                    log("agent", f"Plan templates: {'on' if runtime.templates else 'off'}")
+                    continue
                 try:
-                    async with ClientSession(read, write) as session:
-                        print("[agent] Session created, initializing...")
- 
-                        try:
-                            await session.initialize()
-                            print("[agent] MCP session initialized")
-
-                            # Your reasoning, planning, perception etc. would go here
-                            tools = await session.list_tools()
-                            print("Available tools:", [t.name for t in tools.tools])
-
-                            # Get available tools
-                            print("Requesting tool list...")
-                            tools_result = await session.list_tools()
-                            tools = tools_result.tools
-                            tool_descriptions = "\n".join(
-                                f"- {tool.name}: {getattr(tool, 'description', 'No description')}" 
-                                for tool in tools
-                            )
-
-                            log("agent", f"{len(tools)} tools loaded")
-
-                            memory = MemoryManager()
-                            session_id = f"session-{int(time.time())}"
-                            query = user_input  # Store original intent
-                            step = 0
-
-                            while step < max_steps:
-                                log("loop", f"Step {step + 1} started")
-
-                                perception = extract_perception(user_input)
-                                log("perception", f"Intent: {perception.intent}, Tool hint: {perception.tool_hint}")
-
-                                retrieved = memory.retrieve(query=user_input, top_k=3, session_filter=session_id)
-                                log("memory", f"Retrieved {len(retrieved)} relevant memories")
-
-                                plan = generate_plan(perception, retrieved, tool_descriptions=tool_descriptions)
-                                log("plan", f"Plan generated: {plan}")
-
-                                if plan.startswith("FINAL_ANSWER:"):
-                                    log("agent", f"✅ FINAL RESULT: {plan}")
-                                    break
-
-                                try:
-                                    result = await execute_tool(session, tools, plan)
-                                    log("tool", f"{result.tool_name} returned: {result.result}")
-
-                                    memory.add(MemoryItem(
-                                        text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
-                                        type="tool_output",
-                                        tool_name=result.tool_name,
-                                        user_query=user_input,
-                                        tags=[result.tool_name],
-                                        session_id=session_id
-                                    ))
-
-                                    user_input = f"Original task: {query}\nPrevious output: {result.result}\nWhat should I do next?"
-
-                                except Exception as e:
-                                    log("error", f"Tool execution failed: {e}")
-                                    break
-
-                                step += 1
-                        except Exception as e:
-                            print(f"[agent] Session initialization error: {str(e)}")
+                    await run_query(runtime, user_input)
                 except Exception as e:
-                    print(f"[agent] Session creation error: {str(e)}")
-        except Exception as e:
-            print(f"[agent] Connection error: {str(e)}")
+                    log("error", f"Query failed: {e}")
     except Exception as e:
         print(f"[agent] Overall error: {str(e)}")
 
+    for label, times in runtime.latencies.items():
+        if times:
+            log("timing", f"{label}: {len(times)} queries, mean {statistics.mean(times):.2f}s")
+    log("speculate", runtime.speculation_summary())
+    log("cache", llm_cache.summary())
+    log("cache", runtime.tool_cache.summary())
+    log("memory", runtime.memory.summary())
+    log("template", runtime.template_cache.summary())
+    log("parse", structured_output.summary())
     log("agent", "Agent session complete.")
 
 if __name__ == "__main__":
-    query = input("🧑 What do you want to solve today? → ")
-    asyncio.run(main(query))
+    if "--once" in sys.argv:
+        query = input("🧑 What do you want to solve today? → ")
+        asyncio.run(main(query))
+    else:
+        asyncio.run(interactive())
 
 
 # Find the ASCII values of characters in INDIA and then return sum of exponentials of those values.
 # How much Anmol singh paid for his DLF apartment via Capbridge? 
 # What do you know about Don Tapscott and Anthony Williams?
-# What is the relationship between Gensol and Go-Auto?
\ No newline at end of file
+# What is the relationship between Gensol and Go-Auto?
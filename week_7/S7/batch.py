@@ -0,0 +1,182 @@
+"""Answer a JSONL file of queries with bounded concurrency on one warm agent runtime.
+
+Each input line is {"query": "..."} (any "id" is copied to the result) or
+a bare JSON string. All queries share the MCP session, the memory index,
+the tool result cache and the LLM cache; at most --concurrency of them
+are in flight at once.
+
+A result line with the answer and wall time is appended to the output as
+soon as its query finishes, so an interrupted run can simply be started
+again: lines that already have a result are skipped and lines that failed
+are retried.
+
+    python batch.py queries.jsonl                      # results in queries.results.jsonl
+    python batch.py queries.jsonl -o out.jsonl --concurrency 8 --quiet
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import llm_cache
+import structured as structured_output
+from agent import PLANNING_MODE, PLANNING_MODES, STRUCTURED_OUTPUT, AgentRuntime, log, run_query
+from plan_templates import PLAN_TEMPLATES
+from trace_report import percentile
+
+DEFAULT_CONCURRENCY = 4
+PROGRESS_EVERY = 10  # queries between progress lines
+
+
+def read_queries(path: Path) -> list[tuple[int, dict]]:
+    """(line number, request) for every non-blank input line; a bad line becomes a request with an error"""
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                request = {"error": f"invalid JSON: {e}"}
+            if isinstance(request, str):
+                request = {"query": request}
+            elif not isinstance(request, dict) or not request.get("query") and "error" not in request:
+                request = {"error": "expected a string or an object with a 'query'"}
+            requests.append((n, request))
+    return requests
+
+
+def completed_lines(path: Path) -> set[int]:
+    """Input lines the output file already has a successful result for"""
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short when the last run was killed
+            # Results without an answer (written by older runs) are retried too
+            if result.get("error") is None and result.get("answer") is not None:
+                done.add(result["line"])
+            else:
+                done.discard(result["line"])
+    return done
+
+
+def drop_partial_line(path: Path) -> None:
+    """Truncate a line a killed run left unfinished, so the next append starts on a line of its own"""
+    if not path.exists():
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            block = min(pos, 64 * 1024)
+            f.seek(pos - block)
+            data = f.read(block)
+            if pos == end and data.endswith(b"\n"):
+                return
+            newline = data.rfind(b"\n")
+            if newline >= 0:
+                f.truncate(pos - block + newline + 1)
+                return
+            pos -= block
+        f.truncate(0)
+
+
+async def run_batch(runtime: AgentRuntime, input_path: Path, output_path: Path,
+                    concurrency: int = DEFAULT_CONCURRENCY) -> list[dict]:
+    """Answer the input lines without a result yet and append one result per line to output_path"""
+    done = completed_lines(output_path)
+    pending = [(n, request) for n, request in read_queries(input_path) if n not in done]
+    log("batch", f"{len(pending)} queries to run, {len(done)} already done, concurrency {concurrency}")
+    queue = iter(pending)
+    results = []
+    started = time.perf_counter()
+
+    async def answer(n: int, request: dict) -> dict:
+        result = {"line": n, "id": request.get("id"), "query": request.get("query"),
+                  "answer": None, "error": request.get("error"), "seconds": 0.0}
+        if result["error"]:
+            return result
+        query_started = time.perf_counter()
+        try:
+            result["answer"] = await run_query(runtime, request["query"])
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        else:
+            if result["answer"] is None:
+                # run_query logs and swallows LLM timeouts and tool errors; retried on resume like any failure
+                result["error"] = "no answer: the query failed or ran out of steps"
+        result["seconds"] = round(time.perf_counter() - query_started, 3)
+        return result
+
+    async def worker(out):
+        # Workers share one iterator, so each input line is taken exactly once
+        for n, request in queue:
+            result = await answer(n, request)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            results.append(result)
+            if len(results) % PROGRESS_EVERY == 0 or len(results) == len(pending):
+                # stderr, so progress still shows with --quiet
+                rate = len(results) / (time.perf_counter() - started)
+                print(f"[batch] {len(results)}/{len(pending)} done, {rate:.2f} queries/s", file=sys.stderr)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    drop_partial_line(output_path)
+    with open(output_path, "a", encoding="utf-8") as out:
+        await asyncio.gather(*(worker(out) for _ in range(max(1, concurrency))))
+    return results
+
+
+def summary(results: list[dict], elapsed: float) -> str:
+    if not results:
+        return "Batch: nothing to run"
+    answered = sum(r["answer"] is not None for r in results)
+    failed = sum(r["error"] is not None for r in results)
+    seconds = [r["seconds"] for r in results if r["error"] is None]
+    latency = f", p50 {percentile(seconds, 50):.2f}s, p95 {percentile(seconds, 95):.2f}s" if seconds else ""
+    return (f"Batch: {len(results)} queries in {elapsed:.1f}s ({len(results) / elapsed:.2f}/s), "
+            f"{answered} answered, {failed} failed{latency}")
+
+
+async def main(args: argparse.Namespace):
+    started = time.perf_counter()
+    runtime = AgentRuntime(mode=args.mode, structured=args.structured, templates=args.templates)
+    # The per-step log of concurrent queries interleaves; --quiet drops it
+    quiet = contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext()
+    async with runtime:
+        with quiet:
+            results = await run_batch(runtime, args.input, args.output, args.concurrency)
+    log("batch", summary(results, time.perf_counter() - started))
+    log("cache", llm_cache.summary())
+    log("cache", runtime.tool_cache.summary())
+    log("memory", runtime.memory.summary())
+    log("template", runtime.template_cache.summary())
+    log("parse", structured_output.summary())
+    log("batch", f"Results in {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="JSONL file, one query per line")
+    parser.add_argument("-o", "--output", type=Path, help="results JSONL (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="queries in flight at once")
+    parser.add_argument("--mode", choices=PLANNING_MODES, default=PLANNING_MODE)
+    parser.add_argument("--structured", action="store_true", default=STRUCTURED_OUTPUT,
+                        help="schema-constrained LLM replies (structured.py)")
+    parser.add_argument("--templates", action="store_true", default=PLAN_TEMPLATES,
+                        help="replay plan templates of earlier queries (plan_templates.py)")
+    parser.add_argument("--quiet", action="store_true", help="hide the agent's per-step log")
+    args = parser.parse_args()
+    args.output = args.output or args.input.with_suffix(".results.jsonl")
+    asyncio.run(main(args))
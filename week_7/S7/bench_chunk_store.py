@@ -0,0 +1,98 @@
+"""Load/lookup benchmark: metadata.json vs the mmapped ChunkStore.
+
+Writes the same chunks in both layouts to a temp dir, then times a cold
+load, the Python heap it needs, and fetching k random hit chunks (what
+search_documents does per call).
+
+    python bench_chunk_store.py                  # chunks from faiss_index/
+    python bench_chunk_store.py --synthetic 50000
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from chunk_store import ChunkStore
+
+INDEX_DIR = Path(__file__).parent / "faiss_index"
+
+
+def synthetic_records(n: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(5000)]
+    return [{"doc": f"doc{i // 40}.pdf", "chunk": " ".join(rng.choices(vocab, k=256)), "chunk_id": f"doc{i // 40}_{i % 40}"}
+            for i in range(n)]
+
+
+def existing_records() -> list[dict]:
+    if ChunkStore.exists(INDEX_DIR):
+        return list(ChunkStore.load(INDEX_DIR))
+    if (INDEX_DIR / "metadata.json").exists():
+        return json.loads((INDEX_DIR / "metadata.json").read_text())
+    raise SystemExit("No index found; run example3.py once or pass --synthetic N")
+
+
+def timed(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - t0) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N synthetic chunks instead")
+    parser.add_argument("--lookups", type=int, default=200, help="simulated searches")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.synthetic, args.seed) if args.synthetic else existing_records()
+    rng = random.Random(args.seed)
+    hit_sets = [rng.sample(range(len(records)), min(args.k, len(records))) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        json_path = tmp / "metadata.json"
+        json_path.write_text(json.dumps(records, indent=2))
+        ChunkStore.from_records(records, tmp).close()
+        store_bytes = sum((tmp / name).stat().st_size for name in
+                          (ChunkStore.ARENA, ChunkStore.OFFSETS, ChunkStore.DOC_IDS, ChunkStore.SEQS, ChunkStore.DOCS))
+        print(f"{len(records)} chunks: metadata.json {json_path.stat().st_size / 2**20:.1f} MiB, "
+              f"chunk store {store_bytes / 2**20:.1f} MiB")
+
+        metadata, json_ms, json_mb = timed(lambda: json.loads(json_path.read_text()))
+        store, store_ms, store_mb = timed(lambda: ChunkStore.load(tmp))
+        print(f"load   json: {json_ms:8.2f} ms  heap {json_mb:7.1f} MiB")
+        print(f"load  store: {store_ms:8.2f} ms  heap {store_mb:7.1f} MiB")
+
+        # The original search path re-parsed metadata.json on every call
+        per_call_json = []
+        for ids in hit_sets[:20]:
+            t0 = time.perf_counter()
+            data = json.loads(json_path.read_text())
+            [data[i] for i in ids]
+            per_call_json.append((time.perf_counter() - t0) * 1000)
+        in_memory, mmapped = [], []
+        for ids in hit_sets:
+            t0 = time.perf_counter()
+            [metadata[i]["chunk"] for i in ids]
+            in_memory.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            [store[i]["chunk"] for i in ids]
+            mmapped.append((time.perf_counter() - t0) * 1000)
+        print(f"k={args.k} lookup, parse json per call: p50 {statistics.median(per_call_json):8.3f} ms")
+        print(f"k={args.k} lookup, parsed json list:    p50 {statistics.median(in_memory):8.3f} ms")
+        print(f"k={args.k} lookup, mmapped store:       p50 {statistics.median(mmapped):8.3f} ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Recall/latency comparison of vector-only, lexical and hybrid search_documents.
+
+Relevance comes from labelled query/passage pairs, never from the BM25
+index itself, so no mode is favoured by construction. Labels are JSONL
+lines {"query": ..., "doc": "file.pdf"} (any chunk of the document is
+relevant) or {"query": ..., "chunk_ids": ["file_3", ...]}. Without a
+labels file, --generate asks Gemini for a question answered by each of N
+random chunks (relevant: that chunk and its overlapping neighbours) and
+writes the pairs to --labels for review and reuse.
+
+    python bench_hybrid.py --labels labels.jsonl --top-k 5
+    python bench_hybrid.py --labels labels.jsonl --generate 50
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+import example3
+import llm
+from example3 import chunk_seq
+
+README_QUERIES = [
+    "How much Anmol singh paid for his DLF apartment via Capbridge?",
+    "What do you know about Don Tapscott and Anthony Williams?",
+    "What is the relationship between Gensol and Go-Auto?",
+]
+QUESTION_PROMPT = """Write one question that a user might ask and that the passage below answers.
+Use your own words rather than copying phrases from the passage. Reply with the question only.
+
+Passage:
+{chunk}"""
+
+
+def generate_labels(state, n_queries: int, seed: int) -> list[dict]:
+    """Pairs of an LLM-written question and the chunk it was written from (plus its neighbours)"""
+    rng = random.Random(seed)
+    labels = []
+    for cid in rng.sample(range(len(state.metadata)), min(n_queries, len(state.metadata))):
+        data = state.metadata[cid]
+        response = llm.get_client().models.generate_content(
+            model=llm.MODEL, contents=QUESTION_PROMPT.format(chunk=data["chunk"]))
+        stem, seq = data["chunk_id"].rsplit("_", 1)[0], chunk_seq(data["chunk_id"])
+        labels.append({"query": response.text.strip(),
+                       "chunk_ids": [f"{stem}_{i}" for i in range(max(seq - 1, 0), seq + 2)]})
+    return labels
+
+
+def relevant_ids(state, label: dict, id_of: dict[str, int]) -> set[int]:
+    relevant = {id_of[c] for c in label.get("chunk_ids", ()) if c in id_of}
+    return relevant | (state.metadata.ids_for_docs([label["doc"]]) if label.get("doc") else set())
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=Path, required=True, help="JSONL of labelled queries")
+    parser.add_argument("--generate", type=int, default=0, help="write N LLM-generated labels to --labels first")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    state = example3.INDEX_STATE
+    if not state.load_from_disk():
+        raise SystemExit("No index found; run example3.py once to build faiss_index/")
+
+    if args.generate:
+        labels = generate_labels(state, args.generate, args.seed)
+        args.labels.write_text("".join(json.dumps(label) + "\n" for label in labels), encoding="utf-8")
+        print(f"Wrote {len(labels)} generated labels to {args.labels}")
+    elif not args.labels.exists():
+        raise SystemExit(f"{args.labels} not found; write labels by hand or pass --generate N")
+    labels = [json.loads(line) for line in args.labels.read_text(encoding="utf-8").splitlines() if line.strip()]
+    id_of = {state.metadata[i]["chunk_id"]: i for i in range(len(state.metadata))}
+    queries = [(label["query"], relevant_ids(state, label, id_of)) for label in labels]
+    queries = [(text, relevant) for text, relevant in queries if relevant]
+    print(f"{len(queries)} labelled queries over {len(state.metadata)} chunks, top_k={args.top_k}")
+
+    embed_ms = []
+    stats = {mode: {"hits": 0, "rr": 0.0, "ms": []} for mode in example3.SEARCH_MODES}
+    for text, relevant in queries:
+        t0 = time.perf_counter()
+        query_vec = example3.get_embedding(text).reshape(1, -1)
+        embed_ms.append((time.perf_counter() - t0) * 1000)
+        for mode, acc in stats.items():
+            t0 = time.perf_counter()
+            ids = example3.rank_chunks(text, top_k=args.top_k, mode=mode, query_vec=query_vec)
+            acc["ms"].append((time.perf_counter() - t0) * 1000)
+            ranks = [rank for rank, i in enumerate(ids, 1) if i in relevant]
+            acc["hits"] += bool(ranks)
+            acc["rr"] += 1 / ranks[0] if ranks else 0.0
+
+    if queries:
+        print(f"query embedding: p50 {statistics.median(embed_ms):.1f} ms (shared by all modes)")
+        for mode, acc in stats.items():
+            print(f"{mode:>7}: recall@{args.top_k} {acc['hits'] / len(queries):.2%}  MRR {acc['rr'] / len(queries):.3f}  "
+                  f"search p50 {statistics.median(acc['ms']):.2f} ms  p95 {percentile(acc['ms'], 95):.2f} ms")
+
+    print("\nREADME queries (top source per mode):")
+    for text in README_QUERIES:
+        query_vec = example3.get_embedding(text).reshape(1, -1)
+        for mode in ("vector", "hybrid"):
+            ids = example3.rank_chunks(text, top_k=args.top_k, mode=mode, query_vec=query_vec)
+            sources = [state.metadata[i]["chunk_id"] for i in ids]
+            print(f"  [{mode}] {text}\n      {sources}")
+
+
+if __name__ == "__main__":
+    main()
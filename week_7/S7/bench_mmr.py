@@ -0,0 +1,71 @@
+"""Redundancy/token comparison of search_documents with and without MMR.
+
+For each query, compares the plain top-k against the MMR re-rank with
+adjacent chunks merged: total result tokens (whitespace words, what the
+planner prompt pays for), unique 8-word shingles (distinct text covered)
+and the share of shingles that are repeats.
+
+    python bench_mmr.py --queries 30 --top-k 5 --mode hybrid
+"""
+import argparse
+import random
+import statistics
+
+import example3
+from bench_hybrid import README_QUERIES
+
+SHINGLE = 8
+
+
+def shingles(text: str) -> list[tuple]:
+    words = text.split()
+    return [tuple(words[i:i + SHINGLE]) for i in range(max(len(words) - SHINGLE + 1, 1))]
+
+
+def measure(passages: list[dict]) -> dict:
+    all_shingles = [sh for p in passages for sh in shingles(p["chunk"])]
+    unique = len(set(all_shingles))
+    return {
+        "tokens": sum(len(p["chunk"].split()) for p in passages),
+        "unique": unique,
+        "redundancy": 1 - unique / len(all_shingles) if all_shingles else 0.0,
+        "docs": len({p["doc"] for p in passages}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=30, help="sampled chunk-prefix queries added to the README ones")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", default="hybrid", choices=example3.SEARCH_MODES)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    state = example3.INDEX_STATE
+    if not state.load_from_disk():
+        raise SystemExit("No index found; run example3.py once to build faiss_index/")
+
+    rng = random.Random(args.seed)
+    sampled = rng.sample(state.metadata, min(args.queries, len(state.metadata)))
+    queries = README_QUERIES + [" ".join(m["chunk"].split()[:12]) for m in sampled]
+
+    rows = {"plain": [], "mmr": []}
+    for text in queries:
+        query_vec = example3.get_embedding(text).reshape(1, -1)
+        for label, use_mmr in (("plain", False), ("mmr", True)):
+            passages = example3.retrieve_passages(text, top_k=args.top_k, mode=args.mode,
+                                                  mmr=use_mmr, query_vec=query_vec)
+            rows[label].append(measure(passages))
+
+    print(f"{len(queries)} queries, top_k={args.top_k}, mode={args.mode}")
+    for label, results in rows.items():
+        tokens = sum(r["tokens"] for r in results)
+        unique = sum(r["unique"] for r in results)
+        print(f"{label:>5}: total tokens {tokens:>7}  unique shingles {unique:>7}  "
+              f"unique per 1k tokens {1000 * unique / max(tokens, 1):6.1f}  "
+              f"mean redundancy {statistics.mean(r['redundancy'] for r in results):.1%}  "
+              f"mean distinct docs {statistics.mean(r['docs'] for r in results):.2f}")
+
+
+if __name__ == "__main__":
+    main()
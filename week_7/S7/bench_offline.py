@@ -0,0 +1,283 @@
+"""Offline end-to-end agent benchmark: a hand-authored LLM cassette, a stub embedder and an in-process MCP server.
+
+Runs the example queries through agent.run_query and reports steps, LLM
+calls, tool calls and wall time per query. Nothing leaves the machine:
+model responses are replayed from a cassette keyed by prompt hash, memory
+embeddings are hashed bag-of-words vectors, and the tools are served from
+this process over in-memory streams. Each query starts with empty memory
+and an empty tool cache, so repeats are comparable.
+
+bench_cassette.json is hand-authored: its replies were written for these
+queries, not recorded from Gemini. Steps and LLM calls therefore show how
+the agent's control flow (planning mode, templates, parsing) handles those
+replies; they are not measured savings on the real model. When a prompt
+changes, its reply no longer matches; write the new reply into the
+cassette, or fill the gaps from Gemini with --record (needs GEMINI_API_KEY):
+
+    python bench_offline.py                        # replay bench_cassette.json
+    python bench_offline.py --repeat 5 --mode fused
+    python bench_offline.py --structured           # schema-constrained replies: compare steps and bad parses
+    python bench_offline.py --templates            # repeats replay the plan templates of the first round
+    python bench_offline.py --record               # ask Gemini for prompts missing from the cassette
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import statistics
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import anyio
+import numpy as np
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_client_server_memory_streams
+
+import llm
+import llm_cache
+import structured as structured_output
+import tracing
+from agent import PLANNING_MODES, AgentRuntime, run_query
+from bench_planning import DEFAULT_QUERIES
+from math_pipeline import run_pipeline
+from session_memory import SessionMemory
+from models import (ExpSumInput, ExpSumOutput, PipelineInput, PipelineOutput, StringsToIntsInput,
+                    StringsToIntsOutput)
+from plan_templates import PlanTemplateCache
+from tool_cache import ToolResultCache
+from trace_report import load_spans, percentile
+
+CASSETTE_PATH = Path(__file__).parent / "bench_cassette.json"
+
+# Passages served by the fake search_documents, one per document
+BENCH_DOCUMENTS = {
+    "dlf_apartment.txt": "Anmol Singh bought a DLF apartment in Gurugram for Rs 42.94 crore, "
+                         "paid through Capbridge Ventures, a firm linked to the Gensol promoters.",
+    "wikinomics.txt": "Don Tapscott and Anthony D. Williams co-authored Wikinomics: How Mass Collaboration "
+                      "Changes Everything (2006), on peer production and open business models.",
+    "gensol.txt": "Gensol Engineering bought electric vehicles that it leased to BluSmart; Go-Auto, "
+                  "a Gensol-linked dealer, received loan money meant for those EVs.",
+}
+
+
+def _tokens(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+# In-process stand-in for example3.py: same tool names and argument models, no index or embedder
+bench_server = FastMCP("OfflineBench")
+
+
+@bench_server.tool()
+def search_documents(query: str, top_k: int = 5) -> list[str]:
+    """Search for relevant content from uploaded documents"""
+    words = set(_tokens(query))
+    scored = sorted(((len(words & set(_tokens(text))), name) for name, text in BENCH_DOCUMENTS.items()), reverse=True)
+    return [f"{BENCH_DOCUMENTS[name]}\n[Source: {name}]" for score, name in scored[:top_k] if score]
+
+
+@bench_server.tool()
+def strings_to_chars_to_int(input: StringsToIntsInput) -> StringsToIntsOutput:
+    """Return the ASCII values of the characters in a word"""
+    return StringsToIntsOutput(ascii_values=[ord(char) for char in input.string])
+
+
+@bench_server.tool()
+def int_list_to_exponential_sum(input: ExpSumInput) -> ExpSumOutput:
+    """Return sum of exponentials of numbers in a list"""
+    return ExpSumOutput(result=sum(math.exp(i) for i in input.int_list))
+
+
+@bench_server.tool()
+def evaluate_pipeline(input: PipelineInput) -> PipelineOutput:
+    """Run a chain of math steps in ONE call instead of one tool call per step"""
+    results = run_pipeline(input.steps)
+    return PipelineOutput(results=results, result=results[input.steps[-1].id] if input.steps else None)
+
+
+def stub_embedding(text: str, dim: int) -> np.ndarray:
+    """Deterministic unit vector: signed hashed bag of words"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in _tokens(text):
+        h = int(hashlib.sha1(token.encode()).hexdigest()[:8], 16)
+        vec[h % dim] += 1.0 if h & 1 << 31 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class StubSessionMemory(SessionMemory):
+    """SessionMemory with stub_embedding instead of Ollama"""
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        with tracing.span("memory.embed", model="stub", texts=len(texts)):
+            return np.stack([stub_embedding(text, self.embedding_dim) for text in texts])
+
+
+class Cassette:
+    """Model responses keyed by llm_cache.cache_key(model, prompt, config).
+
+    With record_with (a genai client), prompts missing from the cassette are
+    sent to the model and their responses stored; otherwise they raise LookupError.
+    """
+
+    def __init__(self, path: Path, record_with=None):
+        self.path = path
+        self.record_with = record_with
+        self.responses = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        self.missing = 0
+        self.recorded = 0
+
+    def _replay(self, model: str, contents: str, config) -> tuple[str, str | None]:
+        key = llm_cache.cache_key(model, contents, config)
+        if key not in self.responses and self.record_with is None:
+            self.missing += 1
+            raise LookupError(f"No recorded response for prompt {key[:12]}; run with --record")
+        return key, self.responses.get(key)
+
+    def _store(self, key: str, text: str):
+        self.responses[key] = text
+        self.recorded += 1
+        return SimpleNamespace(text=text)
+
+    def generate_content(self, model: str, contents: str, config=None):
+        key, text = self._replay(model, contents, config)
+        if text is not None:
+            return SimpleNamespace(text=text)
+        response = self.record_with.models.generate_content(model=model, contents=contents, config=config)
+        return self._store(key, response.text)
+
+    async def agenerate_content(self, model: str, contents: str, config=None):
+        key, text = self._replay(model, contents, config)
+        if text is not None:
+            return SimpleNamespace(text=text)
+        response = await self.record_with.aio.models.generate_content(model=model, contents=contents, config=config)
+        return self._store(key, response.text)
+
+    def client(self):
+        """Object with the genai client's generate_content methods, for llm.client"""
+        return SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content),
+                               aio=SimpleNamespace(models=SimpleNamespace(generate_content=self.agenerate_content)))
+
+    def save(self) -> None:
+        self.path.write_text(json.dumps(self.responses, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+
+
+class InProcessRuntime(AgentRuntime):
+    """AgentRuntime talking to a FastMCP server in this process instead of a spawned one"""
+
+    def __init__(self, server: FastMCP, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    async def connect(self, stack):
+        client_streams, (server_read, server_write) = await stack.enter_async_context(
+            create_client_server_memory_streams())
+        task_group = await stack.enter_async_context(anyio.create_task_group())
+        lowlevel = self.server._mcp_server
+        task_group.start_soon(lowlevel.run, server_read, server_write, lowlevel.create_initialization_options())
+        stack.callback(task_group.cancel_scope.cancel)  # runs before the task group exits
+        return client_streams
+
+
+def parse_outcomes(outcome: str) -> int:
+    return sum(n for (_, o), n in structured_output.PARSE_STATS.items() if o == outcome)
+
+
+async def bench(queries: list[str], repeat: int, mode: str, structured: bool, verbose: bool,
+                templates: PlanTemplateCache | None = None) -> list[dict]:
+    """One row per query run, from the spans it recorded; templates are kept across runs"""
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    parses = []  # (failed, repaired) per run
+    with quiet:
+        async with InProcessRuntime(bench_server, mode=mode, speculative=False, structured=structured,
+                                    templates=templates is not None, template_cache=templates) as runtime:
+            for r in range(repeat):
+                for i, query in enumerate(queries):
+                    runtime.memory = StubSessionMemory()
+                    runtime.tool_cache = ToolResultCache(path=None)
+                    before = parse_outcomes("failed"), parse_outcomes("repaired")
+                    await run_query(runtime, query, speculative=False)
+                    parses.append((parse_outcomes("failed") - before[0], parse_outcomes("repaired") - before[1]))
+
+    rows = []
+    tracing.flush()
+    spans = load_spans(tracing.TRACE_PATH)
+    roots = [s for s in spans if s["parent_id"] is None and s["name"] == "query"]
+    for n, root in enumerate(roots):
+        trace = [s for s in spans if s["trace_id"] == root["trace_id"]]
+        rows.append({
+            "query": queries[n % len(queries)],
+            "steps": sum(s["name"] == "step" for s in trace),
+            "llm_calls": root["attributes"]["llm_calls"],
+            "tool_calls": sum(s["name"] == "tool" for s in trace),
+            "embeds": sum(s["name"] == "memory.embed" for s in trace),
+            "answered": root["attributes"]["answered"],
+            "parse_failed": parses[n][0],
+            "repaired": parses[n][1],
+            "wall_ms": root["duration_ms"],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mode", choices=PLANNING_MODES, default="two_call")
+    parser.add_argument("--structured", action="store_true", help="schema-constrained LLM replies (structured.py)")
+    parser.add_argument("--templates", action="store_true", help="record and replay plan templates (plan_templates.py)")
+    parser.add_argument("--cassette", type=Path, default=CASSETTE_PATH)
+    parser.add_argument("--record", action="store_true", help="send prompts missing from the cassette to Gemini")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's log")
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette, record_with=llm.get_client() if args.record else None)
+    llm.client = cassette.client()
+    llm_cache.CACHE = None  # every prompt goes to the cassette, so LLM calls are counted
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Spans stay out of the working tree
+        os.chdir(tmp)
+        tracing.TRACE_PATH = Path(tmp) / "traces.jsonl"
+        tracing.TRACING_ENABLED = True
+        try:
+            templates = PlanTemplateCache(path=None) if args.templates else None
+            rows = asyncio.run(bench(args.queries, args.repeat, args.mode, args.structured, args.verbose, templates))
+        finally:
+            os.chdir(cwd)
+    if cassette.recorded:
+        cassette.save()
+        print(f"Recorded {cassette.recorded} responses to {args.cassette}")
+
+    options = "".join(f", {name}" for name in ("structured", "templates") if getattr(args, name))
+    print(f"\n{len(args.queries)} queries x {args.repeat}, {args.mode}{options}, hand-authored cassette")
+    print(f"{'query':<52}{'steps':>6}{'LLM':>5}{'tools':>6}{'embeds':>7}{'bad parse':>10}{'repaired':>9}"
+          f"{'answered':>9}{'p50 ms':>9}{'max ms':>9}")
+    for query in args.queries:
+        runs = [r for r in rows if r["query"] == query]
+        wall = [r["wall_ms"] for r in runs]
+        print(f"{query[:50]:<52}{statistics.mean(r['steps'] for r in runs):>6.1f}"
+              f"{statistics.mean(r['llm_calls'] for r in runs):>5.1f}{statistics.mean(r['tool_calls'] for r in runs):>6.1f}"
+              f"{statistics.mean(r['embeds'] for r in runs):>7.1f}"
+              f"{sum(r['parse_failed'] for r in runs):>10}{sum(r['repaired'] for r in runs):>9}"
+              f"{sum(r['answered'] for r in runs):>6}/{len(runs):<2}{percentile(wall, 50):>9.1f}{max(wall):>9.1f}")
+    print(f"{'total':<52}{sum(r['steps'] for r in rows):>6}{sum(r['llm_calls'] for r in rows):>5}"
+          f"{sum(r['tool_calls'] for r in rows):>6}{sum(r['embeds'] for r in rows):>7}"
+          f"{sum(r['parse_failed'] for r in rows):>10}"
+          f"{sum(r['repaired'] for r in rows):>9}{'':>9}{sum(r['wall_ms'] for r in rows):>9.1f}")
+    if templates is not None:
+        print(templates.summary())
+    print("LLM calls count the cassette's hand-authored replies, not a real model's")
+    if cassette.missing:
+        parser.exit(1, f"\n{cassette.missing} prompts were not in {args.cassette.name}; "
+                       f"the prompts changed, update the cassette or run with --record\n")
+
+
+if __name__ == "__main__":
+    main()
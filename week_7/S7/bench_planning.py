@@ -0,0 +1,74 @@
+"""LLM calls and latency per query: perception + planning (two calls) vs one fused call.
+
+Runs every query through agent.run_query on one warm AgentRuntime in each
+mode. Needs GEMINI_API_KEY, the Ollama embedder used by memory retrieval
+and the example3.py server.
+
+    python bench_planning.py
+    python bench_planning.py --repeat 3 "What is 2 to the power 10?"
+    python bench_planning.py --concurrent           # all queries of a round at once
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from mcp import StdioServerParameters
+
+import llm
+import llm_cache
+from agent import PLANNING_MODES, AgentRuntime, run_queries, run_query
+
+DEFAULT_QUERIES = [
+    "Find the ASCII values of characters in INDIA and then return sum of exponentials of those values.",
+    "How much Anmol singh paid for his DLF apartment via Capbridge?",
+    "What do you know about Don Tapscott and Anthony Williams?",
+    "What is the relationship between Gensol and Go-Auto?",
+]
+
+
+async def bench(queries: list[str], repeat: int, concurrent: bool) -> dict:
+    params = StdioServerParameters(command=sys.executable, args=["example3.py"], cwd=str(Path(__file__).parent))
+    rows = {mode: {"calls": [], "seconds": []} for mode in PLANNING_MODES}
+    async with AgentRuntime(params) as runtime:
+        for mode in PLANNING_MODES:
+            for _ in range(repeat):
+                if concurrent:
+                    calls_before = llm.total_calls()
+                    t0 = time.perf_counter()
+                    await run_queries(runtime, queries, mode=mode)
+                    rows[mode]["seconds"].append(time.perf_counter() - t0)
+                    rows[mode]["calls"].append((llm.total_calls() - calls_before) / len(queries))
+                    continue
+                for query in queries:
+                    calls_before = llm.total_calls()
+                    t0 = time.perf_counter()
+                    await run_query(runtime, query, mode=mode)
+                    rows[mode]["seconds"].append(time.perf_counter() - t0)
+                    rows[mode]["calls"].append(llm.total_calls() - calls_before)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="answer repeated prompts from the LLM cache")
+    parser.add_argument("--concurrent", action="store_true", help="run each round's queries together on one loop")
+    args = parser.parse_args()
+    if not args.cache:
+        # Every query must reach the model for a fair call count
+        llm_cache.CACHE = None
+
+    rows = asyncio.run(bench(args.queries, args.repeat, args.concurrent))
+    unit = "round" if args.concurrent else "query"
+    print(f"\n{len(args.queries)} queries x {args.repeat} per mode{' (concurrent)' if args.concurrent else ''}")
+    for mode, row in rows.items():
+        print(f"{mode:>9}: LLM calls/query {statistics.mean(row['calls']):4.1f}  "
+              f"latency per {unit} mean {statistics.mean(row['seconds']):6.2f} s  p50 {statistics.median(row['seconds']):6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
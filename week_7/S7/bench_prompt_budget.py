@@ -0,0 +1,95 @@
+"""Planning-call latency against prompt size, for several prompt token budgets.
+
+Runs every query through agent.run_query on one warm AgentRuntime once per
+budget and reads the planning LLM calls back from their trace spans: the
+prompt size, how often the prompt had to be trimmed and how long the call
+took. A second table buckets every planning call by prompt size. Needs
+GEMINI_API_KEY and the example3.py server; the LLM cache is bypassed.
+
+    python bench_prompt_budget.py
+    python bench_prompt_budget.py --budgets 0 1200 800 --repeat 3 --mode fused
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+from mcp import StdioServerParameters
+
+import llm_cache
+import prompt_budget
+import tracing
+from agent import PLANNING_MODES, AgentRuntime, run_query
+from bench_planning import DEFAULT_QUERIES
+from prompt_budget import CHARS_PER_TOKEN
+from tool_cache import ToolResultCache
+from trace_report import load_spans, percentile
+
+PLAN_SITES = ("plan", "perceive_and_plan")
+BUCKET_TOKENS = 250  # width of a prompt size bucket
+
+
+async def bench(queries: list[str], budgets: list[int], repeat: int, mode: str) -> dict[int, list[dict]]:
+    """Planning calls per budget: {"tokens", "ms", "trimmed"}"""
+    params = StdioServerParameters(command=sys.executable, args=["example3.py"], cwd=str(Path(__file__).parent))
+    calls = {}
+    async with AgentRuntime(params, mode=mode, speculative=False) as runtime:
+        for budget in budgets:
+            prompt_budget.PROMPT_TOKEN_BUDGET = budget
+            tracing.flush()
+            start = len(load_spans(tracing.TRACE_PATH)) if tracing.TRACE_PATH.exists() else 0
+            for _ in range(repeat):
+                for query in queries:
+                    runtime.tool_cache = ToolResultCache(path=None)  # every run makes the same tool calls
+                    await run_query(runtime, query)
+            tracing.flush()
+            spans = load_spans(tracing.TRACE_PATH)[start:]
+            plans = {s["span_id"]: s for s in spans if s["name"] == "plan"}
+            calls[budget] = [
+                {"tokens": s["attributes"]["prompt_chars"] / CHARS_PER_TOKEN, "ms": s["duration_ms"],
+                 "trimmed": plans.get(s["parent_id"], {}).get("attributes", {}).get("trimmed", False)}
+                for s in spans
+                if s["name"] == "llm" and s["attributes"].get("site") in PLAN_SITES and not s["attributes"]["cache_hit"]
+            ]
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 1500, 1000, 700],
+                        help="prompt token budgets to compare (0: no limit)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--mode", choices=PLANNING_MODES, default="two_call")
+    args = parser.parse_args()
+    llm_cache.CACHE = None  # every planning prompt must reach the model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracing.TRACE_PATH = Path(tmp) / "traces.jsonl"
+        tracing.TRACING_ENABLED = True
+        calls = asyncio.run(bench(args.queries, args.budgets, args.repeat, args.mode))
+
+    print(f"\n{len(args.queries)} queries x {args.repeat} per budget, {args.mode}, planning LLM calls")
+    print(f"{'budget':>8}{'calls':>7}{'trimmed':>9}{'mean tokens':>13}{'max tokens':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for budget, rows in calls.items():
+        if not rows:
+            print(f"{budget or 'none':>8}{0:>7}")
+            continue
+        ms = [r["ms"] for r in rows]
+        print(f"{budget or 'none':>8}{len(rows):>7}{sum(r['trimmed'] for r in rows):>9}"
+              f"{statistics.mean(r['tokens'] for r in rows):>13.0f}{max(r['tokens'] for r in rows):>12.0f}"
+              f"{percentile(ms, 50):>9.0f}{percentile(ms, 95):>9.0f}")
+
+    buckets = {}
+    for rows in calls.values():
+        for r in rows:
+            buckets.setdefault(int(r["tokens"] // BUCKET_TOKENS) * BUCKET_TOKENS, []).append(r["ms"])
+    print(f"\n{'prompt tokens':>15}{'calls':>7}{'p50 ms':>9}{'mean ms':>9}")
+    for low, ms in sorted(buckets.items()):
+        print(f"{f'{low}-{low + BUCKET_TOKENS - 1}':>15}{len(ms):>7}{percentile(ms, 50):>9.0f}{statistics.mean(ms):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
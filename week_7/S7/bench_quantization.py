@@ -0,0 +1,74 @@
+"""Memory, load time and recall@5 of each vector storage type.
+
+Converts the float32 document index to every type in vector_index.INDEX_TYPES,
+writes and re-reads it, and compares top-k against exact float32 search using
+stored chunk vectors (with a little noise) as queries.
+
+    python bench_quantization.py                          # faiss_index/index.bin
+    python bench_quantization.py --index ../other/index.bin --queries 500
+    python bench_quantization.py --synthetic 20000        # random 768-dim data
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from vector_index import INDEX_TYPES, MIN_TRAIN, convert_index, index_bytes, index_kind
+
+
+def synthetic_index(n: int, dim: int, seed: int) -> faiss.Index:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(64, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", type=Path, default=Path(__file__).parent / "faiss_index" / "index.bin")
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    source = synthetic_index(args.synthetic, 768, args.seed) if args.synthetic else faiss.read_index(str(args.index))
+    if index_kind(source) != "flat":
+        source = convert_index(source, "flat")
+    vectors = source.reconstruct_n(0, source.ntotal)
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(source.ntotal, min(args.queries, source.ntotal), replace=False)
+    noise = rng.normal(scale=0.01 * float(np.abs(vectors).mean()), size=(len(picks), source.d))
+    queries = (vectors[picks] + noise).astype(np.float32)
+    _, truth = source.search(queries, args.k)
+
+    print(f"{source.ntotal} vectors x {source.d} dims, {len(queries)} queries, recall@{args.k} vs exact float32")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in INDEX_TYPES:
+            if source.ntotal < MIN_TRAIN[kind]:
+                print(f"{kind:>5}: skipped, needs at least {MIN_TRAIN[kind]} vectors to train")
+                continue
+            t0 = time.perf_counter()
+            index = convert_index(source, kind)
+            build_s = time.perf_counter() - t0
+            path = Path(tmp) / f"{kind}.bin"
+            faiss.write_index(index, str(path))
+            t0 = time.perf_counter()
+            index = faiss.read_index(str(path))
+            load_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            _, found = index.search(queries, args.k)
+            search_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            print(f"{kind:>5}: vectors {index_bytes(index) / 2**20:8.2f} MiB  file {path.stat().st_size / 2**20:8.2f} MiB  "
+                  f"load {load_ms:7.1f} ms  build {build_s:6.2f} s  search {search_ms:.3f} ms/q  recall@{args.k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
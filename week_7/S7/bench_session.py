@@ -0,0 +1,59 @@
+"""Per-query latency: a fresh example3.py server per query vs one warm AgentRuntime.
+
+Each "query" here is the agent's fixed overhead plus one tool call (no LLM),
+so the difference is the spawn, initialize and list_tools that a warm
+session skips.
+
+    python bench_session.py                         # 5 queries, index_status
+    python bench_session.py --queries 10 --tool list_collections
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from mcp import StdioServerParameters
+
+from agent import AgentRuntime
+
+
+async def one_query(runtime: AgentRuntime, tool: str) -> float:
+    t0 = time.perf_counter()
+    await runtime.ensure_session()
+    await runtime.session.call_tool(tool, {})
+    return time.perf_counter() - t0
+
+
+async def bench(queries: int, tool: str) -> dict:
+    params = StdioServerParameters(command=sys.executable, args=["example3.py"], cwd=str(Path(__file__).parent))
+    cold = []
+    for _ in range(queries):
+        runtime = AgentRuntime(params)
+        try:
+            cold.append(await one_query(runtime, tool))
+        finally:
+            await runtime.close()
+    warm = []
+    async with AgentRuntime(params) as runtime:
+        for _ in range(queries):
+            warm.append(await one_query(runtime, tool))
+    return {"cold start": cold, "warm session": warm}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--tool", default="index_status", help="argument-free tool called once per query")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args.queries, args.tool))
+    print(f"\n{args.queries} queries per mode, tool={args.tool}")
+    for label, times in results.items():
+        ms = [t * 1000 for t in times]
+        print(f"{label:>13}: mean {statistics.mean(ms):9.1f} ms  p50 {statistics.median(ms):9.1f} ms  max {max(ms):9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
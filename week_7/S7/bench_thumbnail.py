@@ -0,0 +1,81 @@
+"""create_thumbnail benchmark: old raw-pixel path vs draft decode + PNG/WebP + LRU.
+
+    python bench_thumbnail.py ~/Pictures          # a folder of large photos
+    python bench_thumbnail.py --generate 10       # synthetic 4000x3000 JPEGs
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image as PILImage
+
+import example3
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def generate_photos(folder: Path, count: int, size=(4000, 3000)) -> None:
+    rng = np.random.default_rng(7)
+    w, h = size
+    gradient = np.linspace(0, 255, w, dtype=np.float32)
+    for i in range(count):
+        base = np.stack([gradient, gradient[::-1], np.full(w, 40.0 * i % 255)], axis=-1)
+        pixels = np.broadcast_to(base, (h, w, 3)) + rng.normal(0, 12, (h, w, 3))
+        PILImage.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(folder / f"photo_{i}.jpg", quality=90)
+
+
+def old_thumbnail(path: Path) -> bytes:
+    img = PILImage.open(path)
+    img.thumbnail((100, 100))
+    return img.tobytes()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return (time.perf_counter() - t0) * 1000, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", type=Path)
+    parser.add_argument("--generate", type=int, default=8, help="synthetic photos when no folder is given")
+    parser.add_argument("--format", default="png", choices=example3.THUMBNAIL_FORMATS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if folder is None:
+            folder = Path(tmp)
+            generate_photos(folder, args.generate)
+        photos = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not photos:
+            raise SystemExit(f"No images in {folder}")
+        mb = sum(p.stat().st_size for p in photos) / 2**20
+        print(f"{len(photos)} images ({mb:.1f} MiB) from {folder}, format={args.format}")
+
+        example3.render_thumbnail.cache_clear()
+        rows = {"old (decode + tobytes)": [], "new cold": [], "new cached": []}
+        sizes = {"old (decode + tobytes)": [], "new cold": []}
+        for path in photos:
+            ms, raw = timed(old_thumbnail, path)
+            rows["old (decode + tobytes)"].append(ms)
+            sizes["old (decode + tobytes)"].append(len(raw))
+            for label in ("new cold", "new cached"):
+                ms, image = timed(example3.create_thumbnail, str(path), args.format)
+                rows[label].append(ms)
+                if label == "new cold":
+                    sizes[label].append(len(image.data))
+
+        for label, times in rows.items():
+            payload = f"  payload mean {statistics.mean(sizes[label]) / 1024:6.1f} KiB" if label in sizes else ""
+            print(f"{label:>24}: mean {statistics.mean(times):8.2f} ms  p50 {statistics.median(times):8.2f} ms{payload}")
+        print(f"cache: {example3.render_thumbnail.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
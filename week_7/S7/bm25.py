@@ -0,0 +1,122 @@
+import math
+import re
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; keeps digits so ids and amounts stay searchable"""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over document chunks.
+
+    Chunk ids are positions in the FAISS metadata list, so both indexes
+    can be fused and filtered with the same ids.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lens: List[int] = []
+        self.total_len = 0
+        self.n_postings = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lens)
+
+    def add(self, text: str) -> int:
+        """Index one chunk and return its id"""
+        chunk_id = len(self.doc_lens)
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.n_postings += len(counts)
+        self.doc_lens.append(len(tokens))
+        self.total_len += len(tokens)
+        return chunk_id
+
+    def add_many(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            self.add(text)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Drop chunks and renumber the rest so ids stay aligned with the FAISS index"""
+        removed = set(int(i) for i in ids)
+        remap: Dict[int, int] = {}
+        doc_lens: List[int] = []
+        for old_id, length in enumerate(self.doc_lens):
+            if old_id not in removed:
+                remap[old_id] = len(doc_lens)
+                doc_lens.append(length)
+        postings: Dict[str, Dict[int, int]] = {}
+        for term, plist in self.postings.items():
+            kept = {remap[cid]: tf for cid, tf in plist.items() if cid in remap}
+            if kept:
+                postings[term] = kept
+        self.postings = postings
+        self.doc_lens = doc_lens
+        self.total_len = sum(doc_lens)
+        self.n_postings = sum(len(plist) for plist in postings.values())
+
+    def approx_bytes(self) -> int:
+        """Rough resident size; dict entries dominate at ~100 bytes per posting"""
+        return 100 * self.n_postings + 60 * len(self.postings) + 8 * len(self.doc_lens)
+
+    def search(self, query: str, top_k: int = 5, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """Return (chunk id, score) pairs, best first"""
+        n_docs = len(self.doc_lens)
+        if n_docs == 0:
+            return []
+        avgdl = self.total_len / n_docs or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for chunk_id, tf in plist.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[chunk_id] / avgdl)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self) -> dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lens": self.doc_lens,
+            "postings": {term: list(plist.items()) for term, plist in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.doc_lens = list(data["doc_lens"])
+        index.total_len = sum(index.doc_lens)
+        index.postings = {term: {int(cid): tf for cid, tf in plist} for term, plist in data["postings"].items()}
+        index.n_postings = sum(len(plist) for plist in index.postings.values())
+        return index
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "BM25Index":
+        index = cls()
+        index.add_many(texts)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse several ranked id lists; rank-based so BM25 and L2 scores need no calibration"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
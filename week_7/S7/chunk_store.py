@@ -0,0 +1,183 @@
+import json
+import mmap
+import os
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+
+
+class ChunkStore(Sequence):
+    """Columnar, memory-mapped replacement for the chunk list in metadata.json.
+
+    Chunk text lives back to back in a UTF-8 arena file that is mmapped on
+    load, so a search only decodes the k chunks it returns. Per-chunk columns
+    (byte offsets, doc ids, chunk sequence numbers) are small .npy arrays.
+    Items read like the old metadata entries: {"doc", "chunk", "chunk_id"}.
+    """
+
+    ARENA = "chunks.bin"
+    OFFSETS = "chunk_offsets.npy"
+    DOC_IDS = "chunk_doc_ids.npy"
+    SEQS = "chunk_seqs.npy"
+    DOCS = "chunk_docs.json"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.docs: List[str] = []
+        self._doc_lookup = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.seqs = np.zeros(0, dtype=np.int32)
+        self._arena: Optional[mmap.mmap] = None
+        self._arena_size = 0  # bytes of the arena that are on disk
+        self._pending = bytearray()  # bytes appended since the last save
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        directory = Path(directory)
+        return all((directory / name).exists() for name in (cls.ARENA, cls.OFFSETS, cls.DOC_IDS, cls.SEQS, cls.DOCS))
+
+    @classmethod
+    def load(cls, directory: Path) -> "ChunkStore":
+        store = cls(directory)
+        store.docs = json.loads((store.directory / cls.DOCS).read_text())
+        store._doc_lookup = {name: i for i, name in enumerate(store.docs)}
+        store.offsets = np.load(store.directory / cls.OFFSETS)
+        store.doc_ids = np.load(store.directory / cls.DOC_IDS)
+        store.seqs = np.load(store.directory / cls.SEQS)
+        store._arena_size = int(store.offsets[-1])
+        store._open_arena()
+        return store
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], directory: Path) -> "ChunkStore":
+        """Write a fresh store from metadata-style dicts, replacing any existing one"""
+        store = cls(directory)
+        store.extend(records)
+        store.save()
+        return store
+
+    @classmethod
+    def from_json(cls, json_path: Path, directory: Optional[Path] = None) -> "ChunkStore":
+        """Convert a legacy metadata.json into the binary layout next to it"""
+        json_path = Path(json_path)
+        return cls.from_records(json.loads(json_path.read_text()), directory or json_path.parent)
+
+    def _open_arena(self) -> None:
+        self.close()
+        if self._arena_size > 0:
+            with open(self.directory / self.ARENA, "rb") as f:
+                self._arena = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if self._arena is not None:
+            self._arena.close()
+            self._arena = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def resident_bytes(self) -> int:
+        """Heap used by the columns and unsaved text; the mmapped arena is left to the page cache"""
+        return self.offsets.nbytes + self.doc_ids.nbytes + self.seqs.nbytes + len(self._pending)
+
+    def _raw(self, i: int) -> bytes:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if end <= self._arena_size:
+            return self._arena[start:end]
+        return bytes(self._pending[start - self._arena_size:end - self._arena_size])
+
+    def text(self, i: int) -> str:
+        return self._raw(i).decode("utf-8")
+
+    def doc(self, i: int) -> str:
+        return self.docs[int(self.doc_ids[i])]
+
+    def chunk_id(self, i: int) -> str:
+        return f"{Path(self.doc(i)).stem}_{int(self.seqs[i])}"
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {"doc": self.doc(i), "chunk": self.text(i), "chunk_id": self.chunk_id(i)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, records: Iterable[dict]) -> None:
+        doc_ids, seqs, lengths = [], [], []
+        for record in records:
+            doc = record["doc"]
+            if doc not in self._doc_lookup:
+                self._doc_lookup[doc] = len(self.docs)
+                self.docs.append(doc)
+            encoded = record["chunk"].encode("utf-8")
+            self._pending += encoded
+            doc_ids.append(self._doc_lookup[doc])
+            seqs.append(int(record["chunk_id"].rsplit("_", 1)[1]))
+            lengths.append(len(encoded))
+        if not lengths:
+            return
+        new_offsets = self.offsets[-1] + np.cumsum(lengths, dtype=np.int64)
+        self.offsets = np.concatenate([self.offsets, new_offsets])
+        self.doc_ids = np.concatenate([self.doc_ids, np.array(doc_ids, dtype=np.int32)])
+        self.seqs = np.concatenate([self.seqs, np.array(seqs, dtype=np.int32)])
+
+    def append(self, record: dict) -> None:
+        self.extend([record])
+
+    def remove(self, ids) -> None:
+        """Drop rows; later rows shift down like FAISS remove_ids on a flat index.
+
+        The arena is compacted in memory and rewritten by the next save().
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.asarray(ids, dtype=np.int64)] = False
+        kept = bytearray()
+        for i in np.flatnonzero(keep):
+            kept += self._raw(int(i))
+        lengths = np.diff(self.offsets)[keep]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+        self.doc_ids = self.doc_ids[keep]
+        self.seqs = self.seqs[keep]
+        self.close()
+        self._arena_size = 0
+        self._pending = kept
+
+    def ids_for_docs(self, docs: Iterable[str]) -> Set[int]:
+        wanted = [self._doc_lookup[d] for d in docs if d in self._doc_lookup]
+        return set(np.flatnonzero(np.isin(self.doc_ids, wanted)).tolist())
+
+    def save(self) -> None:
+        """Append pending text to the arena and rewrite the (small) columns"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        arena_path = self.directory / self.ARENA
+        self.close()
+        with open(arena_path, "ab") as f:
+            # Drop bytes from a previous store that this one never loaded
+            f.truncate(self._arena_size)
+            f.write(self._pending)
+        self._arena_size += len(self._pending)
+        self._pending = bytearray()
+        for name, column in ((self.OFFSETS, self.offsets), (self.DOC_IDS, self.doc_ids), (self.SEQS, self.seqs)):
+            tmp = self.directory / (name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, column)
+            os.replace(tmp, self.directory / name)
+        (self.directory / self.DOCS).write_text(json.dumps(self.docs))
+        self._open_arena()
+
+
+if __name__ == "__main__":
+    # Convert an existing index: python chunk_store.py [faiss_index/metadata.json]
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "faiss_index" / "metadata.json"
+    converted = ChunkStore.from_json(source)
+    print(f"Converted {len(converted)} chunks from {source} into {converted.directory}")
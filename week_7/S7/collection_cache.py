@@ -0,0 +1,82 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_collection_name(name: str) -> str:
+    """Collection names become directory names, so keep them to a safe charset"""
+    if not COLLECTION_NAME_RE.match(name or ""):
+        raise ValueError(f"Invalid collection name '{name}': use letters, digits, '_' or '-'")
+    return name
+
+
+class LRUBudgetCache:
+    """Loaded objects by name, evicting the least recently used ones past a byte budget.
+
+    Sizes are measured again on every enforce() because loaded indexes keep
+    growing as documents are added. The most recently used entry is never
+    evicted, so a single collection larger than the budget still works.
+    """
+
+    def __init__(self, budget_bytes: int, sizer: Callable[[Any], int],
+                 on_evict: Optional[Callable[[str, Any], None]] = None,
+                 can_evict: Optional[Callable[[Any], bool]] = None):
+        self.budget_bytes = budget_bytes
+        self.sizer = sizer
+        self.on_evict = on_evict
+        self.can_evict = can_evict
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._items
+
+    def get(self, name: str) -> Any:
+        with self._lock:
+            obj = self._items.get(name)
+            if obj is not None:
+                self._items.move_to_end(name)
+            return obj
+
+    def put(self, name: str, obj: Any) -> None:
+        with self._lock:
+            self._items[name] = obj
+            self._items.move_to_end(name)
+        self.enforce(keep=name)
+
+    def pop(self, name: str) -> Any:
+        with self._lock:
+            return self._items.pop(name, None)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._items)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(self.sizer(obj) for obj in self._items.values())
+
+    def enforce(self, keep: Optional[str] = None) -> List[str]:
+        """Evict cold entries until the loaded set fits the budget; returns evicted names"""
+        evicted = []
+        with self._lock:
+            if keep is None and self._items:
+                keep = next(reversed(self._items))
+            total = sum(self.sizer(obj) for obj in self._items.values())
+            for name in list(self._items):
+                if total <= self.budget_bytes:
+                    break
+                obj = self._items[name]
+                if name == keep or (self.can_evict and not self.can_evict(obj)):
+                    continue
+                total -= self.sizer(obj)
+                del self._items[name]
+                evicted.append((name, obj))
+        for name, obj in evicted:
+            if self.on_evict:
+                self.on_evict(name, obj)
+        return [name for name, _ in evicted]
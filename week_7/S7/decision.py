@@ -1,11 +1,16 @@
 from perception import PerceptionResult
 from memory import MemoryItem, MemoryManager
-from typing import List, Optional
-from dotenv import load_dotenv
-from google import genai
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+import json
 import os
 import re
 from models import SearchInput, SearchOutput, HighlightInput, HighlightOutput
+from structured import agenerate_structured, record_parse
+from prompt_budget import compact_tool_descriptions, estimate_tokens, fit_items
+import prompt_budget
+import llm
+import tracing
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -16,8 +21,69 @@ except ImportError:
         now = datetime.datetime.now().strftime("%H:%M:%S")
         print(f"[{now}] [{stage}] {msg}")
 
-load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+class PlanStep(BaseModel):
+    """Structured output of the fused perception + planning call"""
+    intent: Optional[str] = None
+    entities: List[str] = []
+    tool_hint: Optional[str] = None
+    action: str
+
+# FUNCTION_CALL lines the planner may put in one step; they are executed concurrently
+MAX_PARALLEL_CALLS = int(os.getenv("AGENT_MAX_PARALLEL_CALLS", "3"))
+
+class ToolCallSpec(BaseModel):
+    tool_name: Optional[str] = None
+    arguments: Optional[str] = None  # JSON object with the tool's parameters, e.g. {"input": {"string": "INDIA"}}
+
+    def check(self, tool_names: Optional[List[str]] = None) -> None:
+        if not self.tool_name:
+            raise ValueError("a function_call needs tool_name")
+        if tool_names and self.tool_name not in tool_names:
+            raise ValueError(f"unknown tool '{self.tool_name}', use one of: {', '.join(tool_names)}")
+        if not isinstance(json.loads(self.arguments or "{}"), dict):
+            raise ValueError("arguments must be a JSON object")
+
+    def to_line(self) -> str:
+        return f"FUNCTION_CALL: {self.tool_name}|{json.dumps(json.loads(self.arguments or '{}'))}"
+
+class PlanAction(ToolCallSpec):
+    """One step in structured-output mode: tool calls or the final answer"""
+    type: Literal["function_call", "final_answer"]
+    answer: Optional[str] = None
+    parallel_calls: List[ToolCallSpec] = []  # independent calls run in the same step
+
+    def check(self, tool_names: Optional[List[str]] = None) -> None:
+        """Raise ValueError if the step can't be executed as given"""
+        if self.type == "final_answer":
+            if not self.answer:
+                raise ValueError("a final_answer needs a non-empty answer")
+            return
+        for call in [self, *self.parallel_calls]:
+            ToolCallSpec.check(call, tool_names)
+
+    def to_plan_line(self) -> str:
+        """The FUNCTION_CALL / FINAL_ANSWER line(s) the agent loop and execute_tools expect"""
+        if self.type == "final_answer":
+            answer = self.answer.strip()
+            return f"FINAL_ANSWER: {answer if answer.startswith('[') else f'[{answer}]'}"
+        return "\n".join(call.to_line() for call in [self, *self.parallel_calls])
+
+class FusedPlanAction(PlanAction):
+    """Structured output of the fused call in structured-output mode"""
+    intent: Optional[str] = None
+    entities: List[str] = []
+    tool_hint: Optional[str] = None
+
+STRUCTURED_REPLY = """Reply with a JSON object instead of a FUNCTION_CALL or FINAL_ANSWER line:
+- type: "function_call" or "final_answer"
+- tool_name: the tool to call (function_call only)
+- arguments: the tool's parameters as a JSON object in a string, nested as in the examples, e.g. {"input": {"string": "INDIA"}}
+- answer: your final result (final_answer only)
+- parallel_calls: other independent calls for this step, each with tool_name and arguments (function_call only)"""
+
+def tool_names(tool_descriptions: Optional[str]) -> List[str]:
+    return re.findall(r"^- (\w+):", tool_descriptions or "", re.MULTILINE)
 
 class Decision:
     def __init__(self, memory_manager: MemoryManager):
@@ -47,18 +113,70 @@ class Decision:
             print(f"Error in text highlighting: {e}")
             return HighlightOutput(highlighted_text=input_data.text)
 
-def generate_plan(
-    perception: PerceptionResult,
-    memory_items: List[MemoryItem],
-    tool_descriptions: Optional[str] = None
-) -> str:
-    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory."""
+# Worked example of a search followed by an answer; the first thing cut from an over-budget prompt
+WORKED_EXAMPLE = """✅ Examples:
+- User asks: "What's the relationship between Cricket and Sachin Tendulkar"
+  - FUNCTION_CALL: search_documents|query="relationship between Cricket and Sachin Tendulkar"
+  - [receives a detailed document]
+  - FINAL_ANSWER: [Sachin Tendulkar is widely regarded as the "God of Cricket" due to his exceptional skills, longevity, and impact on the sport in India. He is the leading run-scorer in both Test and ODI cricket, and the first to score 100 centuries in international cricket. His influence extends beyond his statistics, as he is seen as a symbol of passion, perseverance, and a national icon. ]
+
+
+"""
+
+def build_plan_prompt(input_summary: str, memory_items: List[MemoryItem], tool_descriptions: Optional[str] = None,
+                      max_calls: int = MAX_PARALLEL_CALLS, budget: Optional[int] = None) -> str:
+    """The planning prompt, trimmed to about budget estimated tokens (default AGENT_PROMPT_TOKENS, 0: no limit).
+
+    Over budget, the worked example goes first, then every tool description
+    is cut to one line, then memories are truncated or dropped, least
+    relevant (last retrieved) first.
+    """
+    budget = prompt_budget.PROMPT_TOKEN_BUDGET if budget is None else budget
+    memories = [m.text for m in memory_items]
+    worked_example = WORKED_EXAMPLE
+    trimmed = []
+
+    def render() -> str:
+        return plan_prompt(input_summary, memories, tool_descriptions, max_calls, worked_example)
+
+    prompt = render()
+    if budget and estimate_tokens(prompt) > budget:
+        worked_example = ""
+        trimmed.append("example")
+        prompt = render()
+    if budget and estimate_tokens(prompt) > budget and tool_descriptions:
+        tool_descriptions = compact_tool_descriptions(tool_descriptions)
+        trimmed.append("tool descriptions")
+        prompt = render()
+    if budget and estimate_tokens(prompt) > budget and memories:
+        all_memories, memories = memories, []
+        memories, cut = fit_items(all_memories, budget - estimate_tokens(render()))
+        trimmed.append(f"{cut} of {len(all_memories)} memories")
+        prompt = render()
 
-    memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
+    tokens = estimate_tokens(prompt)
+    log("plan", f"Prompt ~{tokens} tokens" + (f" (budget {budget}, trimmed {', '.join(trimmed)})" if trimmed else ""))
+    span = tracing.current_span()
+    if span is not None:
+        span.set(prompt_tokens=tokens, trimmed=bool(trimmed))
+    return prompt
+
+def plan_prompt(input_summary: str, memories: List[str], tool_descriptions: Optional[str], max_calls: int,
+                worked_example: str) -> str:
+    memory_texts = "\n".join(f"- {text}" for text in memories) or "None"
 
     tool_context = f"\nYou have access to the following tools:\n{tool_descriptions}" if tool_descriptions else ""
 
-    prompt = f"""
+    format_rule = (f"Respond each step with EITHER one FINAL_ANSWER line OR 1 to {max_calls} FUNCTION_CALL lines "
+                   f"(one per line), never both."
+                   if max_calls > 1 else "Respond using EXACTLY ONE of the formats above per step.")
+
+    parallel_rule = (f"\n- ⚡ Independent lookups (e.g. search_documents for two different entities) go in ONE step: "
+                     f"up to {max_calls} FUNCTION_CALL lines, one per line, run in parallel. "
+                     f"Never put calls that need each other's output in the same step."
+                     if max_calls > 1 else "")
+
+    return f"""
 You are a reasoning-driven AI agent with access to tools. Your job is to solve the user's request step-by-step by reasoning through the problem, selecting a tool if needed, and continuing until the FINAL_ANSWER is produced.{tool_context}
 
 Always follow this loop:
@@ -70,35 +188,26 @@ Always follow this loop:
    FINAL_ANSWER: [your final result]
 
 Guidelines:
-- Respond using EXACTLY ONE of the formats above per step.
-- Do NOT include extra text, explanation, or formatting.
+- {format_rule}
+- Do NOT include any other text, explanation, or formatting around those lines.
 - Use nested keys (e.g., input.string) and square brackets for lists.
 - You can reference these relevant memories:
 {memory_texts}
 
-Input Summary:
-- User input: "{perception.user_input}"
-- Intent: {perception.intent}
-- Entities: {', '.join(perception.entities)}
-- Tool hint: {perception.tool_hint or 'None'}
+{input_summary}
 
 ✅ Examples:
 - FUNCTION_CALL: add|a=5|b=3
 - FUNCTION_CALL: strings_to_chars_to_int|input.string=INDIA
 - FUNCTION_CALL: int_list_to_exponential_sum|input.int_list=[73,78,68,73,65]
+- FUNCTION_CALL: evaluate_pipeline|input.steps=[{{"id": "codes", "op": "strings_to_chars_to_int", "args": {{"string": "INDIA"}}}}, {{"id": "total", "op": "int_list_to_exponential_sum", "args": {{"int_list": "$codes"}}}}]
 - FINAL_ANSWER: [42]
 
-✅ Examples:
-- User asks: "What's the relationship between Cricket and Sachin Tendulkar"
-  - FUNCTION_CALL: search_documents|query="relationship between Cricket and Sachin Tendulkar"
-  - [receives a detailed document]
-  - FINAL_ANSWER: [Sachin Tendulkar is widely regarded as the "God of Cricket" due to his exceptional skills, longevity, and impact on the sport in India. He is the leading run-scorer in both Test and ODI cricket, and the first to score 100 centuries in international cricket. His influence extends beyond his statistics, as he is seen as a symbol of passion, perseverance, and a national icon. ]
-
-
-IMPORTANT:
+{worked_example}IMPORTANT:
 - 🚫 Do NOT invent tools. Use only the tools listed below.
 - 📄 If the question may relate to factual knowledge, use the 'search_documents' tool to look for the answer.
 - 🧮 If the question is mathematical or needs calculation, use the appropriate math tool.
+- 🔗 If a calculation needs several math tools in a row, do it in ONE step with 'evaluate_pipeline' ("$id" passes an earlier step's result).{parallel_rule}
 - 🤖 If the previous tool output already contains factual information, DO NOT search again. Instead, summarize the relevant facts and respond with: FINAL_ANSWER: [your answer]
 - Only repeat `search_documents` if the last result was irrelevant or empty.
 - ❌ Do NOT repeat function calls with the same parameters.
@@ -108,20 +217,130 @@ IMPORTANT:
 - ✅ You have only 3 attempts. Final attempt must be FINAL_ANSWER]
 """
 
+def action_lines(raw: str, max_calls: int = MAX_PARALLEL_CALLS) -> str:
+    """The step to execute: the first FINAL_ANSWER line, or up to max_calls distinct FUNCTION_CALL lines"""
+    first = first_action_line(raw)
+    if not first.startswith("FUNCTION_CALL:"):
+        return first
+    calls = [line.strip() for line in raw.splitlines() if line.strip().startswith("FUNCTION_CALL:")]
+    return "\n".join(list(dict.fromkeys(calls))[:max_calls])
+
+def first_action_line(raw: str) -> str:
+    for line in raw.splitlines():
+        if line.strip().startswith("FUNCTION_CALL:") or line.strip().startswith("FINAL_ANSWER:"):
+            return line.strip()
+
+    return raw.strip()
+
+def gave_up(plan: str) -> bool:
+    """The FINAL_ANSWER: [unknown] the planner falls back to when no tool fits"""
+    return bool(re.fullmatch(r"FINAL_ANSWER:\s*\[?unknown\]?", plan.strip(), re.IGNORECASE))
+
+def cacheable_plan(raw: str) -> bool:
+    """A reply worth caching: an executable step, not a malformed or give-up one that would stick for the TTL"""
+    plan = action_lines(raw)
+    return plan.startswith(("FUNCTION_CALL:", "FINAL_ANSWER:")) and not gave_up(plan)
+
+def cacheable_step(raw: str) -> bool:
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        raw = response.text.strip()
-        log("plan", f"LLM output: {raw}")
+        return cacheable_plan(PlanStep.model_validate_json(raw).action)
+    except ValueError:
+        return False
+
+async def generate_plan(
+    perception: PerceptionResult,
+    memory_items: List[MemoryItem],
+    tool_descriptions: Optional[str] = None,
+    use_cache: bool = True,
+    structured: bool = False
+) -> str:
+    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory.
+
+    With structured=True the reply is a PlanAction constrained by its JSON
+    schema and validated against the tool list, with one repair call.
+    """
 
-        for line in raw.splitlines():
-            if line.strip().startswith("FUNCTION_CALL:") or line.strip().startswith("FINAL_ANSWER:"):
-                return line.strip()
+    input_summary = f"""Input Summary:
+- User input: "{perception.user_input}"
+- Intent: {perception.intent}
+- Entities: {', '.join(perception.entities)}
+- Tool hint: {perception.tool_hint or 'None'}"""
+    if structured:
+        input_summary += "\n\n" + STRUCTURED_REPLY
+    prompt = build_plan_prompt(input_summary, memory_items, tool_descriptions)
+
+    try:
+        if structured:
+            names = tool_names(tool_descriptions)
+            action = await agenerate_structured(prompt, "plan", PlanAction, check=lambda a: a.check(names),
+                                                use_cache=use_cache, cacheable=lambda a: not gave_up(a.to_plan_line()))
+            log("plan", f"LLM output: {action.model_dump_json(exclude_none=True)}")
+            return action_lines(action.to_plan_line())
 
-        return raw.strip()
+        raw = await llm.agenerate(prompt, site="plan", use_cache=use_cache, accept=cacheable_plan)
+        log("plan", f"LLM output: {raw}")
+        plan = action_lines(raw)
+        record_parse("plan", "valid" if plan.startswith(("FUNCTION_CALL:", "FINAL_ANSWER:")) else "failed")
+        return plan
 
     except Exception as e:
         log("plan", f"⚠️ Decision generation failed: {e}")
         return "FINAL_ANSWER: [unknown]"
+
+async def perceive_and_plan(
+    user_input: str,
+    memory_items: List[MemoryItem],
+    tool_descriptions: Optional[str] = None,
+    use_cache: bool = True,
+    structured: bool = False
+) -> tuple[PerceptionResult, str]:
+    """Perception and planning in one structured-output LLM call instead of two.
+
+    structured=True asks for a FusedPlanAction (fields instead of an action
+    line), validated and repaired like generate_plan's.
+    """
+
+    if structured:
+        reply_format = STRUCTURED_REPLY + "\n- intent, entities, tool_hint: as extracted above"
+    else:
+        reply_format = """Reply with a JSON object with the keys intent, entities, tool_hint and action,
+where action is your step in the formats above (FUNCTION_CALL lines separated by newlines)."""
+    input_summary = f"""Input Summary:
+- User input: "{user_input}"
+
+Before choosing the step, extract from the user input:
+- intent: a brief phrase about what the user wants
+- entities: a list of strings with the keywords or values (e.g., ["INDIA", "ASCII"])
+- tool_hint: the name of the tool that might be useful, or null
+
+{reply_format}"""
+    prompt = build_plan_prompt(input_summary, memory_items, tool_descriptions)
+
+    try:
+        if structured:
+            names = tool_names(tool_descriptions)
+            step = await agenerate_structured(prompt, "perceive_and_plan", FusedPlanAction,
+                                              check=lambda a: a.check(names), use_cache=use_cache,
+                                              cacheable=lambda a: not gave_up(a.to_plan_line()))
+            log("plan", f"LLM output: {step.model_dump_json(exclude_none=True)}")
+            action = action_lines(step.to_plan_line())
+        else:
+            raw = await llm.agenerate(prompt, site="perceive_and_plan",
+                               config={"response_mime_type": "application/json", "response_schema": PlanStep},
+                               use_cache=use_cache, accept=cacheable_step)
+            log("plan", f"LLM output: {raw}")
+            try:
+                step = PlanStep.model_validate_json(raw)
+            except ValueError:
+                record_parse("perceive_and_plan", "failed")
+                raise
+            action = action_lines(step.action)
+            record_parse("perceive_and_plan",
+                         "valid" if action.startswith(("FUNCTION_CALL:", "FINAL_ANSWER:")) else "failed")
+        perception = PerceptionResult(user_input=user_input, intent=step.intent,
+                                      entities=step.entities, tool_hint=step.tool_hint)
+        return perception, action
+
+    except Exception as e:
+        log("plan", f"⚠️ Fused perception and planning failed: {e}")
+        return PerceptionResult(user_input=user_input, intent=None), "FINAL_ANSWER: [unknown]"
@@ -13,10 +13,19 @@ from pathlib import Path
 import requests
 from markitdown import MarkItDown
 import time
-from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput
+from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput, PipelineInput, PipelineOutput
 from PIL import Image as PILImage
 from tqdm import tqdm
 import hashlib
+import threading
+import io
+from contextlib import contextmanager
+from functools import lru_cache
+from bm25 import BM25Index, reciprocal_rank_fusion
+from chunk_store import ChunkStore
+from math_pipeline import run_pipeline
+from vector_index import INDEX_TYPES, index_bytes, index_kind, maybe_convert, supports_selector
+from collection_cache import COLLECTION_NAME_RE, DEFAULT_COLLECTION, LRUBudgetCache, validate_collection_name
 
 
 mcp = FastMCP("Calculator")
@@ -26,6 +35,209 @@ EMBED_MODEL = "nomic-embed-text"
 CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
 ROOT = Path(__file__).parent.resolve()
+# The default collection keeps the original layout; named ones live in collections/<name>/
+DOC_PATH = ROOT / "documents"
+INDEX_CACHE = ROOT / "faiss_index"
+COLLECTIONS_DIR = ROOT / "collections"
+# Loaded collections past this budget are unloaded, least recently used first
+COLLECTION_MEMORY_BUDGET_MB = float(os.getenv("COLLECTION_MEMORY_BUDGET_MB", "1024"))
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+# Vector storage for new indexes: flat (float32), fp16, sq8 or pq; see vector_index.py
+INDEX_TYPE = os.getenv("DOC_INDEX_TYPE", "flat")
+MMR_LAMBDA = 0.5  # 1.0 = pure relevance, 0.0 = pure diversity
+WATCH_INTERVAL = 2.0  # seconds between polls of the documents folder in --watch mode
+WATCH_DEBOUNCE = 3.0  # changes must be quiet this long before they are indexed
+THUMBNAIL_SIZE = (100, 100)
+THUMBNAIL_FORMATS = ("png", "webp")
+THUMBNAIL_CACHE_SIZE = 256
+SERVER_STARTED_AT = time.monotonic()
+
+
+class IndexState:
+    """In-memory index of one collection, shared by the tools and the background indexer"""
+
+    def __init__(self, name: str = DEFAULT_COLLECTION, doc_path: Path = DOC_PATH, index_cache: Path = INDEX_CACHE):
+        self.name = name
+        self.doc_path = doc_path
+        self.index_cache = index_cache
+        self.index_file = index_cache / "index.bin"
+        self.metadata_file = index_cache / "metadata.json"  # legacy JSON layout, converted to ChunkStore on load
+        self.cache_file = index_cache / "doc_index_cache.json"
+        self.bm25_file = index_cache / "bm25.json"
+        self.lock = threading.RLock()
+        self.index = None
+        self.metadata = ChunkStore(index_cache)
+        self.bm25 = BM25Index()
+        self.status = "idle"  # idle | indexing | ready | error
+        self.files_total = 0
+        self.files_done = 0
+        self.current_file = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.thread = None
+        self.indexing_lock = threading.Lock()  # one process_documents() run at a time
+        self.pins = 0  # queries using the loaded index right now; see pinned()
+        self.watching = False
+
+    def exists(self) -> bool:
+        return self.doc_path.is_dir() or self.index_file.exists()
+
+    def load_from_disk(self) -> bool:
+        """Load the persisted index so searches can be served before indexing finishes"""
+        with self.lock:
+            if self.index is not None:
+                return True
+            if not (self.index_file.exists() and (ChunkStore.exists(self.index_cache) or self.metadata_file.exists())):
+                return False
+            try:
+                self.index = faiss.read_index(str(self.index_file))
+                self.index = maybe_convert(self.index, INDEX_TYPE)
+                if not ChunkStore.exists(self.index_cache):
+                    mcp_log("INFO", "Converting metadata.json to the binary chunk store")
+                    ChunkStore.from_json(self.metadata_file, self.index_cache).close()
+                self.metadata = ChunkStore.load(self.index_cache)
+                self.bm25 = self._load_bm25()
+                if self.status == "idle":
+                    self.status = "ready"
+                mcp_log("INFO", f"Loaded collection '{self.name}' with {self.index.ntotal} chunks from disk")
+                return True
+            except Exception as e:
+                mcp_log("ERROR", f"Failed to load collection '{self.name}' from disk: {e}")
+                self.index, self.metadata, self.bm25 = None, ChunkStore(self.index_cache), BM25Index()
+                return False
+
+    def unload(self) -> bool:
+        """Drop the in-memory index; the next access reloads it from disk"""
+        with self.lock:
+            if self.busy():
+                return False
+            self.metadata.close()
+            self.index, self.metadata, self.bm25 = None, ChunkStore(self.index_cache), BM25Index()
+            self.status = "idle"
+            return True
+
+    def memory_bytes(self) -> int:
+        with self.lock:
+            vectors = index_bytes(self.index) if self.index is not None else 0
+            return vectors + self.metadata.resident_bytes() + self.bm25.approx_bytes()
+
+    def _load_bm25(self) -> BM25Index:
+        if self.bm25_file.exists():
+            bm25 = BM25Index.from_dict(json.loads(self.bm25_file.read_text()))
+            if len(bm25) == len(self.metadata):
+                return bm25
+        # Indexes built before the lexical index existed: rebuild it from the chunk text
+        mcp_log("INFO", "Building BM25 index from existing metadata")
+        return BM25Index.from_texts(m["chunk"] for m in self.metadata)
+
+    def is_indexing(self) -> bool:
+        """A process_documents() run holds the collection, from the background thread or the watcher"""
+        return self.indexing_lock.locked() or (self.thread is not None and self.thread.is_alive())
+
+    def busy(self) -> bool:
+        """Indexing or serving a query, so the in-memory index must not be unloaded"""
+        with self.lock:
+            return self.pins > 0 or self.is_indexing()
+
+    @contextmanager
+    def pinned(self):
+        """Keep the index loaded (not evicted or unloaded) for the duration of a query"""
+        with self.lock:
+            self.pins += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.pins -= 1
+
+    def start_background_indexing(self) -> bool:
+        """Run process_documents() in a daemon thread unless it is already running"""
+        with self.lock:
+            if self.is_indexing():
+                return False
+            self.thread = threading.Thread(target=process_documents, kwargs={"collection": self.name},
+                                           name=f"indexer-{self.name}", daemon=True)
+            self.thread.start()
+            return True
+
+    def progress(self) -> str:
+        return f"{self.files_done}/{self.files_total} files, {self.index.ntotal if self.index else 0} chunks"
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "collection": self.name,
+                "status": self.status,
+                "loaded": self.index is not None,
+                "files_done": self.files_done,
+                "files_total": self.files_total,
+                "current_file": self.current_file,
+                "chunks_indexed": self.index.ntotal if self.index else 0,
+                "index_type": index_kind(self.index) if self.index else INDEX_TYPE,
+                "memory_mb": round(self.memory_bytes() / 2**20, 2),
+                "error": self.error,
+                "indexing_seconds": round((self.finished_at or now) - self.started_at, 2) if self.started_at else None,
+                "uptime_seconds": round(now - SERVER_STARTED_AT, 2),
+                "first_response_seconds": round(FIRST_RESPONSE_S, 2) if FIRST_RESPONSE_S is not None else None,
+                "watching": self.watching,
+            }
+
+
+class Collections:
+    """Named corpora, each with its own documents folder, index and hash cache.
+
+    States are created on first use and loaded lazily; loaded ones are kept
+    in an LRU under COLLECTION_MEMORY_BUDGET_MB and cold ones are unloaded.
+    """
+
+    def __init__(self, budget_mb: float):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.loaded = LRUBudgetCache(int(budget_mb * 2**20), sizer=lambda state: state.memory_bytes(),
+                                     on_evict=self._evicted, can_evict=lambda state: not state.busy())
+
+    def state(self, name: str = DEFAULT_COLLECTION) -> IndexState:
+        """The collection's state object, without loading anything"""
+        validate_collection_name(name)
+        with self.lock:
+            if name not in self.states:
+                if name == DEFAULT_COLLECTION:
+                    self.states[name] = IndexState(name, DOC_PATH, INDEX_CACHE)
+                else:
+                    base = COLLECTIONS_DIR / name
+                    self.states[name] = IndexState(name, base / "documents", base / "faiss_index")
+            return self.states[name]
+
+    def get(self, name: str = DEFAULT_COLLECTION) -> IndexState:
+        """The collection's state, loaded from disk if needed and marked most recently used"""
+        state = self.state(name)
+        if self.loaded.get(name) is None and state.load_from_disk():
+            self.loaded.put(name, state)
+        return state
+
+    def names(self) -> list[str]:
+        names = [DEFAULT_COLLECTION]
+        if COLLECTIONS_DIR.is_dir():
+            names += sorted(p.name for p in COLLECTIONS_DIR.iterdir()
+                            if p.is_dir() and p.name != DEFAULT_COLLECTION and COLLECTION_NAME_RE.match(p.name))
+        return names
+
+    def _evicted(self, name: str, state: IndexState) -> None:
+        if state.unload():
+            mcp_log("EVICT", f"Unloaded cold collection '{name}' to stay under {COLLECTION_MEMORY_BUDGET_MB:g} MB")
+
+
+COLLECTIONS = Collections(COLLECTION_MEMORY_BUDGET_MB)
+INDEX_STATE = COLLECTIONS.state(DEFAULT_COLLECTION)
+FIRST_RESPONSE_S = None
+
+def mark_first_response(tool_name: str) -> None:
+    global FIRST_RESPONSE_S
+    if FIRST_RESPONSE_S is None:
+        FIRST_RESPONSE_S = time.monotonic() - SERVER_STARTED_AT
+        mcp_log("TIMING", f"First successful tool response ({tool_name}) {FIRST_RESPONSE_S:.2f}s after startup")
 
 def get_embedding(text: str) -> np.ndarray:
     response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
@@ -42,24 +254,181 @@ def mcp_log(level: str, message: str) -> None:
     sys.stderr.write(f"{level}: {message}\n")
     sys.stderr.flush()
 
+def doc_filter_ids(metadata: ChunkStore, docs: list[str] | None) -> set[int] | None:
+    """Chunk ids belonging to the given document names, or None for no filter"""
+    if not docs:
+        return None
+    return metadata.ids_for_docs(docs)
+
+def vector_search(index, query_vec: np.ndarray, k: int, allowed: set[int] | None = None) -> list[int]:
+    if allowed is not None:
+        if not allowed:
+            return []
+        k = min(k, len(allowed))
+        if not supports_selector(index):
+            # Over-fetch and filter, widening the search until k allowed ids are found
+            fetch = min(k * 4, index.ntotal)
+            while True:
+                D, I = index.search(query_vec, fetch)
+                ids = [int(i) for i in I[0] if i in allowed]
+                if len(ids) >= k or fetch >= index.ntotal:
+                    return ids[:k]
+                fetch = min(fetch * 4, index.ntotal)
+        selector = faiss.IDSelectorBatch(np.fromiter(allowed, dtype="int64"))
+        D, I = index.search(query_vec, k, params=faiss.SearchParameters(sel=selector))
+    else:
+        D, I = index.search(query_vec, min(k, index.ntotal))
+    return [int(i) for i in I[0] if i >= 0]
+
+def rank_chunks(query: str, top_k: int = 5, mode: str = "hybrid", docs: list[str] | None = None,
+                query_vec: np.ndarray | None = None, collection: str = DEFAULT_COLLECTION) -> list[int]:
+    """Rank chunk ids of the live index; hybrid fuses BM25 and FAISS rankings with RRF"""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+    if mode != "lexical" and query_vec is None:
+        query_vec = get_embedding(query).reshape(1, -1)
+    state = COLLECTIONS.state(collection)
+    with state.lock:
+        allowed = doc_filter_ids(state.metadata, docs)
+        if mode == "vector":
+            return vector_search(state.index, query_vec, top_k, allowed)
+        if mode == "lexical":
+            return [i for i, _ in state.bm25.search(query, top_k, allowed)]
+        candidates = max(top_k * 4, 20)
+        dense = vector_search(state.index, query_vec, candidates, allowed)
+        sparse = [i for i, _ in state.bm25.search(query, candidates, allowed)]
+    return [i for i, _ in reciprocal_rank_fusion([dense, sparse])[:top_k]]
+
+def mmr_select(query_vec: np.ndarray, cand_vecs: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA) -> list[int]:
+    """Greedy maximal marginal relevance; returns positions into cand_vecs"""
+    cand = cand_vecs / np.maximum(np.linalg.norm(cand_vecs, axis=1, keepdims=True), 1e-12)
+    q = query_vec.reshape(-1) / max(float(np.linalg.norm(query_vec)), 1e-12)
+    relevance = cand @ q
+    pairwise = cand @ cand.T
+    max_sim = np.full(len(cand), -np.inf, dtype=np.float32)
+    chosen = np.zeros(len(cand), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(cand))):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        max_sim = np.maximum(max_sim, pairwise[:, best])
+    return selected
+
+def mmr_rerank(query_vec: np.ndarray, candidates: list[int], top_k: int,
+               collection: str = DEFAULT_COLLECTION) -> list[int]:
+    if len(candidates) <= 1:
+        return candidates[:top_k]
+    state = COLLECTIONS.state(collection)
+    with state.lock:
+        cand_vecs = state.index.reconstruct_batch(np.array(candidates, dtype="int64"))
+    return [candidates[i] for i in mmr_select(query_vec, cand_vecs, top_k)]
+
+def chunk_seq(chunk_id: str) -> int:
+    return int(chunk_id.rsplit("_", 1)[1])
+
+def merge_adjacent(hits: list[dict], overlap: int = CHUNK_OVERLAP) -> list[dict]:
+    """Join consecutive chunks of the same doc into one passage, dropping the repeated overlap words"""
+    by_doc = {}
+    for rank, data in enumerate(hits):
+        by_doc.setdefault(data["doc"], []).append((chunk_seq(data["chunk_id"]), rank, data))
+    runs = []
+    for items in by_doc.values():
+        items.sort(key=lambda item: item[0])
+        run = [items[0]]
+        for item in items[1:]:
+            if item[0] == run[-1][0] + 1:
+                run.append(item)
+            else:
+                runs.append(run)
+                run = [item]
+        runs.append(run)
+    passages = []
+    for run in sorted(runs, key=lambda r: min(item[1] for item in r)):
+        members = [item[2] for item in run]
+        words = members[0]["chunk"].split()
+        for data in members[1:]:
+            words.extend(data["chunk"].split()[overlap:])
+        chunk_id = members[0]["chunk_id"] if len(members) == 1 else f"{members[0]['chunk_id']}..{members[-1]['chunk_id']}"
+        passages.append({"doc": members[0]["doc"], "chunk": " ".join(words), "chunk_id": chunk_id})
+    return passages
+
+def retrieve_passages(query: str, top_k: int = 5, mode: str = "hybrid", docs: list[str] | None = None,
+                      mmr: bool = False, query_vec: np.ndarray | None = None,
+                      collection: str = DEFAULT_COLLECTION) -> list[dict]:
+    """Metadata dicts of the best chunks; with mmr, a diversified over-fetch with adjacent chunks merged"""
+    if query_vec is None and (mmr or mode != "lexical"):
+        query_vec = get_embedding(query).reshape(1, -1)
+    state = COLLECTIONS.state(collection)
+    # One hold of the (reentrant) lock from ranking to lookup: remove_docs renumbers ids in between otherwise
+    with state.lock:
+        if mmr:
+            candidates = rank_chunks(query, top_k=max(top_k * 4, 20), mode=mode, docs=docs, query_vec=query_vec,
+                                     collection=collection)
+            ids = mmr_rerank(query_vec, candidates, top_k, collection=collection)
+        else:
+            ids = rank_chunks(query, top_k=top_k, mode=mode, docs=docs, query_vec=query_vec, collection=collection)
+        metadata = state.metadata
+        hits = [metadata[idx] for idx in ids if 0 <= idx < len(metadata)]
+    return merge_adjacent(hits) if mmr else hits
+
 @mcp.tool()
-def search_documents(query: str) -> list[str]:
-    """Search for relevant content from uploaded documents."""
-    ensure_faiss_ready()
-    mcp_log("SEARCH", f"Query: {query}")
+def search_documents(query: str, top_k: int = 5, mode: str = "hybrid", docs: list[str] | None = None,
+                     mmr: bool = False, collection: str = DEFAULT_COLLECTION) -> list[str]:
+    """Search for relevant content from uploaded documents. mode: "hybrid" (keyword + semantic, default), "vector" or "lexical"; docs optionally limits results to these file names; mmr=true removes near-duplicate passages; collection picks a named corpus (see list_collections)."""
+    mcp_log("SEARCH", f"Query: {query} (collection={collection}, mode={mode}, top_k={top_k}, docs={docs}, mmr={mmr})")
     try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
+        state = COLLECTIONS.state(collection)
+        if not state.exists():
+            return [f"ERROR: Unknown collection '{collection}'. Available: {', '.join(COLLECTIONS.names())}"]
+        # Pinned before loading, so eviction can't unload the index between the load and the ranking
+        with state.pinned():
+            ensure_faiss_ready(collection)
+            with state.lock:
+                if state.index is None or state.index.ntotal == 0:
+                    return [f"INFO: Document index is still being built ({state.progress()}). Try again shortly."]
+            hits = retrieve_passages(query, top_k=top_k, mode=mode, docs=docs, mmr=mmr, collection=collection)
+            with state.lock:
+                partial = state.status == "indexing"
+                progress = state.progress()
         results = []
-        for idx in I[0]:
-            data = metadata[idx]
+        for data in hits:
             results.append(f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]")
+        if partial:
+            results.append(f"[PARTIAL RESULTS: indexing still in progress, {progress} indexed so far]")
+        mark_first_response("search_documents")
         return results
     except Exception as e:
         return [f"ERROR: Failed to search: {str(e)}"]
 
+@mcp.tool()
+def index_status(collection: str = DEFAULT_COLLECTION) -> dict:
+    """Report document indexing progress and readiness"""
+    state = COLLECTIONS.get(collection)
+    mark_first_response("index_status")
+    return state.snapshot()
+
+@mcp.tool()
+def list_collections() -> list[dict]:
+    """List the named document collections, whether each is loaded in memory, and its size"""
+    loaded = set(COLLECTIONS.loaded.names())
+    collections = []
+    for name in COLLECTIONS.names():
+        state = COLLECTIONS.state(name)
+        with state.lock:
+            collections.append({
+                "collection": name,
+                "status": state.status,
+                "loaded": name in loaded,
+                "chunks_indexed": state.index.ntotal if state.index else 0,
+                "memory_mb": round(state.memory_bytes() / 2**20, 2),
+            })
+    mark_first_response("list_collections")
+    return collections
+
 @mcp.tool()
 def add(input: AddInput) -> AddOutput:
     print("CALLED: add(AddInput) -> AddOutput")
@@ -156,13 +525,29 @@ def mine(a: int, b: int) -> int:
     print("CALLED: mine(a: int, b: int) -> int:")
     return int(a - b - b)
 
+@lru_cache(maxsize=THUMBNAIL_CACHE_SIZE)
+def render_thumbnail(image_path: str, mtime_ns: int, file_size: int, fmt: str) -> bytes:
+    """Encoded thumbnail bytes; mtime/size are part of the cache key so edited files are re-rendered"""
+    with PILImage.open(image_path) as img:
+        if img.format == "JPEG":
+            # Let libjpeg decode at 1/2..1/8 scale instead of full resolution
+            img.draft("RGB", THUMBNAIL_SIZE)
+        img.thumbnail(THUMBNAIL_SIZE)
+        if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        buf = io.BytesIO()
+        img.save(buf, format=fmt.upper())
+        return buf.getvalue()
+
 @mcp.tool()
-def create_thumbnail(image_path: str) -> Image:
-    """Create a thumbnail from an image"""
+def create_thumbnail(image_path: str, format: str = "png") -> Image:
+    """Create a thumbnail from an image (format: png or webp)"""
     print("CALLED: create_thumbnail(image_path: str) -> Image:")
-    img = PILImage.open(image_path)
-    img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    fmt = format.lower()
+    if fmt not in THUMBNAIL_FORMATS:
+        raise ValueError(f"Unsupported thumbnail format '{format}', expected one of {THUMBNAIL_FORMATS}")
+    stat = os.stat(image_path)
+    return Image(data=render_thumbnail(str(image_path), stat.st_mtime_ns, stat.st_size, fmt), format=fmt)
 
 @mcp.tool()
 def strings_to_chars_to_int(input: StringsToIntsInput) -> StringsToIntsOutput:
@@ -189,6 +574,13 @@ def fibonacci_numbers(n: int) -> list:
         fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
     return fib_sequence[:n]
 
+@mcp.tool()
+def evaluate_pipeline(input: PipelineInput) -> PipelineOutput:
+    """Run a chain of math steps in ONE call instead of one tool call per step. Each step is {"id": name, "op": tool name, "args": {...}}; an arg value "$name" uses an earlier step's result, and list arguments are computed element-wise. ops: add, subtract, multiply, divide, power, sqrt, cbrt, factorial, log, remainder, sin, cos, tan, mine, sum, strings_to_chars_to_int, int_list_to_exponential_sum, log_sum_exp (overflow-safe log of the exponential sum), fibonacci_numbers"""
+    print("CALLED: evaluate_pipeline(PipelineInput) -> PipelineOutput")
+    results = run_pipeline(input.steps)
+    return PipelineOutput(results=results, result=results[input.steps[-1].id] if input.steps else None)
+
 # DEFINE RESOURCES
 
 # Add a dynamic greeting resource
@@ -214,70 +606,184 @@ def debug_error(error: str) -> list[base.Message]:
         base.AssistantMessage("I'll help debug that. What have you tried so far?"),
     ]
 
-def process_documents():
-    """Process documents and create FAISS index"""
-    mcp_log("INFO", "Indexing documents with MarkItDown...")
-    ROOT = Path(__file__).parent.resolve()
-    DOC_PATH = ROOT / "documents"
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
+def remove_docs(state: IndexState, names) -> int:
+    """Drop every chunk of the given documents from FAISS, the chunk store and BM25"""
+    with state.lock:
+        ids = state.metadata.ids_for_docs(names)
+        if not ids:
+            return 0
+        ids = np.array(sorted(ids), dtype="int64")
+        state.index.remove_ids(faiss.IDSelectorBatch(ids))
+        state.metadata.remove(ids)
+        state.bm25.remove(ids)
+        return len(ids)
+
+def process_documents(files=None, removed=(), collection: str = DEFAULT_COLLECTION):
+    """Process documents and update the FAISS index.
+
+    With no file list every document of the collection is checked against the
+    hash cache and deleted files are dropped; the watcher passes only what it
+    saw change.
+    """
+    mcp_log("INFO", f"Indexing documents of '{collection}' with MarkItDown...")
+    state = COLLECTIONS.state(collection)
+    state.index_cache.mkdir(parents=True, exist_ok=True)
 
     def file_hash(path):
         return hashlib.md5(Path(path).read_bytes()).hexdigest()
 
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-    all_embeddings = []
-    converter = MarkItDown()
-
-    for file in DOC_PATH.glob("*.*"):
-        fhash = file_hash(file)
-        if file.name in CACHE_META and CACHE_META[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
-            continue
+    state.indexing_lock.acquire()
+    state.load_from_disk()
+    with state.lock:
+        state.status = "indexing"
+        state.files_done = 0
+        state.error = None
+        state.started_at = time.monotonic()
+        state.finished_at = None
+    updated = False
 
-        mcp_log("PROC", f"Processing: {file.name}")
+    try:
+        CACHE_META = json.loads(state.cache_file.read_text()) if state.cache_file.exists() else {}
+        if files is None:
+            files = sorted(state.doc_path.glob("*.*"))
+            present = {f.name for f in files}
+            removed = [name for name in CACHE_META if name not in present]
+        state.files_total = len(files) + len(removed)
+        converter = MarkItDown()
+
+        for name in removed:
+            dropped = remove_docs(state, [name])
+            CACHE_META.pop(name, None)
+            updated = updated or dropped > 0
+            state.files_done += 1
+            mcp_log("DEL", f"Removed {dropped} chunks of deleted file: {name}")
+
+        for file in files:
+            state.current_file = file.name
+            try:
+                # Hashed inside the try: a file deleted or locked since the snapshot is skipped, not fatal
+                fhash = file_hash(file)
+                if file.name in CACHE_META and CACHE_META[file.name] == fhash:
+                    mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
+                    state.files_done += 1
+                    continue
+
+                mcp_log("PROC", f"Processing: {file.name}")
+                result = converter.convert(str(file))
+                markdown = result.text_content
+                chunks = list(chunk_text(markdown))
+                embeddings_for_file = []
+                new_metadata = []
+                for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
+                    embedding = get_embedding(chunk)
+                    embeddings_for_file.append(embedding)
+                    new_metadata.append({"doc": file.name, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"})
+                # Publish each file as soon as it is embedded so searches see partial results
+                with state.lock:
+                    # A changed file replaces its previous chunks instead of duplicating them
+                    updated = remove_docs(state, [file.name]) > 0 or updated
+                    if embeddings_for_file:
+                        if state.index is None:
+                            dim = len(embeddings_for_file[0])
+                            state.index = faiss.IndexFlatL2(dim)
+                        state.index.add(np.stack(embeddings_for_file))
+                        # Quantized storage is trained once enough vectors have arrived
+                        state.index = maybe_convert(state.index, INDEX_TYPE)
+                        state.metadata.extend(new_metadata)
+                        state.bm25.add_many(m["chunk"] for m in new_metadata)
+                        updated = True
+                CACHE_META[file.name] = fhash
+            except Exception as e:
+                mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+            state.files_done += 1
+            mcp_log("PROGRESS", f"Indexed {state.progress()}")
+
+        with state.lock:
+            state.cache_file.write_text(json.dumps(CACHE_META, indent=2))
+            state.metadata.save()
+            state.bm25_file.write_text(json.dumps(state.bm25.to_dict()))
+            if state.index is not None:
+                faiss.write_index(state.index, str(state.index_file))
+                mcp_log("SUCCESS", "Saved FAISS index and metadata")
+            if not updated:
+                mcp_log("WARN", "No new documents or updates to process.")
+            state.status = "ready"
+    except Exception as e:
+        mcp_log("ERROR", f"Indexing failed: {e}")
+        with state.lock:
+            state.status = "error"
+            state.error = str(e)
+    finally:
+        state.current_file = None
+        state.finished_at = time.monotonic()
+        state.indexing_lock.release()
+        mcp_log("TIMING", f"Indexing finished in {state.finished_at - state.started_at:.2f}s ({state.progress()})")
+    if state.index is not None:
+        # The index grew: count it against the memory budget, which may unload colder collections
+        COLLECTIONS.loaded.put(collection, state)
+
+def snapshot_documents(doc_path: Path = DOC_PATH) -> dict:
+    """name -> (mtime, size) for every file in doc_path"""
+    snapshot = {}
+    for file in doc_path.glob("*.*"):
         try:
-            result = converter.convert(str(file))
-            markdown = result.text_content
-            chunks = list(chunk_text(markdown))
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({"doc": file.name, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"})
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-            CACHE_META[file.name] = fhash
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
-
-    CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-    METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-    if index and index.ntotal > 0:
-        faiss.write_index(index, str(INDEX_FILE))
-        mcp_log("SUCCESS", "Saved FAISS index and metadata")
-    else:
-        mcp_log("WARN", "No new documents or updates to process.")
-
-def ensure_faiss_ready():
-    from pathlib import Path
-    index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
-        mcp_log("INFO", "Index not found — running process_documents()...")
-        process_documents()
-    else:
-        mcp_log("INFO", "Index already exists. Skipping regeneration.")
+            stat = file.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[file.name] = (stat.st_mtime, stat.st_size)
+    return snapshot
+
+def watch_documents(stop_event: threading.Event, interval: float = WATCH_INTERVAL, debounce: float = WATCH_DEBOUNCE,
+                    collection: str = DEFAULT_COLLECTION, index_existing: bool = False):
+    """Poll a collection's documents folder and index added/changed/removed files once they stop changing.
+
+    Files already there are left to the startup indexing unless index_existing is set.
+    """
+    state = COLLECTIONS.state(collection)
+    state.watching = True
+    indexed = {} if index_existing else snapshot_documents(state.doc_path)
+    last_seen, last_change = indexed, time.monotonic()
+    mcp_log("WATCH", f"Watching {state.doc_path} every {interval}s (debounce {debounce}s)")
+    try:
+        while not stop_event.wait(interval):
+            current = snapshot_documents(state.doc_path)
+            if current != last_seen:
+                # Still being written or copied; wait for it to settle
+                last_seen, last_change = current, time.monotonic()
+                continue
+            if current == indexed or time.monotonic() - last_change < debounce:
+                continue
+            changed = sorted(name for name, sig in current.items() if indexed.get(name) != sig)
+            removed = sorted(name for name in indexed if name not in current)
+            mcp_log("WATCH", f"Changed: {changed or '-'}; removed: {removed or '-'}")
+            process_documents([state.doc_path / name for name in changed], removed, collection=collection)
+            indexed = current
+    finally:
+        state.watching = False
+
+def watch_collections(stop_event: threading.Event, interval: float = WATCH_INTERVAL):
+    """Run a watch_documents thread per collection, including collections created while the server runs"""
+    watched = set()
+    while True:
+        new = bool(watched)  # collections found after the first pass were created since startup
+        for name in COLLECTIONS.names():
+            if name in watched:
+                continue
+            if new:
+                mcp_log("WATCH", f"New collection '{name}'")
+            watched.add(name)
+            threading.Thread(target=watch_documents, args=(stop_event, interval),
+                             kwargs={"collection": name, "index_existing": new},
+                             name=f"watcher-{name}", daemon=True).start()
+        if stop_event.wait(interval):
+            return
+
+def ensure_faiss_ready(collection: str = DEFAULT_COLLECTION) -> IndexState:
+    """Make an index available without ever blocking a tool call on a rebuild"""
+    state = COLLECTIONS.get(collection)
+    if state.index is None and state.start_background_indexing():
+        mcp_log("INFO", f"Index of '{collection}' not found — started background indexing")
+    return state
 
 
 if __name__ == "__main__":
@@ -285,24 +791,24 @@ if __name__ == "__main__":
 
     
     
+    if INDEX_TYPE not in INDEX_TYPES:
+        raise SystemExit(f"DOC_INDEX_TYPE must be one of {INDEX_TYPES}, got '{INDEX_TYPE}'")
+
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run() # Run without transport for dev server
     else:
-        # Start the server in a separate thread
-        import threading
-        server_thread = threading.Thread(target=lambda: mcp.run(transport="stdio"))
-        server_thread.daemon = True
-        server_thread.start()
-        
-        # Wait a moment for the server to start
-        time.sleep(2)
-        
-        # Process documents after server is running
-        process_documents()
-        
-        # Keep the main thread alive
+        # Index in the background so the stdio server can answer immediately;
+        # search_documents serves whatever has been indexed so far
+        # Named collections are loaded on first use
+        COLLECTIONS.get(DEFAULT_COLLECTION)
+        INDEX_STATE.start_background_indexing()
+
+        # --watch keeps every collection fresh as files are dropped into its documents/
+        if "--watch" in sys.argv:
+            stop_watching = threading.Event()
+            threading.Thread(target=watch_collections, args=(stop_watching,), name="collection-watcher", daemon=True).start()
+
         try:
-            while True:
-                time.sleep(1)
+            mcp.run(transport="stdio")
         except KeyboardInterrupt:
             print("\nShutting down...")
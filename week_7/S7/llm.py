@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import os
+from collections import Counter
+from dotenv import load_dotenv
+from google import genai
+import llm_cache
+import tracing
+
+load_dotenv()
+client = None  # created on first use, so importing this module needs no API key
+
+MODEL = "gemini-2.0-flash"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # seconds before an async request is cancelled
+# Requests sent to the model, by call site ("perception", "plan", "perceive_and_plan"); cache hits are not counted
+CALL_STATS = Counter()
+_task_calls = contextvars.ContextVar("llm_task_calls", default=None)
+
+
+def get_client() -> genai.Client:
+    global client
+    if client is None:
+        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return client
+
+
+def _count(site: str) -> None:
+    CALL_STATS[site] += 1
+    task_calls = _task_calls.get()
+    if task_calls is not None:
+        task_calls[site] += 1
+
+
+def track_calls() -> Counter:
+    """Counter of the requests made from now on by the current task and the tasks it starts.
+
+    Unlike CALL_STATS it is not shared with queries running concurrently.
+    """
+    counter = Counter()
+    _task_calls.set(counter)
+    return counter
+
+
+async def agenerate(prompt: str, site: str, config: dict | None = None, use_cache: bool = True,
+                    timeout: float = LLM_TIMEOUT, accept=None) -> str:
+    """Send one prompt to Gemini on the async client and return the stripped response text.
+
+    The event loop (and the MCP session) keeps running while it waits.
+    Identical (model, prompt, config) requests are answered from the SQLite
+    cache in llm_cache.py; pass use_cache=False to always call the model.
+
+    Raises asyncio.TimeoutError if the model takes longer than timeout; the
+    request is cancelled rather than left running. Only responses accept()
+    approves are cached (see llm_cache.py).
+    """
+    with tracing.span("llm", site=site, model=MODEL, prompt_chars=len(prompt), cache_hit=True) as span:
+        async def call_model() -> str:
+            _count(site)
+            span.set(cache_hit=False)
+            response = await asyncio.wait_for(
+                get_client().aio.models.generate_content(model=MODEL, contents=prompt, config=config), timeout)
+            return response.text.strip()
+
+        text = await llm_cache.acached_generate(MODEL, prompt, site, call_model, config=config, use_cache=use_cache,
+                                                accept=accept)
+        span.set(response_chars=len(text))
+        return text
+
+
+def total_calls() -> int:
+    return sum(CALL_STATS.values())
@@ -0,0 +1,111 @@
+import math
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from models import PipelineStep
+
+MAX_STEPS = 32
+MAX_ELEMENTS = 100_000
+# F(n) has ~0.21n digits, so the list grows quadratically: 2000 numbers are ~0.4 MB of JSON
+MAX_FIBONACCI = 2000
+MAX_FACTORIAL = 170  # largest n with n! representable as a float
+
+
+def _arr(value) -> np.ndarray:
+    return np.asarray(value, dtype=np.float64)
+
+
+def log_sum_exp(int_list) -> float:
+    """log(sum(exp(x))) without overflowing for large x"""
+    x = _arr(int_list)
+    if x.size == 0:
+        return -math.inf
+    m = float(x.max())
+    return m + float(np.log(np.exp(x - m).sum()))
+
+
+def exponential_sum(int_list) -> float:
+    """sum(exp(x)) via log-sum-exp: inf instead of OverflowError past ~709"""
+    return float(np.exp(log_sum_exp(int_list)))
+
+
+def factorial(a):
+    return np.vectorize(lambda v: float(math.factorial(int(v))) if v <= MAX_FACTORIAL else math.inf)(a)
+
+
+def fibonacci_numbers(n) -> List[int]:
+    n = int(n)
+    if n > MAX_FIBONACCI:
+        raise ValueError(f"fibonacci_numbers: n too large ({n} > {MAX_FIBONACCI})")
+    fib_sequence = [0, 1]
+    for _ in range(2, n):
+        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
+    return fib_sequence[:max(n, 0)]
+
+
+# Same names and argument names as the scalar MCP tools; every numeric op
+# broadcasts, so a list argument is handled in one vectorised call
+OPS: Dict[str, Callable[..., Any]] = {
+    "add": lambda a, b: np.add(a, b),
+    "subtract": lambda a, b: np.subtract(a, b),
+    "multiply": lambda a, b: np.multiply(a, b),
+    "divide": lambda a, b: np.true_divide(a, b),
+    "power": lambda a, b: np.power(_arr(a), b),
+    "sqrt": lambda a: np.sqrt(_arr(a)),
+    "cbrt": lambda a: np.cbrt(_arr(a)),
+    "factorial": factorial,
+    "log": lambda a: np.log(_arr(a)),
+    "remainder": lambda a, b: np.remainder(a, b),
+    "sin": lambda a: np.sin(_arr(a)),
+    "cos": lambda a: np.cos(_arr(a)),
+    "tan": lambda a: np.tan(_arr(a)),
+    "mine": lambda a, b: np.subtract(np.subtract(a, b), b),
+    "sum": lambda int_list: np.sum(int_list),
+    "strings_to_chars_to_int": lambda string: [ord(char) for char in string],
+    "int_list_to_exponential_sum": lambda int_list: exponential_sum(int_list),
+    "log_sum_exp": lambda int_list: log_sum_exp(int_list),
+    "fibonacci_numbers": lambda n: fibonacci_numbers(n),
+}
+
+
+def _resolve(value, results: Dict[str, Any]):
+    """Replace "$step_id" references with earlier results"""
+    if isinstance(value, str) and value.startswith("$"):
+        if value[1:] not in results:
+            raise ValueError(f"Unknown reference '{value}' (steps can only use earlier results)")
+        return results[value[1:]]
+    if isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    return value
+
+
+def _to_python(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, list):
+        return [_to_python(v) for v in value]
+    return value
+
+
+def run_pipeline(steps: List[PipelineStep]) -> Dict[str, Any]:
+    """Evaluate steps in order; each step may reference any earlier step's result"""
+    if len(steps) > MAX_STEPS:
+        raise ValueError(f"Too many steps ({len(steps)} > {MAX_STEPS})")
+    results: Dict[str, Any] = {}
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        for step in steps:
+            op = OPS.get(step.op)
+            if op is None:
+                raise ValueError(f"Step '{step.id}': unknown op '{step.op}', expected one of {sorted(OPS)}")
+            args = {name: _resolve(value, results) for name, value in step.args.items()}
+            try:
+                value = _to_python(op(**args))
+            except TypeError as e:
+                raise ValueError(f"Step '{step.id}': bad arguments for '{step.op}': {e}") from e
+            if np.size(value) > MAX_ELEMENTS:
+                raise ValueError(f"Step '{step.id}': result too large ({np.size(value)} elements)")
+            results[step.id] = value
+    return results
@@ -1,5 +1,7 @@
 # memory.py
 
+import os
+import threading
 import numpy as np
 import faiss
 import requests
@@ -10,6 +12,13 @@ import json
 from pathlib import Path
 import hashlib
 from models import SearchResult, SearchOutput
+from vector_index import INDEX_TYPES, index_bytes, maybe_convert
+from collection_cache import DEFAULT_COLLECTION, validate_collection_name
+import tracing
+
+EMBED_TIMEOUT = 30  # seconds per embedding request
+# Vector storage for the web page indexes: flat (float32), fp16, sq8 or pq; see vector_index.py
+PAGE_INDEX_TYPE = os.getenv("PAGE_INDEX_TYPE", "flat")
 
 
 class MemoryItem(BaseModel):
@@ -23,13 +32,23 @@ class MemoryItem(BaseModel):
 
 
 class MemoryManager:
-    def __init__(self, embedding_url="http://localhost:11434/api/embeddings", model_name="nomic-embed-text"):
+    def __init__(self, embedding_url="http://localhost:11434/api/embeddings", model_name="nomic-embed-text",
+                 index_type=PAGE_INDEX_TYPE, collection=DEFAULT_COLLECTION):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
         self.embedding_url = embedding_url
         self.model_name = model_name
+        self.index_type = index_type  # flat, fp16, sq8 or pq (see vector_index.py)
+        self.collection = validate_collection_name(collection)
         self.index = None
         self.metadata = []
-        self.index_dir = Path("faiss_index")
-        self.index_dir.mkdir(exist_ok=True)
+        self.index_lock = threading.Lock()  # FAISS add/search from concurrent callers
+        # The default collection keeps the original location
+        if collection == DEFAULT_COLLECTION:
+            self.index_dir = Path("faiss_index")
+        else:
+            self.index_dir = Path("collections") / collection / "faiss_index"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
         self.index_file = self.index_dir / "index.bin"
         self.metadata_file = self.index_dir / "metadata.json"
         self.embedding_dim = 768  # Updated to match Ollama's output dimension
@@ -43,6 +62,7 @@ class MemoryManager:
                 try:
                     self.index = faiss.read_index(str(self.index_file))
                     print(f"Loaded FAISS index with dimension: {self.index.d}")
+                    self.index = maybe_convert(self.index, self.index_type)
                 except Exception as e:
                     print(f"Error loading FAISS index: {e}")
                     print("Creating new index...")
@@ -83,15 +103,22 @@ class MemoryManager:
             print(f"Error saving index: {e}")
             raise  # Re-raise the exception to handle it in the calling code
 
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the vectors and page contents"""
+        vectors = index_bytes(self.index) if self.index is not None else 0
+        return vectors + sum(len(item.get('content', '')) for item in self.metadata)
+
     def get_embedding(self, text: str) -> np.ndarray:
         """Get embedding for text using the embedding model"""
         try:
             print(f"Getting embedding for text of length {len(text)}...")
-            response = requests.post(
-                self.embedding_url,
-                json={"model": self.model_name, "prompt": text}
-            )
-            response.raise_for_status()
+            with tracing.span("memory.embed", model=self.model_name, text_chars=len(text)):
+                response = requests.post(
+                    self.embedding_url,
+                    json={"model": self.model_name, "prompt": text},
+                    timeout=EMBED_TIMEOUT
+                )
+                response.raise_for_status()
             embedding = np.array(response.json()["embedding"], dtype=np.float32)
             print("Embedding generated successfully")
             return embedding
@@ -144,7 +171,9 @@ class MemoryManager:
                     self.index = faiss.IndexFlatL2(self.embedding_dim)
                 
                 # Add to index
-                self.index.add(embedding_2d)
+                with self.index_lock:
+                    self.index.add(embedding_2d)
+                    self.index = maybe_convert(self.index, self.index_type)
                 print("Successfully added to FAISS index")
             except Exception as e:
                 print(f"Failed to add to FAISS index: {str(e)}")
@@ -191,7 +220,8 @@ class MemoryManager:
             actual_top_k = min(top_k, len(self.metadata))
             
             # Search index
-            D, I = self.index.search(query_embedding.reshape(1, -1), actual_top_k)
+            with self.index_lock:
+                D, I = self.index.search(query_embedding.reshape(1, -1), actual_top_k)
             
             # Get results
             results = []
@@ -212,12 +242,14 @@ class MemoryManager:
             return SearchOutput(results=[])
 
     def _get_embedding(self, text: str) -> np.ndarray:
-        response = requests.post(
-            self.embedding_url,
-            json={"model": self.model_name, "prompt": text}
-        )
-        response.raise_for_status()
-        return np.array(response.json()["embedding"], dtype=np.float32)
+        with tracing.span("memory.embed", model=self.model_name, text_chars=len(text)):
+            response = requests.post(
+                self.embedding_url,
+                json={"model": self.model_name, "prompt": text},
+                timeout=EMBED_TIMEOUT
+            )
+            response.raise_for_status()
+            return np.array(response.json()["embedding"], dtype=np.float32)
 
     def retrieve(
         self,
@@ -231,12 +263,13 @@ class MemoryManager:
             return []
 
         query_vec = self._get_embedding(query).reshape(1, -1)
-        D, I = self.index.search(query_vec, top_k * 2)  # Overfetch to allow filtering
+        with tracing.span("memory.search", index_size=self.index.ntotal, k=top_k * 2), self.index_lock:
+            D, I = self.index.search(query_vec, top_k * 2)  # Overfetch to allow filtering
 
         results = []
         for idx in I[0]:
-            if idx >= len(self.metadata):
-                continue
+            if idx < 0 or idx >= len(self.metadata):
+                continue  # FAISS pads with -1 when there are fewer than k vectors
             result = self.metadata[idx]
 
             # Filter by type
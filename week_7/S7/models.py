@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 # Input/Output models for tools
@@ -29,9 +29,22 @@ class ExpSumInput(BaseModel):
 class ExpSumOutput(BaseModel):
     result: float
 
+class PipelineStep(BaseModel):
+    id: str
+    op: str
+    args: Dict[str, Any] = {}
+
+class PipelineInput(BaseModel):
+    steps: List[PipelineStep]
+
+class PipelineOutput(BaseModel):
+    results: Dict[str, Any]
+    result: Any
+
 class WebPageInput(BaseModel):
     url: str
     content: str
+    collection: str = "default"
 
 class WebPageOutput(BaseModel):
     success: bool
@@ -40,6 +53,7 @@ class WebPageOutput(BaseModel):
 class SearchInput(BaseModel):
     query: str
     top_k: int = 5
+    collection: str = "default"
 
 class SearchResult(BaseModel):
     url: str
@@ -1,11 +1,13 @@
 from pydantic import BaseModel
 from typing import Optional, List
-import os
-from dotenv import load_dotenv
-from google import genai
+import ast
+import json
 import re
 from bs4 import BeautifulSoup
 from models import WebPageInput, WebPageOutput
+from structured import agenerate_structured, record_parse
+from llm_cache import parses
+import llm
 
 # Optional: import log from agent if shared, else define locally
 try:
@@ -16,20 +18,57 @@ except ImportError:
         now = datetime.datetime.now().strftime("%H:%M:%S")
         print(f"[{now}] [{stage}] {msg}")
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Cheap pre-perception classifier for speculative search_documents calls
+MATH_PATTERN = re.compile(
+    r"\d|\b(ascii|sum|add|subtract|multiply|divide|power|sqrt|root|factorial|log|remainder|"
+    r"sin|cos|tan|fibonacci|exponentials?|calculate|compute)\b", re.IGNORECASE)
+QUESTION_PATTERN = re.compile(r"^\s*(who|what|when|where|which|why|how|tell|explain|describe)\b|\?\s*$", re.IGNORECASE)
+
+
+def predicts_retrieval(user_input: str, tool_hint: Optional[str] = None) -> bool:
+    """True when the first step is likely search_documents: a factual, non-numeric question"""
+    if tool_hint:
+        return tool_hint == "search_documents"
+    return bool(QUESTION_PATTERN.search(user_input)) and not MATH_PATTERN.search(user_input)
 
 
 class PerceptionResult(BaseModel):
     user_input: str
-    intent: Optional[str]
+    intent: Optional[str] = None
     entities: List[str] = []
     tool_hint: Optional[str] = None
 
 
-def extract_perception(user_input: str) -> PerceptionResult:
-    """Extracts intent, entities, and tool hints using LLM"""
+class PerceptionFields(BaseModel):
+    """Response schema of extract_perception in structured-output mode"""
+    intent: Optional[str] = None
+    entities: List[str] = []
+    tool_hint: Optional[str] = None
+
+
+def parse_fields(raw: str) -> dict:
+    """The dictionary of a perception reply, with Markdown backticks stripped.
+
+    Only literals are read (a Python dict, or JSON with null/true/false):
+    replies come back from the on-disk LLM cache, so they are never eval()-ed.
+    """
+    clean = re.sub(r"^```json|```$", "", raw.strip(), flags=re.MULTILINE).strip()
+    try:
+        parsed = ast.literal_eval(clean)
+    except (ValueError, SyntaxError):
+        parsed = json.loads(clean)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"expected a dictionary, got {type(parsed).__name__}")
+    return parsed
+
+
+async def extract_perception(user_input: str, use_cache: bool = True, structured: bool = False) -> PerceptionResult:
+    """Extracts intent, entities, and tool hints using LLM
+
+    structured=True constrains the reply to PerceptionFields' JSON schema
+    instead of parsing it as a literal, with one repair call if it doesn't validate.
+    """
 
     prompt = f"""
 You are an AI that extracts structured facts from user input.
@@ -45,21 +84,23 @@ Output only the dictionary on a single line. Do NOT wrap it in ```json or other
     """
 
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        raw = response.text.strip()
+        if structured:
+            fields = await agenerate_structured(prompt, "perception", PerceptionFields, use_cache=use_cache)
+            log("perception", f"LLM output: {fields.model_dump_json()}")
+            return PerceptionResult(user_input=user_input, **fields.model_dump())
+
+        # A reply that doesn't parse is not cached, so a retry asks the model again
+        accept = parses(parse_fields)
+        raw = await llm.agenerate(prompt, site="perception", use_cache=use_cache, accept=accept)
         log("perception", f"LLM output: {raw}")
 
-        # Strip Markdown backticks if present
-        clean = re.sub(r"^```json|```$", "", raw.strip(), flags=re.MULTILINE).strip()
-
         try:
-            parsed = eval(clean)
+            parsed = accept.parsed(raw)
         except Exception as e:
             log("perception", f"⚠️ Failed to parse cleaned output: {e}")
+            record_parse("perception", "failed")
             raise
+        record_parse("perception", "valid")
 
         # Fix common issues
         if isinstance(parsed.get("entities"), dict):
@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from perception import PerceptionResult
+
+# Replay the tool calls of an earlier query with the same shape instead of planning with the LLM
+PLAN_TEMPLATES = os.getenv("AGENT_PLAN_TEMPLATES", "0") == "1"
+# Set to a file path to keep templates across agent runs
+PLAN_TEMPLATE_PATH = os.getenv("PLAN_TEMPLATE_PATH")
+# Minimum intent word overlap (Jaccard) for a template to be used
+TEMPLATE_MIN_SCORE = float(os.getenv("AGENT_TEMPLATE_MIN_SCORE", "0.6"))
+MAX_TEMPLATES = 256
+
+STOPWORDS = {"a", "an", "and", "the", "of", "for", "to", "in", "on", "about", "with", "by", "then", "those", "their"}
+NUMBER = re.compile(r"-?\d+(\.\d+)?")
+
+
+def entity_type(entity: str) -> str:
+    if NUMBER.fullmatch(entity):
+        return "number"
+    if " " in entity.strip():
+        return "phrase"
+    return "upper" if entity.isupper() else "word"
+
+
+def intent_words(intent: Optional[str]) -> set:
+    return {w for w in re.findall(r"[a-z0-9]+", (intent or "").lower()) if w not in STOPWORDS}
+
+
+def output_fields(result: Any) -> Dict[str, Any]:
+    """Top-level fields of the JSON objects in a tool result (MCP returns them as text)"""
+    fields = {}
+    for text in result if isinstance(result, list) else [result]:
+        try:
+            value = json.loads(text) if isinstance(text, str) else text
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            fields.update(value)
+    return fields
+
+
+def answer_text(final_answer: str) -> str:
+    text = final_answer.split(":", 1)[-1].strip()
+    return text[1:-1].strip() if text.startswith("[") and text.endswith("]") else text
+
+
+def parse_value(text: str) -> Any:
+    """A number or other JSON value written as text, else the text"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def is_output_value(value: Any) -> bool:
+    """Values worth tracing back to an earlier output; small constants (top_k=5) match by accident"""
+    if isinstance(value, bool) or value is None:
+        return False
+    return bool(value) if isinstance(value, (list, dict)) else len(json.dumps(value)) >= 4
+
+
+class PlanTemplate(BaseModel):
+    """Tool calls of a successful query with entities and earlier outputs replaced by references.
+
+    entity_pattern has one entry per perceived entity: "<type>" for an entity
+    the calls use (a slot), or the lowercased entity, which must recur.
+    Arguments refer to slots as {"$text": "... {e0} ..."} inside strings or
+    {"$slot": 0} for a number, and to a field of an earlier call's output as
+    {"$out": [step, call, field]}; answer is such a reference, or None if the
+    LLM has to write the final answer.
+    """
+    intent: str
+    tool_hint: Optional[str] = None
+    entity_pattern: List[str]
+    steps: List[List[Dict[str, Any]]]  # per step: [{"tool": name, "arguments": {...}}, ...]
+    answer: Optional[Dict[str, Any]] = None
+    uses: int = 0
+
+
+    def slots_bound(self) -> bool:
+        """Every slot of the pattern is referenced by the calls, so none is replayed as an old literal"""
+        slots = {i for i, pattern in enumerate(self.entity_pattern) if pattern.startswith("<")}
+        return slots <= slot_refs(self.steps)
+
+
+class TemplateMismatch(ValueError):
+    """The replayed calls produced something the template can't continue from"""
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def slot_refs(value: Any) -> set:
+    """Indices of the slots a templatized value refers to"""
+    if isinstance(value, dict):
+        if "$slot" in value:
+            return {value["$slot"]}
+        if "$text" in value:
+            return {int(i) for i in re.findall(r"\{e(\d+)\}", value["$text"])}
+        if "$out" in value:
+            return set()
+        return set().union(*(slot_refs(item) for item in value.values()))
+    if isinstance(value, list):
+        return set().union(*(slot_refs(item) for item in value))
+    return set()
+
+
+def literals(value: Any):
+    """The strings and numbers of a templatized value that are replayed as they are"""
+    if isinstance(value, dict):
+        if not {"$slot", "$text", "$out"} & value.keys():
+            for item in value.values():
+                yield from literals(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from literals(item)
+    elif isinstance(value, str) or is_number(value):
+        yield value
+
+
+def literal_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def templatize(value: Any, slots: Dict[int, str], outputs: List[tuple]) -> Any:
+    if is_number(value):
+        for i, entity in slots.items():
+            if entity_type(entity) == "number" and parse_value(entity) == value:
+                return {"$slot": i}
+    if isinstance(value, str):
+        text = value
+        for i, entity in sorted(slots.items(), key=lambda slot: -len(slot[1])):
+            text = text.replace(entity, f"{{e{i}}}")
+        if text != value:
+            return {"$text": text}
+    if is_output_value(value):
+        for ref, fields in outputs:
+            for field, out in fields.items():
+                if out == value:
+                    return {"$out": [*ref, field]}
+    if isinstance(value, dict):
+        return {key: templatize(item, slots, outputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [templatize(item, slots, outputs) for item in value]
+    return value
+
+
+def instantiate(value: Any, entities: List[str], outputs: Dict[tuple, Dict[str, Any]]) -> Any:
+    if isinstance(value, dict):
+        if "$out" in value:
+            step, call, field = value["$out"]
+            fields = outputs.get((step, call), {})
+            if field not in fields:
+                raise TemplateMismatch(f"step {step + 1} output has no '{field}'")
+            return fields[field]
+        if "$slot" in value:
+            return parse_value(entities[value["$slot"]])
+        if "$text" in value:
+            text = value["$text"]
+            for i, entity in enumerate(entities):
+                text = text.replace(f"{{e{i}}}", entity)
+            return text
+        return {key: instantiate(item, entities, outputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [instantiate(item, entities, outputs) for item in value]
+    return value
+
+
+class TemplateRun:
+    """One query replaying a template: plan lines step by step, fed the outputs they produce"""
+
+    def __init__(self, template: PlanTemplate, entities: List[str], score: float):
+        self.template = template
+        self.entities = entities
+        self.score = score
+        self.mismatch: Optional[str] = None  # why the replay was abandoned
+        self.outputs: Dict[tuple, Dict[str, Any]] = {}
+
+    def next_plan(self, step: int) -> Optional[str]:
+        """FUNCTION_CALL line(s) or FINAL_ANSWER for this step, or None when the LLM has to take over"""
+        if step < len(self.template.steps):
+            return "\n".join(
+                f"FUNCTION_CALL: {call['tool']}|{json.dumps(instantiate(call['arguments'], self.entities, self.outputs))}"
+                for call in self.template.steps[step])
+        if step == len(self.template.steps) and self.template.answer is not None:
+            return f"FINAL_ANSWER: [{instantiate(self.template.answer, self.entities, self.outputs)}]"
+        return None
+
+    def observe(self, step: int, results: list) -> None:
+        """Record a replayed step's outputs; raises TemplateMismatch if a call failed"""
+        for call, result in enumerate(results):
+            if result.error:
+                raise TemplateMismatch(f"{result.tool_name} failed: {result.error}")
+            self.outputs[(step, call)] = output_fields(result.result)
+
+
+class PlanTemplateCache:
+    """Plan templates recorded from answered queries, matched on perceived intent and entities.
+
+    With a path, templates are loaded at start and written back when one is added.
+    """
+
+    def __init__(self, path: Optional[str] = PLAN_TEMPLATE_PATH, min_score: float = TEMPLATE_MIN_SCORE,
+                 max_templates: int = MAX_TEMPLATES):
+        self.path = Path(path) if path else None
+        self.min_score = min_score
+        self.max_templates = max_templates
+        self.templates: List[PlanTemplate] = []
+        self.stats = Counter()  # lookups, hits, completed, mismatches, recorded, llm_calls_avoided
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            try:
+                self.templates = [PlanTemplate.model_validate(t) for t in json.loads(self.path.read_text())]
+            except (OSError, ValueError):
+                self.templates = []
+
+    def match(self, perception: PerceptionResult) -> Optional[TemplateRun]:
+        """A run of the best template for this perception, if one scores at least min_score"""
+        self.stats["lookups"] += 1
+        words = intent_words(perception.intent)
+        best = None
+        for template in self.templates:
+            if len(template.entity_pattern) != len(perception.entities):
+                continue
+            if template.tool_hint and perception.tool_hint and template.tool_hint != perception.tool_hint:
+                continue
+            if not all(entity_type(entity) == pattern[1:-1] if pattern.startswith("<") else entity.lower() == pattern
+                       for pattern, entity in zip(template.entity_pattern, perception.entities)):
+                continue
+            if not template.slots_bound():
+                continue  # e.g. recorded before numbers became slots: it would replay the old values
+            known = intent_words(template.intent)
+            score = len(words & known) / len(words | known) if words | known else 0.0
+            if score >= self.min_score and (best is None or score > best.score):
+                best = TemplateRun(template, perception.entities, score)
+        if best is not None:
+            self.stats["hits"] += 1
+            best.template.uses += 1
+        return best
+
+    def record(self, perception: PerceptionResult, steps: List[list], final_answer: str) -> Optional[PlanTemplate]:
+        """Template from a query answered with these steps (ToolCallResults per step); None if unusable"""
+        if not steps or not perception.intent or "unknown" in final_answer.lower():
+            return None
+        if any(result.error for results in steps for result in results):
+            return None
+        used = json.dumps([[result.arguments for result in results] for results in steps])
+        slots = {i: entity for i, entity in enumerate(perception.entities) if len(entity) > 1 and entity in used}
+        while True:
+            outputs = []
+            template_steps = []
+            for step, results in enumerate(steps):
+                template_steps.append([{"tool": r.tool_name, "arguments": templatize(r.arguments, slots, outputs)}
+                                       for r in results])
+                outputs += [((step, call), output_fields(r.result)) for call, r in enumerate(results)]
+            # An entity is a slot only if every place it appears is templatized (not 12 inside 12.5, say)
+            kept = {i: entity for i, entity in slots.items() if i in slot_refs(template_steps)
+                    and not any(entity in literal_text(value) for value in literals(template_steps))}
+            if kept == slots:
+                break
+            slots = kept
+        # A number from the query that is neither a slot nor a constant entity would be replayed for other numbers
+        query_numbers = {m.group(0) for m in NUMBER.finditer(perception.user_input)}
+        query_numbers -= {entity for i, entity in enumerate(perception.entities) if i not in slots}
+        if any({m.group(0) for m in NUMBER.finditer(literal_text(value))} & query_numbers
+               for value in literals(template_steps)):
+            return None
+        # Only an answer read straight from an output can be replayed; anything else needs the LLM
+        answer = templatize(parse_value(answer_text(final_answer)), {}, outputs)
+        template = PlanTemplate(
+            intent=perception.intent,
+            tool_hint=perception.tool_hint,
+            entity_pattern=[f"<{entity_type(e)}>" if i in slots else e.lower() for i, e in enumerate(perception.entities)],
+            steps=template_steps,
+            answer=answer if isinstance(answer, dict) and "$out" in answer else None,
+        )
+        with self._lock:
+            key = template.model_dump(include={"entity_pattern", "steps"})
+            self.templates = [t for t in self.templates if t.model_dump(include={"entity_pattern", "steps"}) != key]
+            self.templates.append(template)
+            del self.templates[:-self.max_templates]
+            self.stats["recorded"] += 1
+            if self.path:
+                self._save()
+        return template
+
+    def _save(self) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps([t.model_dump() for t in self.templates], indent=1))
+        tmp.replace(self.path)
+
+    def summary(self) -> str:
+        lookups = self.stats["lookups"]
+        rate = f"{self.stats['hits'] / lookups:.0%}" if lookups else "n/a"
+        return (f"Plan templates: {len(self.templates)} stored, {self.stats['hits']}/{lookups} queries matched "
+                f"({rate} hit rate), {self.stats['completed']} answered without planning, "
+                f"{self.stats['mismatches']} fell back to the LLM, {self.stats['llm_calls_avoided']} LLM calls avoided")
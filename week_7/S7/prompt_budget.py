@@ -0,0 +1,54 @@
+import math
+import os
+import re
+from typing import List, Tuple
+
+# Upper bound for a planning prompt, in estimated tokens; 0 disables trimming
+PROMPT_TOKEN_BUDGET = int(os.getenv("AGENT_PROMPT_TOKENS", "2000"))
+CHARS_PER_TOKEN = 4  # Gemini's rule of thumb for English text
+MIN_ITEM_TOKENS = 16  # a memory cut shorter than this is dropped instead
+TOOL_DESCRIPTION_CHARS = 120  # per tool once the tool list has to be compacted
+TRUNCATED = " …"
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count estimate, without a tokenizer round trip"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """text cut to about max_tokens, marked with an ellipsis if anything was removed"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - len(TRUNCATED))].rstrip() + TRUNCATED
+
+
+def fit_items(texts: List[str], max_tokens: int, min_tokens: int = MIN_ITEM_TOKENS) -> Tuple[List[str], int]:
+    """Fit texts, most relevant first, into max_tokens.
+
+    The least relevant are dropped until each remaining one can get
+    min_tokens. Short texts are then kept whole and the long ones share
+    what is left equally. Returns (kept texts, number truncated or dropped).
+    """
+    count = len(texts)
+    while count and max_tokens < count * min_tokens:
+        count -= 1
+    sizes = [estimate_tokens(text) for text in texts[:count]]
+    caps = [0] * count
+    remaining = max_tokens
+    for n, i in enumerate(sorted(range(count), key=sizes.__getitem__)):
+        caps[i] = min(sizes[i], remaining // (count - n))
+        remaining -= caps[i]
+    kept = [truncate_tokens(text, cap) for text, cap in zip(texts, caps)]
+    return kept, len(texts) - count + sum(cap < size for cap, size in zip(caps, sizes))
+
+
+def compact_tool_descriptions(tool_descriptions: str, max_chars: int = TOOL_DESCRIPTION_CHARS) -> str:
+    """One line per "- name: description" entry, cut to its first sentence and max_chars"""
+    entries = re.split(r"\n(?=- \w+:)", tool_descriptions.strip())
+    lines = []
+    for entry in entries:
+        first = re.split(r"(?<=[.!?])\s", " ".join(entry.split()), maxsplit=1)[0]
+        lines.append(first if len(first) <= max_chars else first[:max_chars - len(TRUNCATED)].rstrip() + TRUNCATED)
+    return "\n".join(lines)
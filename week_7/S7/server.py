@@ -30,7 +30,8 @@ def index_page():
             logger.error("Invalid request data: missing url or content")
             return jsonify({"success": False, "error": "Missing url or content"})
         
-        input_data = WebPageInput(url=data['url'], content=data['content'])
+        input_data = WebPageInput(url=data['url'], content=data['content'],
+                                  collection=data.get('collection', 'default'))
         result = action_handler.index_page(input_data)
         
         if not result.success:
@@ -56,7 +57,7 @@ def search():
         logger.info(f"Searching for: {query}")
         
         # Use action handler to search
-        input_data = SearchInput(query=query)
+        input_data = SearchInput(query=query, collection=data.get('collection', 'default'))
         result = action_handler.search_pages(input_data)
         
         # Filter results based on similarity threshold
@@ -114,7 +115,7 @@ def highlight():
 def list_pages():
     try:
         logger.info("Received request to list pages")
-        result = action_handler.list_indexed_pages()
+        result = action_handler.list_indexed_pages(request.args.get('collection', 'default'))
         return jsonify(result.model_dump())
     except Exception as e:
         logger.error(f"Error in list_pages: {str(e)}")
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+import requests
+
+import tracing
+from memory import EMBED_TIMEOUT, MemoryItem
+
+MEMORY_RETENTION = int(os.getenv("AGENT_MEMORY_RETENTION", "10000"))  # items kept across all sessions
+
+
+class SessionMemory:
+    """In-process working memory for the agent's tool outputs, kept apart from the web page index.
+
+    Items are rows of a NumPy matrix with per-session and per-type row lists
+    in append order, so session and type filters are exact. Adding an item
+    doesn't embed it: the rows a retrieve() has to rank are embedded then,
+    together with the query, in one batched request. When a session has no
+    more items than top_k they are returned newest first without any
+    embedding call.
+
+    Past retention items the oldest are forgotten, so a long-running runtime
+    (batch.py, the MCP server) doesn't grow without bound. Forgotten rows are
+    reclaimed once they outnumber the live ones.
+    """
+
+    def __init__(self, embedding_url="http://localhost:11434/api/embed", model_name="nomic-embed-text",
+                 embedding_dim=768, retention: int = MEMORY_RETENTION):
+        self.embedding_url = embedding_url  # Ollama's batch endpoint: {"input": [...]} -> {"embeddings": [...]}
+        self.model_name = model_name
+        self.embedding_dim = embedding_dim
+        self.retention = retention
+        self.items: List[Optional[MemoryItem]] = []  # by row; rows before self.start are forgotten
+        self.start = 0
+        self.compacted = 0  # rows reclaimed so far, to map rows a retrieve() read before a compaction
+        self.vectors = np.zeros((16, embedding_dim), dtype=np.float32)
+        self.embedded = np.zeros(16, dtype=bool)
+        self.by_session: Dict[Optional[str], Deque[int]] = {}
+        self.by_type: Dict[str, Deque[int]] = {}
+        self.embed_calls = 0
+        self.forgotten = 0
+        self.lock = threading.Lock()  # retrieve() runs in worker threads
+
+    def __len__(self) -> int:
+        return len(self.items) - self.start
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """One embedding request for all texts, as an (n, dim) float32 array"""
+        with tracing.span("memory.embed", model=self.model_name, texts=len(texts),
+                          text_chars=sum(len(t) for t in texts)):
+            response = requests.post(self.embedding_url, json={"model": self.model_name, "input": texts},
+                                     timeout=EMBED_TIMEOUT)
+            response.raise_for_status()
+            return np.array(response.json()["embeddings"], dtype=np.float32)
+
+    def add(self, item: MemoryItem) -> None:
+        """Append an item; it is embedded the first time a retrieve() needs to rank it"""
+        with self.lock:
+            row = len(self.items)
+            if row == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.embedded = np.concatenate([self.embedded, np.zeros_like(self.embedded)])
+            self.items.append(item)
+            self.by_session.setdefault(item.session_id, deque()).append(row)
+            self.by_type.setdefault(item.type, deque()).append(row)
+            while len(self) > self.retention:
+                self._forget_oldest()
+
+    def _forget_oldest(self) -> None:
+        # The oldest row overall is also the oldest in its session and type lists
+        item = self.items[self.start]
+        self.items[self.start] = None
+        for index, key in ((self.by_session, item.session_id), (self.by_type, item.type)):
+            rows = index[key]
+            rows.popleft()
+            if not rows:
+                del index[key]
+        self.start += 1
+        self.forgotten += 1
+        if self.start >= len(self):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Move the live rows to the front of the arrays, an O(live) copy paid once per `start` forgets"""
+        shift, end = self.start, len(self.items)
+        self.vectors[:end - shift] = self.vectors[shift:end]
+        self.embedded[:end - shift] = self.embedded[shift:end]
+        self.embedded[end - shift:end] = False
+        self.items = self.items[shift:]
+        for index in (self.by_session, self.by_type):
+            for key, rows in index.items():
+                index[key] = deque(row - shift for row in rows)
+        self.start = 0
+        self.compacted += shift
+
+    def candidates(self, type_filter: Optional[str] = None, tag_filter: Optional[List[str]] = None,
+                   session_filter: Optional[str] = None) -> List[int]:
+        """Rows passing the filters, oldest first"""
+        if session_filter is not None:
+            rows = self.by_session.get(session_filter, [])
+            if type_filter:
+                rows = [row for row in rows if self.items[row].type == type_filter]
+        elif type_filter:
+            rows = self.by_type.get(type_filter, [])
+        else:
+            rows = range(self.start, len(self.items))
+        if tag_filter:
+            rows = [row for row in rows if any(tag in self.items[row].tags for tag in tag_filter)]
+        return list(rows)
+
+    def retrieve(self, query: str, top_k: int = 3, type_filter: Optional[str] = None,
+                 tag_filter: Optional[List[str]] = None, session_filter: Optional[str] = None) -> List[MemoryItem]:
+        """The top_k filtered items most similar to query (newest first if no ranking is needed)"""
+        with self.lock:
+            rows = self.candidates(type_filter, tag_filter, session_filter)
+            if len(rows) <= top_k:
+                return [self.items[row] for row in reversed(rows)]
+            pending = [row for row in rows if not self.embedded[row]]
+            texts = [self.items[row].text for row in pending]
+            compacted = self.compacted
+
+        # Pending items and the query share one request
+        vectors = self.embed_batch(texts + [query])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        with self.lock:
+            self.embed_calls += 1
+            # Rows forgotten during the request are dropped, the rest moved by any compaction
+            shift = self.compacted - compacted
+            live = [i for i, row in enumerate(pending) if row - shift >= self.start]
+            self.vectors[[pending[i] - shift for i in live]] = vectors[live]
+            self.embedded[[pending[i] - shift for i in live]] = True
+            rows = [row - shift for row in rows if row - shift >= self.start]
+            scores = self.vectors[rows] @ vectors[-1]
+            best = np.argsort(-scores, kind="stable")[:top_k]
+            return [self.items[rows[i]] for i in best]
+
+    async def aretrieve(self, *args, **kwargs) -> List[MemoryItem]:
+        """retrieve() in a worker thread so the embedding request doesn't block the event loop"""
+        with tracing.span("memory.retrieve", size=len(self)) as span:
+            items = await asyncio.to_thread(self.retrieve, *args, **kwargs)
+            span.set(results=len(items))
+            return items
+
+    def memory_bytes(self) -> int:
+        return self.vectors.nbytes + sum(len(item.text) for item in self.items[self.start:])
+
+    def summary(self) -> str:
+        embedded = int(self.embedded[self.start:len(self.items)].sum())
+        return (f"Session memory: {len(self)} items in {len(self.by_session)} sessions, "
+                f"{embedded} embedded in {self.embed_calls} requests, {self.forgotten} forgotten")
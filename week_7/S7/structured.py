@@ -0,0 +1,103 @@
+import json
+import re
+from collections import Counter
+from typing import Callable, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+import llm
+
+# Optional: import log from agent if shared, else define locally
+try:
+    from agent import log
+except ImportError:
+    import datetime
+    def log(stage: str, msg: str):
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] [{stage}] {msg}")
+
+
+# (call site, outcome) -> count; outcome is "valid", "repaired" or "failed"
+PARSE_STATS = Counter()
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class StructuredOutputError(ValueError):
+    """The response did not match its schema, even after the repair call"""
+
+
+def record_parse(site: str, outcome: str) -> None:
+    PARSE_STATS[(site, outcome)] += 1
+
+
+def validate_json(raw: str, schema: Type[T], check: Optional[Callable[[T], None]] = None) -> T:
+    """Parse and validate in one pydantic-core pass, then run check (which raises ValueError).
+
+    A ```json fence or text around the object is tolerated.
+    """
+    try:
+        result = schema.model_validate_json(raw)
+    except ValidationError:
+        match = JSON_OBJECT.search(raw)
+        if not match or match.group(0) == raw.strip():
+            raise
+        result = schema.model_validate_json(match.group(0))
+    if check is not None:
+        check(result)
+    return result
+
+
+async def agenerate_structured(prompt: str, site: str, schema: Type[T], check: Optional[Callable[[T], None]] = None,
+                               use_cache: bool = True, cacheable: Optional[Callable[[T], bool]] = None) -> T:
+    """LLM response constrained to schema's JSON schema and validated against it.
+
+    A response that still fails validation gets one repair call, which sees
+    the error; if that fails too StructuredOutputError is raised. Only
+    replies that validate (and pass cacheable, if given) are cached, so
+    neither a rejected reply nor a failed repair sticks in the LLM cache.
+    """
+    config = {"response_mime_type": "application/json", "response_schema": schema}
+
+    def accept(raw: str) -> bool:
+        try:
+            result = validate_json(raw, schema, check)
+        except ValueError:
+            return False
+        return cacheable is None or cacheable(result)
+
+    raw = await llm.agenerate(prompt, site=site, config=config, use_cache=use_cache, accept=accept)
+    try:
+        result = validate_json(raw, schema, check)
+        record_parse(site, "valid")
+        return result
+    except ValueError as e:
+        error = e
+    log("structured", f"⚠️ {site} response failed validation, repairing: {error}")
+
+    repair_prompt = f"""{prompt}
+
+Your previous reply was:
+{raw}
+
+It was rejected: {error}
+Reply again with ONE JSON object matching this schema, fixing the problem:
+{json.dumps(schema.model_json_schema())}"""
+    raw = await llm.agenerate(repair_prompt, site=f"{site}_repair", config=config, use_cache=use_cache, accept=accept)
+    try:
+        result = validate_json(raw, schema, check)
+    except ValueError as e:
+        record_parse(site, "failed")
+        raise StructuredOutputError(f"{site} response invalid after repair: {e}") from e
+    record_parse(site, "repaired")
+    return result
+
+
+def summary() -> str:
+    sites = sorted({site for site, _ in PARSE_STATS})
+    if not sites:
+        return "Parsing: no LLM responses"
+    parts = [f"{site} {PARSE_STATS[(site, 'valid')]} valid / {PARSE_STATS[(site, 'repaired')]} repaired / "
+             f"{PARSE_STATS[(site, 'failed')]} failed" for site in sites]
+    return f"Parsing: {', '.join(parts)}"
@@ -0,0 +1,58 @@
+import json
+
+from action import ToolCallResult
+from perception import PerceptionResult
+from plan_templates import PlanTemplate, PlanTemplateCache
+
+
+def perceive(query: str, entities: list) -> PerceptionResult:
+    return PerceptionResult(user_input=query, intent="add two numbers", entities=entities, tool_hint="add")
+
+
+def add_result(a, b) -> ToolCallResult:
+    return ToolCallResult(tool_name="add", arguments={"input": {"a": a, "b": b}},
+                          result=[json.dumps({"result": a + b})], raw_response=None)
+
+
+def replay(run) -> tuple:
+    call = run.next_plan(0)
+    run.outputs[(0, 0)] = {"result": sum(json.loads(call.split("|", 1)[1])["input"].values())}
+    return call, run.next_plan(1)
+
+
+def test_numbers_from_the_query_are_slots():
+    cache = PlanTemplateCache(path=None)
+    template = cache.record(perceive("What is 1234 plus 5678?", ["1234", "5678"]), [[add_result(1234, 5678)]],
+                            "FINAL_ANSWER: [6912]")
+    assert template.entity_pattern == ["<number>", "<number>"]
+
+    call, answer = replay(cache.match(perceive("What is 1000 plus 2000?", ["1000", "2000"])))
+    assert call == 'FUNCTION_CALL: add|{"input": {"a": 1000, "b": 2000}}'
+    assert answer == "FINAL_ANSWER: [3000]"
+
+
+def test_numbers_in_lists_are_slots():
+    cache = PlanTemplateCache(path=None)
+    result = ToolCallResult(tool_name="sum", arguments={"numbers": [12, 30]}, result=[json.dumps({"result": 42})],
+                            raw_response=None)
+    cache.record(perceive("12 plus 30", ["12", "30"]), [[result]], "FINAL_ANSWER: [42]")
+
+    run = cache.match(perceive("100 plus 1000", ["100", "1000"]))
+    assert run.next_plan(0) == 'FUNCTION_CALL: sum|{"numbers": [100, 1000]}'
+
+
+def test_query_numbers_left_literal_are_not_recorded():
+    cache = PlanTemplateCache(path=None)
+    # Perception missed the numbers, so the call's arguments can't be tied to the query
+    assert cache.record(perceive("What is 1234 plus 5678?", ["sum"]), [[add_result(1234, 5678)]],
+                        "FINAL_ANSWER: [6912]") is None
+
+
+def test_templates_with_unbound_slots_are_not_replayed():
+    cache = PlanTemplateCache(path=None)
+    # As stored before numbers were slotted: the pattern has slots the calls never use
+    cache.templates.append(PlanTemplate(
+        intent="add two numbers", tool_hint="add", entity_pattern=["<number>", "<number>"],
+        steps=[[{"tool": "add", "arguments": {"input": {"a": 1234, "b": 5678}}}]],
+        answer={"$out": [0, 0, "result"]}))
+    assert cache.match(perceive("What is 1000 plus 2000?", ["1000", "2000"])) is None
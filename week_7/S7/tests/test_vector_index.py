@@ -0,0 +1,34 @@
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore
+from example3 import doc_filter_ids, vector_search
+from vector_index import MIN_TRAIN, index_kind, make_index, maybe_convert
+
+DIM = 32
+
+
+def flat_index(n: int) -> tuple[faiss.Index, np.ndarray]:
+    vectors = np.random.default_rng(0).standard_normal((n, DIM)).astype(np.float32)
+    index = make_index(DIM)
+    index.add(vectors)
+    return index, vectors
+
+
+def test_pq_waits_for_enough_training_vectors():
+    index, _ = flat_index(560)
+    assert index_kind(maybe_convert(index, "pq")) == "flat"
+
+
+def test_doc_filtered_search_on_a_converted_pq_index(tmp_path):
+    index, vectors = flat_index(MIN_TRAIN["pq"])
+    index = maybe_convert(index, "pq")
+    assert index_kind(index) == "pq"
+    metadata = ChunkStore(tmp_path)
+    metadata.extend({"doc": f"doc{i % 20}.pdf", "chunk": "text", "chunk_id": f"doc{i % 20}_{i // 20}"}
+                    for i in range(index.ntotal))
+
+    allowed = doc_filter_ids(metadata, ["doc3.pdf"])
+    ids = vector_search(index, vectors[3:4], 5, allowed)
+    assert len(ids) == 5 and set(ids) <= allowed
+    assert ids[0] == 3
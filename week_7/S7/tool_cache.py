@@ -0,0 +1,153 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+PURE = float("inf")  # same arguments, same result, forever
+
+# Tools whose results may be reused, with how long a result stays valid (seconds).
+# Tools not listed (index_status, list_collections, create_thumbnail, ...) are always called.
+TOOL_CACHE_TTL: Dict[str, float] = {
+    "add": PURE,
+    "sqrt": PURE,
+    "subtract": PURE,
+    "multiply": PURE,
+    "divide": PURE,
+    "power": PURE,
+    "cbrt": PURE,
+    "factorial": PURE,
+    "log": PURE,
+    "remainder": PURE,
+    "sin": PURE,
+    "cos": PURE,
+    "tan": PURE,
+    "mine": PURE,
+    "strings_to_chars_to_int": PURE,
+    "int_list_to_exponential_sum": PURE,
+    "fibonacci_numbers": PURE,
+    "evaluate_pipeline": PURE,
+    # Idempotent but the index changes as documents are added
+    "search_documents": 300,
+}
+
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "512"))
+# Set to a file path to keep results across agent runs
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH")
+TOOL_CACHE_SAVE_INTERVAL = float(os.getenv("TOOL_CACHE_SAVE_INTERVAL", "5"))  # seconds between writes of the file
+
+
+def canonical_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    return json.dumps([tool_name, arguments], sort_keys=True, separators=(",", ":"), default=str)
+
+
+def is_cacheable_output(out: Any) -> bool:
+    """False for outputs describing a transient state (errors, index still building) rather than a result"""
+    texts = out if isinstance(out, list) else [out]
+    for text in texts:
+        if isinstance(text, str) and (text.startswith(("ERROR", "INFO:")) or "[PARTIAL RESULTS" in text):
+            return False
+    return True
+
+
+class ToolResultCache:
+    """LRU of tool outputs keyed by (tool name, canonical arguments), honouring TOOL_CACHE_TTL.
+
+    With a path, entries are loaded at start and written back from a
+    background timer at most every save_interval seconds, and at exit, so
+    a store never waits for the file.
+    """
+
+    def __init__(self, max_entries: int = TOOL_CACHE_SIZE, path: Optional[str] = TOOL_CACHE_PATH,
+                 ttls: Dict[str, float] = TOOL_CACHE_TTL, save_interval: float = TOOL_CACHE_SAVE_INTERVAL):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.ttls = ttls
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, output)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the file at a time
+        self._dirty = False
+        self._timer = None
+        if self.path:
+            if self.path.exists():
+                self._load()
+            atexit.register(self.flush)
+
+    def cacheable(self, tool_name: str) -> bool:
+        return tool_name in self.ttls
+
+    def get(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[Any]:
+        if not self.cacheable(tool_name):
+            return None
+        key = canonical_key(tool_name, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, tool_name: str, arguments: Dict[str, Any], out: Any) -> bool:
+        if not self.cacheable(tool_name) or not is_cacheable_output(out):
+            return False
+        with self._lock:
+            key = canonical_key(tool_name, arguments)
+            self._entries[key] = (time.time() + self.ttls[tool_name], out)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._dirty = True
+                if self._timer is None:
+                    self._timer = threading.Timer(self.save_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        return True
+
+    def flush(self) -> None:
+        """Write the entries to path now if they changed since the last write"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                rows = [[key, expires_at, out] for key, (expires_at, out) in self._entries.items()]
+            try:
+                self._save(rows)
+            except OSError:
+                self._dirty = True
+                raise
+
+    def _load(self) -> None:
+        now = time.time()
+        try:
+            rows = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        for key, expires_at, out in rows[-self.max_entries:]:
+            if expires_at >= now:
+                self._entries[key] = (expires_at, out)
+
+    def _save(self, rows: list) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(rows))
+        tmp.replace(self.path)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = f"{self.hits / total:.0%}" if total else "n/a"
+        return f"Tool cache: {self.hits} hit / {self.misses} miss ({rate} hit rate), {len(self._entries)} entries"
@@ -0,0 +1,115 @@
+"""Per-stage latency from the spans the agent writes to traces.jsonl when run with AGENT_TRACE=1.
+
+Every stage is listed with its count, p50, p95 and max duration. LLM calls
+are also broken down by call site and tool calls by tool, with the share
+answered from cache.
+
+Rotated files (traces.jsonl.1, .2, ...) are read too, oldest first.
+
+    python trace_report.py                      # every query in traces.jsonl and its backups
+    python trace_report.py --last 20            # the 20 most recent queries
+    python trace_report.py --trace other.jsonl --stage llm
+"""
+import argparse
+import json
+import math
+from collections import defaultdict
+from pathlib import Path
+
+from tracing import TRACE_PATH
+
+# Spans broken down by one of their attributes, e.g. "llm[perception]"
+BREAKDOWN = {"llm": "site", "tool": "tool"}
+
+
+def trace_files(path: Path) -> list[Path]:
+    """The trace file's rotated backups (path.2, path.1, ...) oldest first, then the file itself"""
+    backups = [p for p in path.parent.glob(path.name + ".*") if p.suffix[1:].isdigit()]
+    files = sorted(backups, key=lambda p: -int(p.suffix[1:]))
+    return files + [path] if path.exists() else files
+
+
+def load_spans(path: Path, last: int | None = None) -> list[dict]:
+    spans = []
+    for file in trace_files(path):
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue  # a line cut short by a crash
+    if last:
+        # Spans of a trace are written as they end, the root last
+        trace_ids = list(dict.fromkeys(s["trace_id"] for s in spans if s["parent_id"] is None))[-last:]
+        keep = set(trace_ids)
+        spans = [s for s in spans if s["trace_id"] in keep]
+    return spans
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def stage_labels(span: dict) -> list[str]:
+    labels = [span["name"]]
+    key = BREAKDOWN.get(span["name"])
+    if key and key in span["attributes"]:
+        labels.append(f"{span['name']}[{span['attributes'][key]}]")
+    return labels
+
+
+def summarize(spans: list[dict]) -> dict[str, dict]:
+    durations = defaultdict(list)
+    cache = defaultdict(lambda: [0, 0])  # label -> [hits, lookups]
+    errors = defaultdict(int)
+    for span in spans:
+        for label in stage_labels(span):
+            durations[label].append(span["duration_ms"])
+            if span["status"] == "error":
+                errors[label] += 1
+            if "cache_hit" in span["attributes"]:
+                cache[label][0] += bool(span["attributes"]["cache_hit"])
+                cache[label][1] += 1
+    return {
+        label: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": max(values),
+            "errors": errors[label],
+            "cache_hit_rate": cache[label][0] / cache[label][1] if cache[label][1] else None,
+        }
+        for label, values in sorted(durations.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", type=Path, default=TRACE_PATH, help="JSONL file written by tracing.py")
+    parser.add_argument("--last", type=int, help="only the N most recent queries")
+    parser.add_argument("--stage", help="only stages whose name starts with this")
+    args = parser.parse_args()
+
+    if not trace_files(args.trace):
+        parser.exit(1, f"No trace file at {args.trace}; run the agent first\n")
+    spans = load_spans(args.trace, args.last)
+    queries = sum(1 for s in spans if s["parent_id"] is None)
+    rotated = len(trace_files(args.trace)) - args.trace.exists()
+    print(f"{len(spans)} spans from {queries} queries in {args.trace}"
+          f"{f' and {rotated} rotated files' if rotated else ''}\n")
+    print(f"{'stage':<32}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'errors':>8}{'cached':>8}")
+    for label, row in summarize(spans).items():
+        if args.stage and not label.startswith(args.stage):
+            continue
+        cached = f"{row['cache_hit_rate']:.0%}" if row["cache_hit_rate"] is not None else "-"
+        print(f"{label:<32}{row['count']:>7}{row['p50']:>11.1f}{row['p95']:>11.1f}{row['max']:>11.1f}"
+              f"{row['errors']:>8}{cached:>8}")
+
+
+if __name__ == "__main__":
+    main()
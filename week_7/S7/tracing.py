@@ -0,0 +1,116 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Dict, Iterator, Optional, TypeVar
+
+from log_writer import JSONLWriter
+
+# One JSON object per finished span; summarize with trace_report.py
+TRACE_PATH = Path(os.getenv("AGENT_TRACE_PATH", Path(__file__).parent / "traces.jsonl"))
+TRACING_ENABLED = os.getenv("AGENT_TRACE", "0") == "1"  # opt-in
+# Past this size traces.jsonl is renamed to traces.jsonl.1 (and .1 to .2)
+TRACE_MAX_BYTES = int(float(os.getenv("AGENT_TRACE_MAX_MB", "20")) * 2**20)
+TRACE_BACKUPS = 2
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_writer = None
+_writer_lock = threading.Lock()
+T = TypeVar("T")
+
+
+class Span:
+    """A timed stage of a query. Spans started while it is open become its children.
+
+    Ids follow the OTLP sizes (16-byte trace id, 8-byte span id, hex encoded).
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _get_writer() -> JSONLWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = JSONLWriter(max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS)
+            atexit.register(_writer.close)
+        return _writer
+
+
+def export(span: Span, path: Path = None) -> None:
+    """Queue the span for the trace file; it is written on the writer's thread, off the event loop"""
+    _get_writer().write(path or TRACE_PATH, span.to_dict())
+
+
+def flush() -> None:
+    """Wait until every exported span is in the trace file, e.g. before reading it back"""
+    if _writer is not None:
+        _writer.flush()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a child of the current span (or as a new trace) and export it on exit.
+
+    The current span lives in a ContextVar, so it follows asyncio tasks and
+    asyncio.to_thread workers started inside the block.
+    """
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        current.end(error)
+        if TRACING_ENABLED:
+            try:
+                export(current)
+            except ValueError as e:  # the writer was closed at interpreter exit
+                print(f"[trace] Could not write span '{name}': {e}")
+
+
+async def traced(name: str, awaitable: Awaitable[T], **attributes: Any) -> T:
+    """Await inside a span, e.g. for one of the coroutines passed to asyncio.gather"""
+    with span(name, **attributes):
+        return await awaitable
@@ -0,0 +1,92 @@
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Bytes per 768-dim vector: flat 3072, fp16 1536, sq8 768, pq 96
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq")
+# Vectors needed before a trained index is built; until then the index stays flat.
+# PQ trains 256 centroids per sub-quantizer and FAISS wants 39 points per centroid.
+MIN_TRAIN = {"flat": 0, "fp16": 0, "sq8": 256, "pq": 39 * 256}
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest M dividing dim with at least 8 dims per sub-quantizer"""
+    for m in range(max(dim // 8, 1), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def make_index(dim: int, kind: str = "flat") -> faiss.Index:
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    if kind == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    if kind == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    if kind == "pq":
+        return faiss.IndexPQ(dim, _pq_subquantizers(dim), 8)
+    raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+
+def index_kind(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return type(index).__name__
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """IndexPQ.search rejects SearchParameters with an id selector; the others filter during the scan"""
+    return index_kind(index) != "pq"
+
+
+def convert_index(index: faiss.Index, kind: str) -> faiss.Index:
+    """Re-encode every vector of index into a new index of the given kind, keeping ids"""
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    target = make_index(index.d, kind)
+    if not target.is_trained:
+        target.train(vectors)
+    if len(vectors):
+        target.add(vectors)
+    return target
+
+
+def maybe_convert(index: faiss.Index, kind: str) -> faiss.Index:
+    """Switch a flat index to the configured storage once it has enough vectors to train on.
+
+    Only flat indexes are converted automatically; lossy indexes are left as they are.
+    """
+    if index is None or kind == "flat" or index_kind(index) != "flat":
+        return index
+    if index.ntotal < MIN_TRAIN[kind] or index.ntotal == 0:
+        return index
+    return convert_index(index, kind)
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Approximate resident size of the stored vectors"""
+    if isinstance(index, faiss.IndexFlatCodes):
+        return index.ntotal * index.code_size
+    return index.ntotal * index.d * 4
+
+
+if __name__ == "__main__":
+    # Migrate a float32 index in place: python vector_index.py faiss_index/index.bin sq8
+    if len(sys.argv) != 3 or sys.argv[2] not in INDEX_TYPES:
+        raise SystemExit(f"usage: python vector_index.py <index.bin> <{'|'.join(INDEX_TYPES)}>")
+    path, kind = Path(sys.argv[1]), sys.argv[2]
+    t0 = time.perf_counter()
+    source = faiss.read_index(str(path))
+    migrated = convert_index(source, kind)
+    backup = path.with_name(path.name + f".{index_kind(source)}.bak")
+    path.replace(backup)
+    faiss.write_index(migrated, str(path))
+    print(f"Migrated {migrated.ntotal} vectors {index_kind(source)} -> {kind} in {time.perf_counter() - t0:.2f}s: "
+          f"{index_bytes(source) / 2**20:.1f} MiB -> {index_bytes(migrated) / 2**20:.1f} MiB (backup: {backup.name})")